@@ -1,26 +1,34 @@
 import streamlit as st
-import sqlite3
-import urllib.request
 import os
-import sqlite3
-import urllib.request
+import sys
 from pathlib import Path
-from sqlalchemy.exc import OperationalError
-from sqlalchemy import create_engine, text
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain import hub
-import tempfile
-from peft import LoraConfig, get_peft_model
-import torch
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_groq import ChatGroq
-from langchain.agents.agent_types import AgentType
-
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from resource_cache import DatabaseResources, resource_cache
+from acquisition import AcquisitionError, database_store
+from remote_db import open_remote
+from column_profiles import column_profiler
+from tool_cache import ToolMemo, tool_session
+from model_router import FAST_MODEL, ROUTER_MODE, STRONG_MODEL, ModelRouter
+from guarded_query import GuardedSQLDatabase
+from engine import get_engine
+from db_version import database_path
+from prompt_store import get_agent_prompt, get_template_text
+from schema_index import schema_context
+from table_stats import get_table_stats
+from streaming import AgentCancelled, stream_agent
+from answer_cache import answer_cache
+from result_pages import (
+    ResultUnavailable, count_rows, export_csv, export_parquet, fetch_page, final_query,
+    is_stale, page_frame, parquet_available, result_reference,
+)
+from instrumentation import trace_question
+
+SAMPLE_DATABASE_URL = "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite"
+# sha256 esperado de la base de ejemplo; sin definir, se fija el de la primera descarga verificada
+SAMPLE_DATABASE_SHA256 = os.getenv("SAMPLE_DATABASE_SHA256")
+# Mensajes del historial que se dibujan en cada rerun; los anteriores quedan detras de un boton
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
 
 
 st.set_page_config(page_title="Asistente para base de datos", page_icon="🧠", layout="wide")
@@ -32,64 +40,53 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "agent" not in st.session_state:
     st.session_state.agent = None
+if "db_key" not in st.session_state:
+    st.session_state.db_key = None
+if "tool_memo" not in st.session_state:
+    # Resultados de list_tables/schema/query_checker de este chat
+    st.session_state.tool_memo = ToolMemo()
+if "show_full_history" not in st.session_state:
+    st.session_state.show_full_history = False
 
 def load_database(db_path):
     try:
-        engine = create_engine(f'sqlite:///{db_path}')
-        db = SQLDatabase(engine)
+        engine = get_engine(db_path)
+        db = GuardedSQLDatabase(engine)
         
 
         tables = db.get_usable_table_names()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        table_counts = {}
-        for table in tables[:5]: 
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                table_counts[table] = count
-            except sqlite3.Error:
-                table_counts[table] = "Error"
-        conn.close()
+        # Estimaciones inmediatas; los COUNT(*) exactos corren en segundo plano
+        stats = get_table_stats(db_path, tables)
+        # Perfiles de columnas en segundo plano para el prompt y sql_db_column_values
+        column_profiler.profiles(db)
         
-        return db, tables, table_counts
+        return db, tables, stats
     except Exception as e:
         st.error(f"Error al cargar la base de datos: {str(e)}")
-        return None, [], {}
+        return None, [], None
     
 def create_system_message(db, custom_instructions=""):
     """Crea mensaje del sistema adaptado a la base de datos del usuario"""
 
     tables = db.get_usable_table_names()
-    table_info = []
+    # Los esquemas se eligen por pregunta (schema_index) y entran en {schema_context}
     
-    for table in tables[:4]:  # tablas para el prompt
-        try:
-            table_schema = db.get_table_info([table])
-            table_info.append(f"Tabla {table}:\n{table_schema}")
-        except:
-            table_info.append(f"Tabla {table}: (esquema no disponible)")
-    
-    schema_info = "\n\n".join(table_info)
-    
-    base_prompt = hub.pull('langchain-ai/sql-agent-system-prompt')
+    base_prompt = get_template_text('langchain-ai/sql-agent-system-prompt')
     
     enhanced_prompt = f"""
-{base_prompt.messages[0].prompt.template}
+{base_prompt}
 
 INFORMACIÓN ESPECÍFICA DE LA BASE DE DATOS:
 Dialecto: SQLite
 Tablas disponibles: {', '.join(tables)}
 
-ESQUEMAS DE TABLAS:
-{schema_info}
-
 INSTRUCCIONES ADICIONALES:
 - Siempre usa LIMIT para consultas exploratorias
 - Verifica la existencia de columnas antes de usarlas
 - Usa nombres de tablas exactos (case-sensitive)
 - Para consultas complejas, dividelas en pasos
-- Usa indices donde haga sentido
+- Usa indices donde haga sentido (sql_db_plan muestra si la consulta los usa)
+- Para saber que valores tiene una columna usa sql_db_column_values en lugar de SELECT DISTINCT
 - Selecciona solo las columnas necesarias
 - Prefieres EXISTS sobre IN en subconsultas
 - 
@@ -105,19 +102,142 @@ def build_sql_agent(db, custom_instructions=""):
     if not groq_api_key:
         st.error("No se encontró la clave GROQ_API_KEY. Configúrala en tu entorno o en st.secrets.")
         return None
-    llm = ChatGroq(
-        temperature=0,
-        model_name="deepseek-r1-distill-llama-70b",
-        groq_api_key=groq_api_key
-    )
     system_message = create_system_message(db, custom_instructions)
-    prompt_template = hub.pull('langchain-ai/react-agent-template')
-    prompt = prompt_template.partial(instructions=system_message)
-    return create_sql_agent(
-        llm=llm,
-        db=db,
-        prompt=prompt,
-    )
+    prompt = get_agent_prompt(system_message)
+
+    # Importacion diferida: el stack del agente y el cliente de Groq solo hacen falta con una base cargada
+    from langchain_community.agent_toolkits import create_sql_agent
+    from langchain_groq import ChatGroq
+    from agent_stack import ColumnValuesTool, MemoizedSQLDatabaseToolkit, QueryPlanTool
+
+    def build(model_name):
+        llm = ChatGroq(
+            temperature=0,
+            model_name=model_name,
+            groq_api_key=groq_api_key
+        )
+        return create_sql_agent(
+            llm=llm,
+            toolkit=MemoizedSQLDatabaseToolkit(db=db, llm=llm),
+            prompt=prompt,
+            extra_tools=[QueryPlanTool(db=db), ColumnValuesTool(db=db)],
+            # El router usa los pasos para decidir si escalar; la cache de respuestas, para el SQL final
+            agent_executor_kwargs={"return_intermediate_steps": True},
+        )
+
+    if ROUTER_MODE == "strong":
+        return build(STRONG_MODEL)
+    # Preguntas simples al modelo rapido; el grande para el resto o si el rapido falla
+    return ModelRouter(build(FAST_MODEL), build(STRONG_MODEL), db)
+
+def load_resources(db_path, owns_file=True):
+    """Carga la base de datos y la empaqueta para la cache de recursos"""
+    db, tables, stats = load_database(db_path)
+    if not db:
+        if owns_file:
+            os.remove(db_path)
+        return None
+    return DatabaseResources(db_path, db, tables, stats, owns_file=owns_file)
+
+def table_counts_panel(stats):
+    """Conteos de registros; se refresca solo mientras quedan COUNT(*) pendientes"""
+    def render():
+        st.write("**Conteo de registros:**")
+        for table in stats.tables:
+            st.write(f"- {table}: {stats.describe(table)}")
+
+    st.fragment(render, run_every=None if stats.done else 1)()
+
+def timing_panel(trace):
+    """Desglose de tiempos y tokens de la ultima respuesta en el sidebar"""
+    data = trace.to_dict()
+    breakdown = data["breakdown"]
+    with st.sidebar.expander("⏱️ Tiempos de la ultima respuesta", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total", f"{breakdown['total']:.2f}s")
+        col2.metric("LLM", f"{breakdown['llm']:.2f}s")
+        col3.metric("SQL", f"{breakdown['sql']:.3f}s")
+        ttfts = [c["ttft"] for c in data["llm_calls"] if c["ttft"] is not None]
+        st.write(f"**Iteraciones ReAct:** {data['iterations']}")
+        if data["route"]:
+            route = data["route"]
+            escalated = f", escalado: {route['failure']}" if "escalated_from" in route else ""
+            st.write(f"**Modelo:** {route['tier']} ({route['reason']}{escalated})")
+        st.write(f"**Llamadas al LLM:** {len(data['llm_calls'])}"
+                 + (f" (primer token en {ttfts[0]:.2f}s)" if ttfts else ""))
+        st.write(f"**Tokens:** {data['prompt_tokens']} prompt / {data['completion_tokens']} respuesta")
+        for name, counts in data["cache"].items():
+            st.write(f"**Cache {name}:** {counts['hit']} aciertos / {counts['miss']} fallos")
+        for item in data["sql"]:
+            origin = "cache" if item["cached"] else f"{item['seconds']:.3f}s, {item['rows']} filas"
+            st.code(item["sql"], language="sql")
+            st.caption(origin + (" (truncado)" if item["truncated"] else ""))
+
+
+def agent_inputs(prompt):
+    # Solo el camino del agente usa los esquemas: los aciertos de cache y plantillas no pagan el BM25
+    return {"input": prompt, "schema_context": schema_context(st.session_state.db, prompt)}
+
+
+def result_panel(reference, key, expanded):
+    """Filas del resultado de una respuesta, paginadas desde la base y con exportacion.
+
+    El mensaje solo guarda la referencia (SQL y huella); cada pagina se lee al
+    mostrarla. Es un fragmento: cambiar de pagina no vuelve a dibujar el chat.
+    Los resultados viejos no consultan la base hasta que se piden.
+    """
+    # Misma normalizacion que result_reference: una ruta con symlinks no coincide con su abspath
+    if st.session_state.get("db") is None or reference["path"] != database_path(st.session_state.db):
+        return
+
+    def set_page(delta):
+        st.session_state[f"page_{key}"] = max(st.session_state.get(f"page_{key}", 0) + delta, 0)
+
+    def render():
+        if not expanded and not st.toggle("📋 Ver filas", key=f"rows_{key}"):
+            return
+        db = st.session_state.db
+        page_number = st.session_state.get(f"page_{key}", 0)
+        try:
+            page = fetch_page(db, reference, page_number)
+        except ResultUnavailable as e:
+            st.caption(f"No se pudieron leer las filas: {e}")
+            return
+        if not page["rows"] and page_number == 0:
+            return
+        if is_stale(reference):
+            st.caption("⚠️ Los datos cambiaron desde esta respuesta")
+        st.dataframe(page_frame(page), hide_index=True, use_container_width=True)
+
+        total = count_rows(db, reference)
+        first = page["offset"] + 1
+        last = page["offset"] + len(page["rows"])
+        col1, col2, col3 = st.columns([1, 1, 4])
+        col1.button("◀", key=f"prev_{key}", disabled=page_number == 0, on_click=set_page, args=(-1,))
+        col2.button("▶", key=f"next_{key}", disabled=not page["more"], on_click=set_page, args=(1,))
+        col3.caption(f"Filas {first}-{last}" + (f" de {total}" if total is not None else ""))
+
+        formats = ["CSV", "Parquet"] if parquet_available() else ["CSV"]
+        col1, col2 = st.columns([1, 3])
+        export_format = col1.selectbox("Formato", formats, key=f"format_{key}", label_visibility="collapsed")
+        # El archivo se genera solo al pedirlo: no viaja al navegador en cada rerun
+        if col2.button("⬇️ Exportar", key=f"export_{key}"):
+            try:
+                if export_format == "CSV":
+                    data, truncated = export_csv(db, reference)
+                    mime = "text/csv"
+                else:
+                    data, truncated = export_parquet(db, reference)
+                    mime = "application/vnd.apache.parquet"
+            except ResultUnavailable as e:
+                st.caption(f"No se pudo exportar: {e}")
+                return
+            st.download_button(f"Descargar {export_format}", data, file_name=f"resultado_{key}.{export_format.lower()}",
+                               mime=mime, key=f"download_{key}")
+            if truncated:
+                st.caption("Exportacion parcial: se alcanzo el tope de filas o bytes")
+
+    st.fragment(render)()
 
 
 st.title("🧠 Consultas de base de datos")
@@ -130,64 +250,90 @@ with st.sidebar:
                       ["Subir archivo", "Ingresar URL", "Base de ejemplo (Chinook)"])
     
     db_path = None
+    db_key = None
     
-    if option == "Subir archivo":
-        uploaded_file = st.file_uploader("Seleccione archivo SQLite", type=["sqlite", "db", "sqlite3"])
-        if uploaded_file:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmpfile:
-                tmpfile.write(uploaded_file.getvalue())
-                db_path = tmpfile.name
-    
-    elif option == "Ingresar URL":
-        url = st.text_input("URL de la base de datos SQLite:")
-        if url:
-            if st.button("Descargar base de datos"):
-                with st.spinner("Descargando..."):
-                    try:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmpfile:
-                            urllib.request.urlretrieve(url, tmpfile.name)
-                            db_path = tmpfile.name
-                    except Exception as e:
-                        st.error(f"Error en descarga: {str(e)}")
-    
-    elif option == "Base de ejemplo (Chinook)":
-        if st.button("Cargar base de ejemplo"):
-            url = "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite"
-            with st.spinner("Descargando base de ejemplo..."):
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmpfile:
-                        urllib.request.urlretrieve(url, tmpfile.name)
-                        db_path = tmpfile.name
-                except Exception as e:
-                    st.error(f"Error en descarga: {str(e)}")
-    
- 
-    if db_path and os.path.exists(db_path):
+    try:
+        if option == "Subir archivo":
+            uploaded_file = st.file_uploader("Seleccione archivo SQLite", type=["sqlite", "db", "sqlite3"])
+            if uploaded_file:
+                # Se guarda una sola vez por archivo subido, leyendolo por bloques
+                upload_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+                stored = st.session_state.setdefault("uploads", {}).get(upload_id)
+                if stored is None or not os.path.exists(stored[1]):
+                    uploaded_file.seek(0)
+                    stored = database_store.add_stream(uploaded_file)
+                    st.session_state.uploads[upload_id] = stored
+                db_key, db_path = stored
+        
+        elif option == "Ingresar URL":
+            url = st.text_input("URL de la base de datos SQLite:")
+            remote = st.toggle("Acceso remoto (sin descarga completa)", value=False,
+                               help="Lee solo las paginas que tocan las consultas con peticiones HTTP Range")
+            if url:
+                if st.button("Abrir base remota" if remote else "Descargar base de datos"):
+                    if remote:
+                        with st.spinner("Conectando..."):
+                            db_path = open_remote(url)
+                            db_key = f"remote:{url}"
+                    else:
+                        with st.spinner("Descargando..."):
+                            db_key, db_path = database_store.fetch(url)
+        
+        elif option == "Base de ejemplo (Chinook)":
+            if st.button("Cargar base de ejemplo"):
+                with st.spinner("Descargando base de ejemplo..."):
+                    db_key, db_path = database_store.fetch(SAMPLE_DATABASE_URL, SAMPLE_DATABASE_SHA256, pin=True)
+    except AcquisitionError as e:
+        st.error(str(e))
+
+    if db_key:
         with st.spinner("Cargando base de datos..."):
-            db, tables, table_counts = load_database(db_path)
-            
-            if db:
-                st.session_state.db = db
-                st.session_state.db_path = db_path
-                st.session_state.db_loaded = True
-                
-                with st.spinner("Creando agente SQL..."):
-                    st.session_state.agent = build_sql_agent(db)
-                
-                st.success("¡Base de datos cargada exitosamente!")
-                
-                st.subheader("📊 Metadatos de la base de datos")
-                st.write(f"**Tablas:** {', '.join(tables)}")
-
-                st.write("**Conteo de registros:**")
-                for table, count in table_counts.items():
-                    st.write(f"- {table}: {count} registros")
+            # Los archivos son del almacen local: la cache de recursos no los borra
+            resources = resource_cache.get_or_load(db_key, lambda: load_resources(str(db_path), owns_file=False))
+
+        if resources:
+            with st.spinner("Creando agente SQL..."):
+                agent = resource_cache.get_agent(
+                    db_key, (ROUTER_MODE, FAST_MODEL, STRONG_MODEL, ""), lambda entry: build_sql_agent(entry.db)
+                )
+
+            st.session_state.db = resources.db
+            st.session_state.db_path = resources.path
+            st.session_state.db_key = db_key
+            st.session_state.agent = agent
+            st.session_state.db_loaded = True
+
+            st.success("¡Base de datos cargada exitosamente!")
+
+            st.subheader("📊 Metadatos de la base de datos")
+            st.write(f"**Tablas:** {', '.join(resources.tables)}")
+
+            table_counts_panel(resources.stats)
+
+    st.divider()
+    live_reasoning = st.toggle("Mostrar razonamiento en vivo", value=True)
+
+# Si la cache libero la base de datos de esta sesion, hay que volver a cargarla
+if st.session_state.db_loaded and st.session_state.db_key not in resource_cache:
+    st.session_state.db_loaded = False
+    st.session_state.agent = None
+    st.warning("La base de datos fue liberada por inactividad, vuelva a cargarla")
 
 #Chat principal
 if st.session_state.db_loaded:
-    for message in st.session_state.messages:
+    messages = st.session_state.messages
+    start = 0 if st.session_state.show_full_history else max(len(messages) - CHAT_HISTORY_WINDOW, 0)
+    if start and st.button(f"Mostrar {start} mensajes anteriores"):
+        st.session_state.show_full_history = True
+        st.rerun()
+    # Solo el ultimo resultado se muestra abierto; los demas consultan la base si se piden
+    latest = max((i for i, m in enumerate(messages) if m.get("result")), default=None)
+    for i in range(start, len(messages)):
+        message = messages[i]
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            if message.get("result"):
+                result_panel(message["result"], i, expanded=i == latest)
 
     if prompt := st.chat_input("Haz una pregunta sobre la base de datos..."):
 
@@ -196,17 +342,67 @@ if st.session_state.db_loaded:
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        with st.chat_message("assistant"):
-            with st.spinner("Pensando..."):
-                try:
-                    response = st.session_state.agent.invoke({"input": prompt})
-                    answer = response["output"]
-                except Exception as e:
-                    answer = f"⚠️ Error: {str(e)}"
-                
-                st.markdown(answer)
-
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+        # Importacion diferida: las plantillas no hacen falta para dibujar la pagina
+        from fast_path import answer_from_template, learn_template
+
+        with trace_question(prompt) as trace, tool_session(st.session_state.tool_memo):
+            cached = answer_cache.lookup_answer(st.session_state.db, prompt)
+            fast = None if cached else answer_from_template(st.session_state.db, prompt)
+            reference = None
+            with st.chat_message("assistant"):
+                if cached:
+                    answer = cached["output"]
+                    reference = result_reference(st.session_state.db, cached["sql"])
+                    st.markdown(answer)
+                    st.caption("⚡ Respuesta desde cache")
+                elif fast:
+                    answer = fast["output"]
+                    reference = result_reference(st.session_state.db, fast["sql"], fast["params"])
+                    st.markdown(answer)
+                    st.caption("⚡ Respuesta desde plantilla, sin LLM")
+                elif live_reasoning:
+                    answer = None
+                    stream = stream_agent(st.session_state.agent, agent_inputs(prompt), callbacks=[trace.handler])
+                    # Pulsar el boton provoca un rerun que corta el stream y cancela el agente
+                    st.button("⏹️ Detener", key=f"stop_{len(st.session_state.messages)}")
+                    try:
+                        with st.expander("Razonamiento", expanded=True):
+                            st.write_stream(stream.text())
+                        answer = stream.output
+                        answer_cache.store_answer(st.session_state.db, prompt, stream.result)
+                        learn_template(st.session_state.db, prompt, stream.result)
+                        reference = result_reference(st.session_state.db, final_query(stream.result))
+                    except AgentCancelled:
+                        answer = "⏹️ Consulta cancelada"
+                    except Exception as e:
+                        answer = f"⚠️ Error: {str(e)}"
+                    finally:
+                        stream.cancel()
+                        if answer is None:
+                            st.session_state.messages.append({"role": "assistant", "content": "⏹️ Consulta cancelada"})
+
+                    st.markdown(answer)
+                else:
+                    with st.spinner("Pensando..."):
+                        try:
+                            response = st.session_state.agent.invoke(agent_inputs(prompt), config={"callbacks": [trace.handler]})
+                            answer = response["output"]
+                            answer_cache.store_answer(st.session_state.db, prompt, response)
+                            learn_template(st.session_state.db, prompt, response)
+                            reference = result_reference(st.session_state.db, final_query(response))
+                        except Exception as e:
+                            answer = f"⚠️ Error: {str(e)}"
+                    
+                        st.markdown(answer)
+
+                if reference:
+                    result_panel(reference, len(st.session_state.messages), expanded=True)
+
+        st.session_state.last_trace = trace
+        st.session_state.messages.append({"role": "assistant", "content": answer, "result": reference})
+
+    if st.session_state.get("last_trace"):
+        timing_panel(st.session_state.last_trace)
 else:
     st.info("Por favor carga una base de datos SQLite desde el panel lateral")
 
@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant"))
+STORE_DIR = CACHE_DIR / "databases"
+MAX_STORE_BYTES = int(os.getenv("DATABASE_STORE_MAX_BYTES", str(20 * 1024 ** 3)))
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_TIMEOUT = 60
+# Un parcial mas viejo que esto no se retoma: se descarga de cero
+PARTIAL_MAX_AGE = 24 * 3600
+# PRAGMA quick_check lee todo el archivo; por encima de este tamaño solo se revisa la cabecera
+QUICK_CHECK_MAX_BYTES = int(os.getenv("DATABASE_QUICK_CHECK_MAX_BYTES", str(2 * 1024 ** 3)))
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+class AcquisitionError(Exception):
+    pass
+
+
+def validate_sqlite(path):
+    """Comprueba la cabecera de SQLite antes de abrir un engine sobre el archivo"""
+    with open(path, "rb") as f:
+        header = f.read(len(SQLITE_HEADER))
+    if header != SQLITE_HEADER:
+        raise AcquisitionError(f"El archivo '{os.path.basename(path)}' no es una base de datos SQLite")
+
+
+def check_integrity(path, quick_check_max_bytes=QUICK_CHECK_MAX_BYTES):
+    """Tamaño coherente con la cabecera y PRAGMA quick_check antes de guardar un archivo.
+
+    La cabecera sola no detecta un archivo armado con bytes de dos versiones
+    (por ejemplo una descarga retomada despues de que cambio el original).
+    """
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        header = f.read(100)
+    size = os.path.getsize(path)
+    page_size = int.from_bytes(header[16:18], "big") if len(header) == 100 else 0
+    if page_size == 1:
+        page_size = 65536
+    if page_size < 512 or page_size & (page_size - 1) or size % page_size:
+        raise AcquisitionError(f"El archivo '{name}' esta truncado o no es una base de datos SQLite valida")
+    # El contador de paginas de la cabecera vale si coincide con el contador de cambios
+    page_count = int.from_bytes(header[28:32], "big")
+    if header[92:96] == header[24:28] and page_count and page_count * page_size != size:
+        raise AcquisitionError(
+            f"El archivo '{name}' mide {size} bytes y su cabecera indica {page_count * page_size}"
+        )
+    if size > quick_check_max_bytes:
+        return
+    try:
+        conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro&immutable=1", uri=True)
+        try:
+            result = conn.execute("PRAGMA quick_check").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise AcquisitionError(f"El archivo '{name}' esta corrupto: {e}") from e
+    if result != [("ok",)]:
+        raise AcquisitionError(f"El archivo '{name}' esta corrupto: {result[0][0]}")
+
+
+def _validator(headers):
+    """ETag fuerte o Last-Modified de una respuesta, para If-Range"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+class DatabaseStore:
+    """Cache local direccionada por contenido: <sha256>.sqlite.
+
+    Las descargas y subidas se escriben por bloques directamente a disco
+    calculando el hash al vuelo. Un indice JSON recuerda que hash corresponde a
+    cada URL, asi volver a pedir una URL ya descargada no toca la red. Las
+    descargas interrumpidas se retoman con Range e If-Range. Con pin=True el
+    hash de la primera descarga queda fijado para la URL (pins.json) y las
+    siguientes deben coincidir.
+    """
+
+    def __init__(self, root=STORE_DIR, max_bytes=MAX_STORE_BYTES):
+        self.root = Path(root)
+        self.partial = self.root / "partial"
+        self.index_path = self.root / "index.json"
+        self.pins_path = self.root / "pins.json"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Una descarga a la vez por URL: dos sesiones escribirian el mismo parcial
+        self._url_locks = {}
+
+    def _partial_dir(self):
+        # Se crea al escribir el primer archivo, no al importar el modulo
+        self.partial.mkdir(parents=True, exist_ok=True)
+        return self.partial
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def path_for(self, digest):
+        return self.root / f"{digest}.sqlite"
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path, data):
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def _read_index(self):
+        return self._read_json(self.index_path)
+
+    def _write_index(self, index):
+        self._write_json(self.index_path, index)
+
+    def pinned(self, url):
+        """sha256 fijado para url por una descarga anterior con pin=True, o None"""
+        return self._read_json(self.pins_path).get(url)
+
+    def _touch(self, path):
+        os.utime(path, None)
+
+    def _commit(self, tmp_path, digest, expected_sha256=None):
+        """Valida y mueve un archivo temporal a su ruta por contenido"""
+        if expected_sha256 and digest != expected_sha256.lower():
+            os.remove(tmp_path)
+            raise AcquisitionError(f"Checksum invalido: se esperaba {expected_sha256} y se obtuvo {digest}")
+        try:
+            validate_sqlite(tmp_path)
+            check_integrity(tmp_path)
+        except AcquisitionError:
+            os.remove(tmp_path)
+            raise
+        final = self.path_for(digest)
+        with self._lock:
+            if final.exists():
+                os.remove(tmp_path)
+                self._touch(final)
+            else:
+                os.replace(tmp_path, final)
+        self.evict(keep={digest})
+        return final
+
+    def add_stream(self, fileobj, expected_sha256=None):
+        """Guarda un archivo leyendolo por bloques (por ejemplo un UploadedFile de Streamlit)"""
+        digest = hashlib.sha256()
+        tmp = self._partial_dir() / f"upload-{os.getpid()}-{threading.get_ident()}-{time.time_ns()}"
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        digest = digest.hexdigest()
+        return digest, self._commit(tmp, digest, expected_sha256)
+
+    def fetch(self, url, expected_sha256=None, refresh=False, pin=False):
+        """Devuelve (sha256, ruta) de la base en url, descargandola solo si hace falta"""
+        if pin and not expected_sha256:
+            expected_sha256 = self.pinned(url)
+        if expected_sha256 and self.path_for(expected_sha256.lower()).exists():
+            path = self.path_for(expected_sha256.lower())
+            self._touch(path)
+            return expected_sha256.lower(), path
+        if not refresh:
+            cached = self._indexed(url)
+            if cached:
+                return cached
+
+        with self._url_lock(url):
+            # Otra sesion pudo terminar la misma descarga mientras se esperaba el lock
+            if expected_sha256 and self.path_for(expected_sha256.lower()).exists():
+                return expected_sha256.lower(), self.path_for(expected_sha256.lower())
+            cached = None if refresh else self._indexed(url)
+            if cached:
+                return cached
+            return self._fetch(url, expected_sha256, pin)
+
+    def _indexed(self, url):
+        digest = self._read_index().get(url)
+        if not digest or not self.path_for(digest).exists():
+            return None
+        self._touch(self.path_for(digest))
+        return digest, self.path_for(digest)
+
+    def _fetch(self, url, expected_sha256, pin):
+        """Descarga url y la guarda; se llama con el lock de la URL tomado"""
+        self._drop_stale_partials()
+        part = self._partial_dir() / (hashlib.sha1(url.encode()).hexdigest() + ".part")
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                self._download(url, part)
+                break
+            except (urllib.error.URLError, OSError) as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code not in (408, 429, 500, 502, 503, 504):
+                    raise AcquisitionError(f"Error en descarga: {e}") from e
+                if attempt == DOWNLOAD_ATTEMPTS - 1:
+                    raise AcquisitionError(f"Error en descarga tras {DOWNLOAD_ATTEMPTS} intentos: {e}") from e
+                time.sleep(2 ** attempt)
+
+        digest = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        try:
+            path = self._commit(part, digest, expected_sha256)
+        finally:
+            # Valido o no, el parcial ya no se retoma: _commit lo movio o lo borro
+            self._validator_path(part).unlink(missing_ok=True)
+        with self._lock:
+            index = self._read_index()
+            index[url] = digest
+            self._write_index(index)
+            if pin:
+                pins = self._read_json(self.pins_path)
+                pins.setdefault(url, digest)
+                self._write_json(self.pins_path, pins)
+        return digest, path
+
+    def _validator_path(self, part):
+        return part.with_suffix(".validator")
+
+    def _discard(self, part):
+        part.unlink(missing_ok=True)
+        self._validator_path(part).unlink(missing_ok=True)
+
+    def _drop_stale_partials(self):
+        if not self.partial.exists():
+            return
+        now = time.time()
+        for path in self.partial.iterdir():
+            try:
+                if now - path.stat().st_mtime > PARTIAL_MAX_AGE:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def _download(self, url, part):
+        """Descarga por bloques a part; si ya existe un parcial pide solo lo que falta.
+
+        El ETag o Last-Modified de la primera respuesta se guarda junto al parcial
+        y se envia como If-Range al retomar: si el archivo cambio, el servidor
+        responde 200 con el archivo completo y el parcial se descarta en lugar de
+        mezclar bytes de dos versiones.
+        """
+        validator_path = self._validator_path(part)
+        existing = part.stat().st_size if part.exists() else 0
+        validator = validator_path.read_text(encoding="utf-8") if existing and validator_path.exists() else None
+        if existing and not validator:
+            # Sin validador no hay forma de saber si el parcial es del mismo archivo
+            self._discard(part)
+            existing = 0
+        headers = {"Range": f"bytes={existing}-", "If-Range": validator} if existing else {}
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and existing:
+                # El parcial ya estaba completo; check_integrity lo revisa antes de guardarlo
+                return
+            raise
+        with response:
+            if existing and response.status == 206:
+                start = response.headers.get("Content-Range", "").partition(" ")[2].partition("-")[0]
+                if _validator(response.headers) not in (None, validator) or start != str(existing):
+                    # El servidor ignoro If-Range y el archivo cambio: se reintenta desde cero
+                    self._discard(part)
+                    raise OSError("El archivo remoto cambio durante la descarga")
+            elif existing:
+                # 200: el servidor ignoro el Range o el archivo cambio; empezamos de cero
+                existing = 0
+            if not existing:
+                validator = _validator(response.headers)
+                if validator:
+                    validator_path.write_text(validator, encoding="utf-8")
+                else:
+                    validator_path.unlink(missing_ok=True)
+            with open(part, "ab" if existing else "wb") as out:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+
+    def evict(self, keep=()):
+        """Borra las bases usadas hace mas tiempo hasta quedar bajo max_bytes.
+
+        Nunca borra una base con un engine abierto (de resource_cache, el
+        servicio o el CLI): esas quedan aunque el almacen supere el tope.
+        """
+        # Importacion diferida: engine importa remote_db, que importa este modulo
+        from engine import open_paths
+
+        with self._lock:
+            in_use = open_paths()
+            files = sorted(self.root.glob("*.sqlite"), key=lambda p: p.stat().st_mtime)
+            total = sum(p.stat().st_size for p in files)
+            removed = set()
+            for path in files:
+                if total <= self.max_bytes:
+                    break
+                if path.stem in keep or os.path.realpath(path) in in_use:
+                    continue
+                total -= path.stat().st_size
+                path.unlink()
+                removed.add(path.stem)
+            if removed:
+                index = {url: d for url, d in self._read_index().items() if d not in removed}
+                self._write_index(index)
+            return removed
+
+
+database_store = DatabaseStore()
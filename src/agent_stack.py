@@ -0,0 +1,140 @@
+"""Piezas del agente que heredan de langchain.agents y de las herramientas SQL de langchain_community.
+
+Se importa al construir el agente (build_sql_agent, create_sql_agent), no al
+arrancar la app: la logica vive en query_plan, column_profiles, tool_cache y retry.
+"""
+import time
+
+from langchain.agents import AgentExecutor
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import BaseSQLDatabaseTool
+from langchain_core.agents import AgentFinish
+from langchain_core.tools import BaseTool
+from langchain_core.utils.input import get_color_mapping
+
+from column_profiles import column_profiler, describe_column
+from query_plan import check_query
+from retry import CHECKPOINT_KEY
+from tool_cache import memoize_tools
+
+
+class MemoizedSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """SQLDatabaseToolkit con list_tables, schema y query_checker memoizados por sesion"""
+
+    def get_tools(self):
+        return memoize_tools(super().get_tools(), self.db)
+
+
+class QueryPlanTool(BaseSQLDatabaseTool, BaseTool):
+    """Herramienta para que el agente revise el plan de una consulta sin ejecutarla"""
+
+    name: str = "sql_db_plan"
+    description: str = (
+        "Input: una consulta SQL. Output: el plan de ejecucion de SQLite (EXPLAIN QUERY PLAN) "
+        "con avisos de recorridos completos, indices temporales y subconsultas correlacionadas. "
+        "Usala antes de sql_db_query si la consulta toca tablas grandes."
+    )
+
+    def _run(self, query, run_manager=None):
+        plan, warning = check_query(self.db, query)
+        if not plan:
+            return "No se pudo obtener el plan: revisa la sintaxis con sql_db_query_checker."
+        text = "\n".join(detail for _, _, detail in plan)
+        return f"{text}\n\n{warning}" if warning else f"{text}\n\nEl plan no muestra problemas de costo."
+
+
+class ColumnValuesTool(BaseSQLDatabaseTool, BaseTool):
+    """Herramienta para consultar el perfil precalculado de columnas sin correr SQL"""
+
+    name: str = "sql_db_column_values"
+    description: str = (
+        "Input: columnas separadas por comas como tabla.columna, o el nombre de una tabla para todas "
+        "sus columnas. Output: tipo, nulos, valores distintos, rango y valores mas frecuentes. "
+        "Usala en lugar de SELECT DISTINCT para saber que valores tiene una columna antes de filtrar."
+    )
+
+    def _run(self, columns, run_manager=None):
+        profiles = column_profiler.profiles(self.db)
+        by_name = {t.lower(): t for t in profiles}
+        lines = []
+        for item in (c.strip().strip("\"'`") for c in columns.split(",")):
+            if not item:
+                continue
+            table_name, _, column_name = item.partition(".")
+            table = by_name.get(table_name.lower())
+            if table is None:
+                lines.append(f"{item}: sin perfil todavia; usa sql_db_query con LIMIT.")
+                continue
+            table_columns = profiles[table]["columns"]
+            if not column_name:
+                lines.extend(describe_column(table, c, p) for c, p in table_columns.items())
+                continue
+            column = next((c for c in table_columns if c.lower() == column_name.lower()), None)
+            if column is None:
+                lines.append(f"{item}: la columna no existe en {table}. Columnas: {', '.join(table_columns)}")
+            else:
+                lines.append(describe_column(table, column, table_columns[column]))
+        return "\n".join(lines) or "Indica columnas como tabla.columna."
+
+
+class ResumableAgentExecutor(AgentExecutor):
+    """AgentExecutor que retoma el bucle ReAct desde los pasos ya hechos.
+
+    Si las entradas traen CHECKPOINT_KEY con una lista, los pasos se acumulan en
+    esa misma lista: cuando un intento falla, el siguiente parte de lo ya
+    pagado en vez de repetir todas las llamadas al LLM y a SQLite.
+    """
+
+    def _steps(self, inputs):
+        steps = inputs.get(CHECKPOINT_KEY)
+        return steps if isinstance(steps, list) else []
+
+    def _call(self, inputs, run_manager=None):
+        name_to_tool_map = {tool.name: tool for tool in self.tools}
+        color_mapping = get_color_mapping([tool.name for tool in self.tools], excluded_colors=["green", "red"])
+        intermediate_steps = self._steps(inputs)
+        iterations = len(intermediate_steps)
+        time_elapsed = 0.0
+        start_time = time.time()
+        while self._should_continue(iterations, time_elapsed):
+            next_step_output = self._take_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=run_manager
+            )
+            if isinstance(next_step_output, AgentFinish):
+                return self._return(next_step_output, intermediate_steps, run_manager=run_manager)
+            intermediate_steps.extend(next_step_output)
+            if len(next_step_output) == 1:
+                tool_return = self._get_tool_return(next_step_output[0])
+                if tool_return is not None:
+                    return self._return(tool_return, intermediate_steps, run_manager=run_manager)
+            iterations += 1
+            time_elapsed = time.time() - start_time
+        output = self._action_agent.return_stopped_response(
+            self.early_stopping_method, intermediate_steps, **inputs
+        )
+        return self._return(output, intermediate_steps, run_manager=run_manager)
+
+    async def _acall(self, inputs, run_manager=None):
+        name_to_tool_map = {tool.name: tool for tool in self.tools}
+        color_mapping = get_color_mapping([tool.name for tool in self.tools], excluded_colors=["green", "red"])
+        intermediate_steps = self._steps(inputs)
+        iterations = len(intermediate_steps)
+        time_elapsed = 0.0
+        start_time = time.time()
+        while self._should_continue(iterations, time_elapsed):
+            next_step_output = await self._atake_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=run_manager
+            )
+            if isinstance(next_step_output, AgentFinish):
+                return await self._areturn(next_step_output, intermediate_steps, run_manager=run_manager)
+            intermediate_steps.extend(next_step_output)
+            if len(next_step_output) == 1:
+                tool_return = self._get_tool_return(next_step_output[0])
+                if tool_return is not None:
+                    return await self._areturn(tool_return, intermediate_steps, run_manager=run_manager)
+            iterations += 1
+            time_elapsed = time.time() - start_time
+        output = self._action_agent.return_stopped_response(
+            self.early_stopping_method, intermediate_steps, **inputs
+        )
+        return await self._areturn(output, intermediate_steps, run_manager=run_manager)
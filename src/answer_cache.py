@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from db_version import database_fingerprint, database_path, schema_version
+from instrumentation import record_cache
+from model_router import STOPPED, result_failure
+
+CACHE_DIR = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant"))
+# Ruta del almacen en disco; vacio para usar solo memoria
+STORE_PATH = os.getenv("ANSWER_CACHE_STORE", str(CACHE_DIR / "answers.sqlite"))
+TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def normalize_question(question):
+    """Minusculas, sin acentos, sin signos y con espacios colapsados"""
+    text = unicodedata.normalize("NFKD", question).encode("ascii", "ignore").decode().lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def normalize_sql(sql):
+    return " ".join(str(sql).strip().rstrip(";").split())
+
+
+class TTLCache:
+    """LRU con expiracion, tope de entradas y de bytes, y respaldo opcional en SQLite"""
+
+    def __init__(self, name, ttl=TTL, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, store_path=STORE_PATH):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._store = self._open_store(store_path) if store_path else None
+
+    def _open_store(self, store_path):
+        try:
+            Path(store_path).parent.mkdir(parents=True, exist_ok=True)
+            store = sqlite3.connect(store_path, check_same_thread=False, isolation_level=None)
+            store.execute("PRAGMA journal_mode = WAL")
+            store.execute(
+                "CREATE TABLE IF NOT EXISTS cache (name TEXT, key TEXT, value TEXT, created REAL, "
+                "PRIMARY KEY (name, key))"
+            )
+            return store
+        except sqlite3.Error as e:
+            print(f" Cache en disco deshabilitada: {e}")
+            return None
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, created, size = item
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return value
+                self._drop(key)
+            if self._store is None:
+                return None
+            row = self._store.execute(
+                "SELECT value, created FROM cache WHERE name = ? AND key = ?", (self.name, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._store.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key))
+                return None
+            value = json.loads(row[0])
+            self._insert(key, value, row[1], len(row[0]))
+            return value
+
+    def put(self, key, value):
+        raw = json.dumps(value, ensure_ascii=False, default=str)
+        if len(raw) > self.max_bytes:
+            return
+        created = time.time()
+        with self._lock:
+            self._insert(key, value, created, len(raw))
+            if self._store is not None:
+                self._store.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (self.name, key, raw, created)
+                )
+                self._store.execute(
+                    "DELETE FROM cache WHERE name = ? AND (created < ? OR key NOT IN "
+                    "(SELECT key FROM cache WHERE name = ? ORDER BY created DESC LIMIT ?))",
+                    (self.name, created - self.ttl, self.name, self.max_entries),
+                )
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+            if self._store is not None:
+                self._store.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key))
+
+    def _insert(self, key, value, created, size):
+        self._drop(key)
+        self._entries[key] = (value, created, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+
+class AnswerCache:
+    """Cache de dos niveles.
+
+    Nivel 1: pregunta normalizada + esquema -> SQL final y respuesta. Solo es un
+    acierto si la huella de datos coincide; si la base cambio la entrada se borra.
+    Nivel 2: SQL + huella de datos -> resultado de la consulta.
+    """
+
+    def __init__(self, store_path=STORE_PATH):
+        self.answers = TTLCache("answers", store_path=store_path)
+        self.rows = TTLCache("rows", store_path=store_path)
+
+    def _answer_key(self, db, question):
+        path = database_path(db)
+        return json.dumps([path, schema_version(path), normalize_question(question)])
+
+    def lookup_answer(self, db, question):
+        key = self._answer_key(db, question)
+        entry = self.answers.get(key)
+        if entry is not None and entry["data"] != database_fingerprint(database_path(db)):
+            self.answers.delete(key)
+            entry = None
+        record_cache("answer", entry is not None)
+        return entry
+
+    def store_answer(self, db, question, result):
+        if not result or "error" in result or not result.get("output"):
+            return
+        # Corridas cortadas o sin una consulta valida: se repetirian durante todo el TTL
+        if result["output"].startswith(STOPPED) or result_failure(result) is not None:
+            return
+        queries = [
+            (str(action.tool_input), str(observation))
+            for action, observation in result.get("intermediate_steps", [])
+            if getattr(action, "tool", None) == "sql_db_query"
+        ]
+        if queries and queries[-1][1].startswith("Error"):
+            return
+        sql = [query for query, _ in queries]
+        self.answers.put(self._answer_key(db, question), {
+            "output": result["output"],
+            "sql": sql[-1] if sql else None,
+            "data": database_fingerprint(database_path(db)),
+        })
+
+    def _rows_key(self, db, sql, variant):
+        path = database_path(db)
+        return json.dumps([path, database_fingerprint(path), normalize_sql(sql), variant])
+
+    def lookup_rows(self, db, sql, variant=""):
+        value = self.rows.get(self._rows_key(db, sql, variant))
+        record_cache("rows", value is not None)
+        return value
+
+    def store_rows(self, db, sql, value, variant=""):
+        self.rows.put(self._rows_key(db, sql, variant), value)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,88 @@
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+
+def load_questions(path):
+    """Lee preguntas de un JSONL ({"id", "question"} o strings) o un CSV con columna question"""
+    path = Path(path)
+    questions = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            for i, row in enumerate(csv.DictReader(f)):
+                question = row.get("question") or next(iter(row.values()), "")
+                questions.append({"id": row.get("id") or str(i), "question": question.strip()})
+        else:
+            for i, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"question": item}
+                questions.append({"id": str(item.get("id", i)), "question": item["question"].strip()})
+    return [q for q in questions if q["question"]]
+
+
+def build_rate_limiter(requests_per_second, burst=1):
+    """Token bucket para las llamadas al endpoint del LLM (se pasa al ChatGroq)"""
+    if not requests_per_second:
+        return None
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=0.05,
+        max_bucket_size=burst,
+    )
+
+
+def _sql_statements(result):
+    if result.get("cached") or result.get("fast_path"):
+        return [result["sql"]] if result.get("sql") else []
+    return [
+        str(action.tool_input)
+        for action, _ in result.get("intermediate_steps", [])
+        if action.tool == "sql_db_query"
+    ]
+
+
+async def run_batch(run_query, questions, output_path, concurrency=4, timeout=120):
+    """Ejecuta las preguntas con concurrencia acotada y escribe cada resultado al terminar.
+
+    run_query(pregunta) es una corrutina que devuelve el resultado del agente
+    (ver aexecute_query en modelo2). El archivo de salida se escribe en JSONL a
+    medida que terminan las preguntas, asi un corte a mitad no pierde lo hecho.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = {"ok": 0, "error": 0, "timeout": 0}
+
+    with open(output_path, "w", encoding="utf-8") as out:
+
+        async def run_one(item):
+            async with semaphore:
+                start = time.perf_counter()
+                record = {"id": item["id"], "question": item["question"]}
+                try:
+                    result = await asyncio.wait_for(run_query(item["question"]), timeout)
+                    if "error" in result:
+                        record.update(status="error", error=result["error"])
+                    else:
+                        record.update(status="ok", output=result.get("output"), sql=_sql_statements(result))
+                    if "metrics" in result:
+                        record["metrics"] = result["metrics"]
+                except asyncio.TimeoutError:
+                    record.update(status="timeout", error=f"Sin respuesta tras {timeout}s")
+                except Exception as e:
+                    record.update(status="error", error=str(e))
+                record["elapsed"] = round(time.perf_counter() - start, 3)
+                summary[record["status"]] += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                print(f" [{record['status']}] {item['id']} ({record['elapsed']}s)")
+
+        await asyncio.gather(*(run_one(item) for item in questions))
+
+    return summary
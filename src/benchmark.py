@@ -0,0 +1,376 @@
+"""Benchmark offline del agente SQL con un LLM guionado y bases sinteticas.
+
+Uso:
+    python src/benchmark.py --shapes chinook,northwind --scales 10,100 --output bench.json
+    python src/benchmark.py --scales 10 --compare bench.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+CACHE_DIR = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant"))
+FIXTURE_DIR = CACHE_DIR / "bench"
+BATCH_ROWS = 5000
+
+CHINOOK_SCHEMA = """
+CREATE TABLE Artist (ArtistId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Album (AlbumId INTEGER PRIMARY KEY, Title TEXT, ArtistId INTEGER REFERENCES Artist(ArtistId));
+CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name TEXT, AlbumId INTEGER REFERENCES Album(AlbumId),
+    GenreId INTEGER REFERENCES Genre(GenreId), Composer TEXT, Milliseconds INTEGER, UnitPrice NUMERIC);
+CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, FirstName TEXT, LastName TEXT, City TEXT, Country TEXT, Email TEXT);
+CREATE TABLE Invoice (InvoiceId INTEGER PRIMARY KEY, CustomerId INTEGER REFERENCES Customer(CustomerId),
+    InvoiceDate TEXT, BillingCountry TEXT, Total NUMERIC);
+CREATE TABLE InvoiceLine (InvoiceLineId INTEGER PRIMARY KEY, InvoiceId INTEGER REFERENCES Invoice(InvoiceId),
+    TrackId INTEGER REFERENCES Track(TrackId), UnitPrice NUMERIC, Quantity INTEGER);
+"""
+
+NORTHWIND_SCHEMA = """
+CREATE TABLE Categories (CategoryID INTEGER PRIMARY KEY, CategoryName TEXT, Description TEXT);
+CREATE TABLE Suppliers (SupplierID INTEGER PRIMARY KEY, CompanyName TEXT, Country TEXT);
+CREATE TABLE Products (ProductID INTEGER PRIMARY KEY, ProductName TEXT, SupplierID INTEGER REFERENCES Suppliers(SupplierID),
+    CategoryID INTEGER REFERENCES Categories(CategoryID), UnitPrice NUMERIC, UnitsInStock INTEGER);
+CREATE TABLE Customers (CustomerID TEXT PRIMARY KEY, CompanyName TEXT, City TEXT, Country TEXT);
+CREATE TABLE Employees (EmployeeID INTEGER PRIMARY KEY, LastName TEXT, FirstName TEXT, Title TEXT);
+CREATE TABLE Orders (OrderID INTEGER PRIMARY KEY, CustomerID TEXT REFERENCES Customers(CustomerID),
+    EmployeeID INTEGER REFERENCES Employees(EmployeeID), OrderDate TEXT, ShipCountry TEXT, Freight NUMERIC);
+CREATE TABLE "Order Details" (OrderID INTEGER REFERENCES Orders(OrderID), ProductID INTEGER REFERENCES Products(ProductID),
+    UnitPrice NUMERIC, Quantity INTEGER, Discount REAL, PRIMARY KEY (OrderID, ProductID));
+"""
+
+COUNTRIES = ["Argentina", "Brazil", "Canada", "France", "Germany", "Mexico", "Spain", "USA", "United Kingdom", "Chile"]
+GENRES = ["Rock", "Jazz", "Metal", "Alternative", "Blues", "Latin", "Pop", "Classical", "Reggae", "Electronica"]
+CATEGORIES = ["Beverages", "Condiments", "Confections", "Dairy Products", "Grains/Cereals", "Meat/Poultry", "Produce", "Seafood"]
+
+# Guiones: pregunta -> herramientas que el LLM falso invoca antes de responder
+SCRIPTS = {
+    "chinook": {
+        "¿Cuántos artistas hay?": [("sql_db_query", "SELECT COUNT(*) FROM Artist")],
+        "¿Cuáles son los 5 artistas con más álbumes?": [
+            ("sql_db_schema", "Artist, Album"),
+            ("sql_db_query", "SELECT ar.Name, COUNT(*) AS n FROM Album al JOIN Artist ar ON ar.ArtistId = al.ArtistId "
+                             "GROUP BY ar.ArtistId ORDER BY n DESC LIMIT 5"),
+        ],
+        "¿Qué país tiene más ventas?": [
+            ("sql_db_query", "SELECT BillingCountry, SUM(Total) AS ventas FROM Invoice GROUP BY BillingCountry "
+                             "ORDER BY ventas DESC LIMIT 1"),
+        ],
+        "¿Cuál es el género más vendido?": [
+            ("sql_db_schema", "Genre, Track, InvoiceLine"),
+            ("sql_db_query", "SELECT g.Name, SUM(il.Quantity) AS n FROM InvoiceLine il JOIN Track t ON t.TrackId = il.TrackId "
+                             "JOIN Genre g ON g.GenreId = t.GenreId GROUP BY g.GenreId ORDER BY n DESC LIMIT 1"),
+        ],
+    },
+    "northwind": {
+        "¿Cuántos productos hay?": [("sql_db_query", "SELECT COUNT(*) FROM Products")],
+        "¿Cuáles son los 5 clientes con más pedidos?": [
+            ("sql_db_schema", "Customers, Orders"),
+            ("sql_db_query", "SELECT c.CompanyName, COUNT(*) AS n FROM Orders o JOIN Customers c ON c.CustomerID = o.CustomerID "
+                             "GROUP BY c.CustomerID ORDER BY n DESC LIMIT 5"),
+        ],
+        "¿Qué categoría factura más?": [
+            ("sql_db_query", 'SELECT ca.CategoryName, SUM(od.UnitPrice * od.Quantity) AS total FROM "Order Details" od '
+                             "JOIN Products p ON p.ProductID = od.ProductID JOIN Categories ca ON ca.CategoryID = p.CategoryID "
+                             "GROUP BY ca.CategoryID ORDER BY total DESC LIMIT 1"),
+        ],
+    },
+}
+
+
+def _word(rng, n=2):
+    return " ".join(rng.choice("abcdefghijklmnopqrstuvwxyz") * rng.randint(3, 8) for _ in range(n)).title()
+
+
+def _fill_chinook(conn, rng, batch):
+    artists = conn.execute("SELECT COALESCE(MAX(ArtistId), 0) FROM Artist").fetchone()[0]
+    if artists == 0:
+        conn.executemany("INSERT INTO Genre VALUES (?, ?)", enumerate(GENRES, 1))
+    conn.executemany("INSERT INTO Artist VALUES (?, ?)", [(artists + i, _word(rng)) for i in range(1, batch // 50 + 2)])
+    artists = conn.execute("SELECT MAX(ArtistId) FROM Artist").fetchone()[0]
+    albums = conn.execute("SELECT COALESCE(MAX(AlbumId), 0) FROM Album").fetchone()[0]
+    conn.executemany("INSERT INTO Album VALUES (?, ?, ?)", [
+        (albums + i, _word(rng, 3), rng.randint(1, artists)) for i in range(1, batch // 10 + 2)
+    ])
+    albums = conn.execute("SELECT MAX(AlbumId) FROM Album").fetchone()[0]
+    tracks = conn.execute("SELECT COALESCE(MAX(TrackId), 0) FROM Track").fetchone()[0]
+    conn.executemany("INSERT INTO Track VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (tracks + i, _word(rng, 3), rng.randint(1, albums), rng.randint(1, len(GENRES)), _word(rng),
+         rng.randint(60000, 400000), rng.choice([0.99, 1.99]))
+        for i in range(1, batch + 1)
+    ])
+    tracks += batch
+    customers = conn.execute("SELECT COALESCE(MAX(CustomerId), 0) FROM Customer").fetchone()[0]
+    conn.executemany("INSERT INTO Customer VALUES (?, ?, ?, ?, ?, ?)", [
+        (customers + i, _word(rng, 1), _word(rng, 1), _word(rng, 1), rng.choice(COUNTRIES), f"c{customers + i}@mail.com")
+        for i in range(1, batch // 20 + 2)
+    ])
+    customers = conn.execute("SELECT MAX(CustomerId) FROM Customer").fetchone()[0]
+    invoices = conn.execute("SELECT COALESCE(MAX(InvoiceId), 0) FROM Invoice").fetchone()[0]
+    conn.executemany("INSERT INTO Invoice VALUES (?, ?, ?, ?, ?)", [
+        (invoices + i, rng.randint(1, customers), f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-01",
+         rng.choice(COUNTRIES), round(rng.uniform(1, 30), 2))
+        for i in range(1, batch // 5 + 1)
+    ])
+    invoices += batch // 5
+    lines = conn.execute("SELECT COALESCE(MAX(InvoiceLineId), 0) FROM InvoiceLine").fetchone()[0]
+    conn.executemany("INSERT INTO InvoiceLine VALUES (?, ?, ?, ?, ?)", [
+        (lines + i, rng.randint(1, invoices), rng.randint(1, tracks), 0.99, rng.randint(1, 3))
+        for i in range(1, batch + 1)
+    ])
+
+
+def _fill_northwind(conn, rng, batch):
+    products = conn.execute("SELECT COALESCE(MAX(ProductID), 0) FROM Products").fetchone()[0]
+    if products == 0:
+        conn.executemany("INSERT INTO Categories VALUES (?, ?, ?)", [
+            (i, name, _word(rng, 4)) for i, name in enumerate(CATEGORIES, 1)
+        ])
+        conn.executemany("INSERT INTO Suppliers VALUES (?, ?, ?)", [
+            (i, _word(rng), rng.choice(COUNTRIES)) for i in range(1, 31)
+        ])
+        conn.executemany("INSERT INTO Employees VALUES (?, ?, ?, ?)", [
+            (i, _word(rng, 1), _word(rng, 1), "Sales Representative") for i in range(1, 10)
+        ])
+    conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?, ?, ?)", [
+        (products + i, _word(rng), rng.randint(1, 30), rng.randint(1, len(CATEGORIES)),
+         round(rng.uniform(2, 100), 2), rng.randint(0, 120))
+        for i in range(1, batch // 50 + 2)
+    ])
+    products = conn.execute("SELECT MAX(ProductID) FROM Products").fetchone()[0]
+    customers = conn.execute("SELECT COUNT(*) FROM Customers").fetchone()[0]
+    conn.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?)", [
+        (f"C{customers + i:07d}", _word(rng), _word(rng, 1), rng.choice(COUNTRIES)) for i in range(1, batch // 20 + 2)
+    ])
+    customers = conn.execute("SELECT COUNT(*) FROM Customers").fetchone()[0]
+    orders = conn.execute("SELECT COALESCE(MAX(OrderID), 0) FROM Orders").fetchone()[0]
+    conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?, ?)", [
+        (orders + i, f"C{rng.randint(1, customers):07d}", rng.randint(1, 9),
+         f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-01", rng.choice(COUNTRIES), round(rng.uniform(1, 200), 2))
+        for i in range(1, batch // 4 + 1)
+    ])
+    details = []
+    for order in range(orders + 1, orders + batch // 4 + 1):
+        for product in rng.sample(range(1, products + 1), min(4, products)):
+            details.append((order, product, round(rng.uniform(2, 100), 2), rng.randint(1, 50), rng.choice([0, 0.05, 0.1])))
+    conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', details)
+
+
+FIXTURES = {
+    "chinook": (CHINOOK_SCHEMA, _fill_chinook),
+    "northwind": (NORTHWIND_SCHEMA, _fill_northwind),
+}
+
+
+def build_fixture(shape, size_mb, seed=42):
+    """Genera (o reutiliza) una base con la forma indicada de al menos size_mb megabytes"""
+    FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+    path = FIXTURE_DIR / f"{shape}_{size_mb}mb.sqlite"
+    if path.exists():
+        return path
+    schema, fill = FIXTURES[shape]
+    rng = random.Random(seed)
+    tmp = path.with_suffix(".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(schema)
+    target = size_mb * 1024 * 1024
+    print(f" Generando {path.name}...")
+    while os.path.getsize(tmp) < target:
+        fill(conn, rng, BATCH_ROWS)
+        conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    os.replace(tmp, path)
+    return path
+
+
+class ScriptedChatModel(BaseChatModel):
+    """LLM falso y determinista que sigue un guion ReAct por pregunta.
+
+    No guarda estado: la pregunta sale de la linea "New input:" del prompt y el
+    paso del numero de "Observation:" en el scratchpad, asi funciona igual con
+    preguntas concurrentes.
+    """
+
+    scripts: dict
+    # Guion para preguntas que no estan en scripts
+    default: list = []
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(m.content) for m in messages)
+        tail = prompt.rsplit("New input:", 1)[-1]
+        question = tail.split("\n", 1)[0].strip()
+        step = tail.count("Observation:")
+        script = self.scripts.get(question, self.default)
+        if step < len(script):
+            tool, tool_input = script[step]
+            text = f"Thought: Do I need to use a tool? Yes\nAction: {tool}\nAction Input: {tool_input}"
+        else:
+            observation = tail.rsplit("Observation:", 1)[-1].strip()[:200] if step else "sin datos"
+            text = f"Thought: Do I need to use a tool? No\nFinal Answer: {observation}"
+        if self.latency:
+            time.sleep(self.latency)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"token_usage": usage},
+        )
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Rango mas cercano
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devuelve KB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def isolated_caches(store_dir, use_cache):
+    """Caches de respuestas y plantillas vacias en store_dir: cada corrida empieza igual"""
+    # Importacion diferida: la generacion de bases no necesita el stack del agente
+    import fast_path
+    from answer_cache import TTLCache, answer_cache
+
+    answer_cache.answers = TTLCache("answers", store_path=str(Path(store_dir) / "answers.sqlite"))
+    if use_cache:
+        answer_cache.rows = TTLCache("rows", store_path=str(Path(store_dir) / "answers.sqlite"))
+    else:
+        answer_cache.rows = TTLCache("rows", max_entries=0, store_path=None)
+    fast_path.template_store = fast_path.TemplateStore(root=Path(store_dir) / "templates")
+
+
+def run_case(shape, size_mb, repeat, llm_latency, use_cache):
+    path = build_fixture(shape, size_mb)
+    with tempfile.TemporaryDirectory(prefix="bench_cache_") as store_dir:
+        isolated_caches(store_dir, use_cache)
+        return _run_case(path, shape, size_mb, repeat, llm_latency, use_cache)
+
+
+def _run_case(path, shape, size_mb, repeat, llm_latency, use_cache):
+    # Importacion diferida: la generacion de bases no necesita el stack del agente
+    import modelo2
+
+    llm = ScriptedChatModel(scripts=SCRIPTS[shape], latency=llm_latency)
+
+    start = time.perf_counter()
+    db = modelo2.load_database(str(path))
+    agent_executor, _ = modelo2.create_sql_agent(db=db, llm=llm)
+    agent_executor.verbose = False
+    build_seconds = time.perf_counter() - start
+
+    latencies, llm_times, sql_times, iterations = [], [], [], []
+    for _ in range(repeat):
+        for question in SCRIPTS[shape]:
+            result = modelo2.execute_query(agent_executor, question, db=db if use_cache else None)
+            data = result.get("metrics", {})
+            latencies.append(data.get("total_seconds") or 0.0)
+            llm_times.append(data.get("breakdown", {}).get("llm", 0.0))
+            sql_times.append(data.get("breakdown", {}).get("sql", 0.0))
+            iterations.append(data.get("iterations", 0))
+
+    return {
+        "shape": shape,
+        "size_mb": size_mb,
+        "file_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+        "questions": len(latencies),
+        "build_seconds": round(build_seconds, 4),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "llm_seconds": round(sum(llm_times), 4),
+        "sql_seconds": round(sum(sql_times), 4),
+        "iterations_mean": round(sum(iterations) / max(len(iterations), 1), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(c["shape"], c["size_mb"]): c for c in json.load(f)["cases"]}
+    print(f"\n Comparacion con {baseline_path}:")
+    for case in results["cases"]:
+        old = baseline.get((case["shape"], case["size_mb"]))
+        if not old:
+            continue
+        for metric in ("build_seconds", "latency_p50", "latency_p90", "sql_seconds", "peak_rss_mb"):
+            if old.get(metric):
+                delta = (case[metric] - old[metric]) / old[metric] * 100
+                print(f"  {case['shape']} {case['size_mb']}MB {metric}: {old[metric]} -> {case[metric]} ({delta:+.1f}%)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark offline del agente SQL")
+    parser.add_argument("--shapes", default="chinook,northwind", help="Formas de base a generar")
+    parser.add_argument("--scales", default="10,100", help="Tamaños en MB (por ejemplo 10,100,1000,5000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Veces que se repite cada pregunta")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Latencia simulada por llamada al LLM")
+    parser.add_argument("--with-cache", action="store_true", help="Mantener activas las caches de respuestas (vacias al empezar cada caso)")
+    parser.add_argument("--output", default="bench_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--compare", help="Resultados anteriores para comparar")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "cases": [],
+    }
+    for shape in args.shapes.split(","):
+        for size_mb in (int(s) for s in args.scales.split(",")):
+            case = run_case(shape, size_mb, args.repeat, args.llm_latency, args.with_cache)
+            results["cases"].append(case)
+            print(json.dumps(case, ensure_ascii=False))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n Resultados en {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
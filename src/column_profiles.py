@@ -0,0 +1,306 @@
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from db_version import database_fingerprint, database_path
+from instrumentation import metrics
+from remote_db import canonical_path, is_remote, sqlite_uri
+from profile_scan import empty_part, merge_part, scan, table_columns
+from table_stats import estimate_row_counts
+
+# Definido aqui y no en schema_cache: los workers importan este modulo y no deben cargar LangChain
+CACHE_DIR = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant"))
+PROFILE_COLUMNS = os.getenv("PROFILE_COLUMNS", "1") != "0"
+PROFILE_WORKERS = int(os.getenv("PROFILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Tablas con mas filas que esto se perfilan por muestreo de bloques de rowid
+SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "100000"))
+# Un perfil mas viejo se recalcula aunque la firma de la tabla no haya cambiado
+MAX_AGE = float(os.getenv("PROFILE_MAX_AGE", "86400"))
+PROFILE_DIR = CACHE_DIR / "profiles"
+SAMPLE_BLOCKS = 64
+TOP_K = 20
+# Columnas de texto con hasta tantos valores distintos se listan en el prompt
+LOW_CARDINALITY = 30
+PROMPT_VALUES = 10
+SIGNATURE_ROWS = 16
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="column-profiles")
+_scan_threads = ThreadPoolExecutor(max_workers=PROFILE_WORKERS, thread_name_prefix="column-profiles-scan")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _discard_pool():
+    """Descarta un pool roto (un worker murio); el proximo perfil crea uno nuevo"""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _pool(path):
+    """Procesos para archivos locales; una base remota se lee con hilos porque el VFS vive en este proceso"""
+    global _process_pool
+    if is_remote(path):
+        return _scan_threads
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Sin fork: el proceso tiene hilos (Streamlit, servicio, refrescos) y un fork copia sus locks tomados.
+            # Los workers solo importan profile_scan (sin LangChain) y abren su propia conexion
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _process_pool = ProcessPoolExecutor(max_workers=PROFILE_WORKERS, mp_context=context)
+        return _process_pool
+
+
+def _distinct(values, sampled_rows, total_rows):
+    """Distintos exactos si se leyo todo; si no, estimador GEE: sqrt(N/n)·f1 + (d - f1)"""
+    if not sampled_rows or sampled_rows >= total_rows:
+        return len(values)
+    singletons = sum(1 for count in values.values() if count == 1)
+    if singletons == len(values):
+        # Ningun valor se repite en la muestra: columna tipo clave
+        return int(total_rows)
+    estimate = math.sqrt(total_rows / sampled_rows) * singletons + len(values) - singletons
+    return int(min(estimate, total_rows))
+
+
+def _summarize(declared, part, total_rows, sampled):
+    nonnull = part["rows"] - part["nulls"]
+    observed = part["types"].most_common(1)
+    # Filas no nulas estimadas de la tabla completa, para escalar los distintos de una muestra
+    nonnull_total = nonnull * total_rows / part["rows"] if sampled and part["rows"] else nonnull
+    return {
+        "type": declared or (observed[0][0] if observed else ""),
+        "null_fraction": round(part["nulls"] / part["rows"], 4) if part["rows"] else 0.0,
+        "distinct": _distinct(part["values"], nonnull, nonnull_total),
+        "min": part["min"][1] if part["min"] is not None else None,
+        "max": part["max"][1] if part["max"] is not None else None,
+        "top": [[value, round(count / nonnull, 4)] for value, count in part["values"].most_common(TOP_K)],
+        "sampled": sampled,
+    }
+
+
+def _signature(conn, table):
+    """Firma barata de una tabla: columnas y ultimas filas por rowid.
+
+    Detecta cambios de esquema, inserciones y cambios en las filas recientes. Un
+    UPDATE o DELETE en el medio de la tabla no la cambia; para eso esta MAX_AGE.
+    """
+    columns = table_columns(conn, table)
+    try:
+        tail = conn.execute(f"SELECT * FROM {_quote(table)} ORDER BY rowid DESC LIMIT {SIGNATURE_ROWS}").fetchall()
+    except sqlite3.Error:
+        # Tabla WITHOUT ROWID
+        tail = conn.execute(f"SELECT * FROM {_quote(table)} LIMIT {SIGNATURE_ROWS}").fetchall()
+    return hashlib.sha1(repr((columns, tail)).encode()).hexdigest()
+
+
+def profile_table(path, table, estimated_rows, sample_rows=SAMPLE_ROWS, workers=PROFILE_WORKERS):
+    """{columna: perfil} de una tabla.
+
+    Hasta sample_rows filas se lee la tabla completa. Por encima se toman
+    SAMPLE_BLOCKS ventanas de rowid al azar (semilla fija por tabla) repartidas
+    entre los workers; solo se leen las paginas de esas ventanas.
+    """
+    uri = sqlite_uri(path)
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        info = table_columns(conn, table)
+        columns = [row[1] for row in info]
+        declared = {row[1]: (row[2] or "").upper() for row in info}
+        bounds = None
+        if estimated_rows > sample_rows:
+            try:
+                bounds = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {_quote(table)}").fetchone()
+            except sqlite3.Error:
+                bounds = None
+    finally:
+        conn.close()
+    if not columns:
+        return {}
+
+    pool = _pool(path)
+    if bounds is None or bounds[0] is None:
+        # Tabla chica, o sin rowid: lectura en orden con tope de filas
+        sampled = estimated_rows > sample_rows
+        futures = [pool.submit(scan, uri, table, None, sample_rows if sampled else None)]
+    else:
+        sampled = True
+        low, high = bounds
+        size = max(sample_rows // SAMPLE_BLOCKS, 1)
+        rng = random.Random(table)
+        windows = sorted((rng.randint(low, max(low, high - size)), size) for _ in range(SAMPLE_BLOCKS))
+        chunks = [windows[i::workers] for i in range(workers)]
+        futures = [pool.submit(scan, uri, table, chunk) for chunk in chunks if chunk]
+
+    parts = {c: empty_part() for c in columns}
+    for future in futures:
+        for column, part in future.result().items():
+            if column in parts:
+                merge_part(parts[column], part)
+    total = max(estimated_rows, parts[columns[0]]["rows"])
+    return {c: _summarize(declared[c], parts[c], total, sampled) for c in columns}
+
+
+class ColumnProfiler:
+    """Perfiles de columnas por base: tipo, fraccion de nulos, distintos, min/max y valores frecuentes.
+
+    Se guardan en un sidecar JSON en CACHE_DIR/profiles junto con la huella de la
+    base (db_version). Cuando la huella cambia (data_version o schema_version) se
+    recalculan en segundo plano solo las tablas cuya firma cambio; mientras tanto
+    se sigue respondiendo con el perfil anterior.
+    """
+
+    def __init__(self, profile_dir=PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self._entries = {}
+        self._pending = {}
+        self._versions = Counter()
+        self._lock = threading.Lock()
+
+    def _sidecar(self, path):
+        return self.profile_dir / f"{hashlib.sha1(path.encode()).hexdigest()}.json"
+
+    def _entry(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            try:
+                with open(self._sidecar(path), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = {"fingerprint": None, "tables": {}}
+            self._entries[path] = entry
+        return entry
+
+    def _write(self, path, entry):
+        sidecar = self._sidecar(path)
+        try:
+            sidecar.parent.mkdir(parents=True, exist_ok=True)
+            tmp = sidecar.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            os.replace(tmp, sidecar)
+        except OSError:
+            pass
+
+    def version(self, path):
+        """Contador que sube con cada tabla perfilada; sirve de clave para caches del prompt"""
+        return self._versions[canonical_path(path)]
+
+    def profiles(self, db, wait=False):
+        """{tabla: {columna: perfil}} disponible ahora; lanza la actualizacion si la base cambio"""
+        if not PROFILE_COLUMNS:
+            return {}
+        path = database_path(db)
+        fingerprint = database_fingerprint(path)
+        with self._lock:
+            entry = self._entry(path)
+            future = self._pending.get(path)
+            if future is None and entry["fingerprint"] != fingerprint:
+                tables = db.get_usable_table_names()
+                future = self._pending[path] = _coordinator.submit(self._refresh, path, fingerprint, tables)
+        if wait and future is not None:
+            future.result()
+        # Copia: el refresco agrega tablas mientras se lee
+        return dict(entry["tables"])
+
+    def _refresh(self, path, fingerprint, tables):
+        try:
+            entry = self._entry(path)
+            conn = sqlite3.connect(sqlite_uri(path), uri=True)
+            try:
+                signatures = {t: _signature(conn, t) for t in tables}
+            finally:
+                conn.close()
+            now = time.time()
+            for table in [t for t in entry["tables"] if t not in signatures]:
+                del entry["tables"][table]
+            stale = [
+                t for t in tables
+                if t not in entry["tables"]
+                or entry["tables"][t]["signature"] != signatures[t]
+                or now - entry["tables"][t]["profiled_at"] > MAX_AGE
+            ]
+            estimates = estimate_row_counts(path, stale)
+            for table in stale:
+                try:
+                    columns = profile_table(path, table, estimates.get(table, (0,))[0] or 0)
+                except (sqlite3.Error, OSError, BrokenProcessPool) as e:
+                    # La tabla queda sin perfil hasta que cambie la huella; la huella se registra igual
+                    if isinstance(e, BrokenProcessPool):
+                        _discard_pool()
+                    entry.setdefault("errors", {})[table] = f"{type(e).__name__}: {e}"
+                    metrics.inc("sql_assistant_profile_errors_total", error=type(e).__name__)
+                    continue
+                entry.get("errors", {}).pop(table, None)
+                entry["tables"][table] = {"signature": signatures[table], "profiled_at": now, "columns": columns}
+                self._versions[path] += 1
+            entry["fingerprint"] = fingerprint
+            self._write(path, entry)
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def forget(self, path):
+        path = canonical_path(path)
+        with self._lock:
+            self._entries.pop(path, None)
+            future = self._pending.pop(path, None)
+        if future is not None:
+            future.cancel()
+
+
+column_profiler = ColumnProfiler()
+
+
+def _is_text(profile):
+    kind = profile["type"]
+    return "CHAR" in kind or "TEXT" in kind or "CLOB" in kind or not kind
+
+
+def describe_column(table, column, profile, values=TOP_K):
+    """Una linea con el perfil de la columna"""
+    approx = "~" if profile["sampled"] else ""
+    parts = [f"{table}.{column} {profile['type'] or 'sin tipo'}", f"{approx}{profile['distinct']} distintos"]
+    if profile["null_fraction"]:
+        parts.append(f"{profile['null_fraction']:.0%} nulos")
+    if profile["min"] is not None and not (_is_text(profile) and profile["distinct"] <= LOW_CARDINALITY):
+        parts.append(f"rango {profile['min']!r}..{profile['max']!r}")
+    # En columnas sin valores repetidos (ids, nombres, emails) la lista no aporta
+    if profile["top"] and values and (profile["distinct"] <= TOP_K or profile["top"][0][1] >= 0.01):
+        shown = ", ".join(f"{value!r} ({share:.0%})" for value, share in profile["top"][:values])
+        more = ", ..." if profile["distinct"] > min(values, len(profile["top"])) else ""
+        parts.append(f"valores: {shown}{more}")
+    return "; ".join(parts)
+
+
+def profile_section(db, table):
+    """Lineas para el prompt: solo columnas de texto con pocos valores (generos, paises, estados).
+
+    Son las que el agente suele explorar con SELECT DISTINCT antes de filtrar.
+    """
+    profile = column_profiler.profiles(db).get(table)
+    if not profile:
+        return ""
+    lines = [
+        describe_column(table, column, p, PROMPT_VALUES)
+        for column, p in profile["columns"].items()
+        if _is_text(p) and 1 < p["distinct"] <= LOW_CARDINALITY
+    ]
+    return "Valores frecuentes:\n" + "\n".join(lines) if lines else ""
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+from remote_db import canonical_path, is_remote, remote_version, sqlite_uri
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def database_path(db):
+    """Ruta del archivo SQLite detras de un SQLDatabase (o engine)"""
+    engine = getattr(db, "_engine", db)
+    path = engine.url.database or ""
+    if path.startswith("file:"):
+        path = path[len("file:"):].split("?", 1)[0]
+    return canonical_path(path)
+
+
+class VersionTracker:
+    """Detecta cambios en un archivo SQLite.
+
+    PRAGMA data_version solo tiene sentido comparado dentro de una misma conexion
+    (cambia cuando otra conexion confirma cambios), asi que mantenemos una conexion
+    de solo lectura abierta por archivo. Mientras no cambie, la huella calculada
+    con schema_version y el stat del archivo (y su -wal) sigue siendo valida.
+    """
+
+    def __init__(self, path):
+        self.path = canonical_path(path)
+        self._conn = sqlite3.connect(sqlite_uri(self.path), uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._fingerprint = None
+
+    def data_version(self):
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def schema_version(self):
+        with self._lock:
+            return self._conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def fingerprint(self):
+        """Huella estable entre procesos: cambia si cambia el esquema o los datos"""
+        current = self.data_version()
+        if self._fingerprint is not None and current == self._data_version:
+            return self._fingerprint
+        parts = [self.path, str(self.schema_version())]
+        if is_remote(self.path):
+            # Remoto e inmutable durante la sesion: la version es el ETag del objeto
+            parts.append(remote_version(self.path))
+        else:
+            for suffix in ("", "-wal"):
+                try:
+                    st = os.stat(self.path + suffix)
+                    parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+                except FileNotFoundError:
+                    parts.append("-")
+        self._data_version = current
+        self._fingerprint = hashlib.sha1("|".join(parts).encode()).hexdigest()
+        return self._fingerprint
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_tracker(path):
+    path = canonical_path(path)
+    with _trackers_lock:
+        tracker = _trackers.get(path)
+        if tracker is None:
+            tracker = _trackers[path] = VersionTracker(path)
+        return tracker
+
+
+def database_fingerprint(path):
+    return get_tracker(path).fingerprint()
+
+
+def schema_version(path):
+    return get_tracker(path).schema_version()
+
+
+def forget(path):
+    """Cierra el tracker de un archivo (por ejemplo antes de borrarlo)"""
+    with _trackers_lock:
+        tracker = _trackers.pop(canonical_path(path), None)
+    if tracker is not None:
+        tracker.close()
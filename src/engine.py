@@ -0,0 +1,62 @@
+import os
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+from remote_db import canonical_path, sqlite_uri
+
+# mmap y cache por conexion; el mmap lo comparte el page cache del sistema entre conexiones
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_KB", str(32 * 1024)))
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "10"))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.close()
+
+
+def create_readonly_engine(db_path):
+    """Engine de solo lectura (mode=ro + query_only) con pool y PRAGMAs de lectura"""
+    path = canonical_path(db_path)
+    engine = create_engine(
+        f"sqlite:///{sqlite_uri(path)}&uri=true",
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", _configure_connection)
+    return engine
+
+
+def get_engine(db_path):
+    """Engine compartido por archivo: agente, estadisticas e indices usan el mismo pool"""
+    path = canonical_path(db_path)
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            engine = _engines[path] = create_readonly_engine(path)
+        return engine
+
+
+def open_paths():
+    """Rutas con un engine abierto: sus archivos no se pueden borrar"""
+    with _engines_lock:
+        return set(_engines)
+
+
+def dispose_engine(db_path):
+    with _engines_lock:
+        engine = _engines.pop(canonical_path(db_path), None)
+    if engine is not None:
+        engine.dispose()
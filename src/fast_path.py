@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from db_version import database_path, schema_version
+from guarded_query import fetch_limited
+from instrumentation import record_cache, record_sql
+from model_router import AGGREGATION_TERMS, COMPLEX_TERMS, MIN_MATCH_SCORE, matching_terms
+from schema_cache import CACHE_DIR
+from schema_index import get_schema_index, tokenize
+
+FAST_PATH = os.getenv("FAST_PATH", "1") != "0"
+# Veces que una plantilla debe aprenderse antes de usarse sin el agente
+MIN_SUPPORT = int(os.getenv("FAST_PATH_MIN_SUPPORT", "2"))
+MAX_TEMPLATES = int(os.getenv("FAST_PATH_MAX_TEMPLATES", "200"))
+TEMPLATE_DIR = CACHE_DIR / "templates"
+MAX_LIMIT = 1000
+MAX_VALUE_WORDS = 4
+MAX_ANSWER_ROWS = 20
+
+# Palabras que no cambian el SQL; se ignoran al comparar preguntas (ya truncadas a 5 letras)
+STOPWORDS = {
+    "el", "la", "lo", "los", "las", "un", "una", "unos", "unas", "de", "del", "en", "que", "es",
+    "son", "hay", "al", "me", "dame", "cual", "cuale", "exist", "regis",
+    "the", "an", "of", "in", "is", "are", "there", "what", "show", "give",
+}
+_SLOT = re.compile(r"\{slot(\d+)\}")
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def question_words(question):
+    """[(stem, original, inicio, fin)] sin stopwords; los numeros tienen stem '#'"""
+    words = []
+    for match in re.finditer(r"\w+", question):
+        original = match.group()
+        # Solo digitos ASCII: isdigit() acepta "²" y otros que int() rechaza
+        if re.fullmatch(r"[0-9]+", original):
+            stem = "#"
+        else:
+            stems = tokenize(original)
+            if not stems:
+                continue
+            stem = " ".join(stems)
+            if stem in STOPWORDS:
+                continue
+        words.append((stem, original, match.start(), match.end()))
+    return words
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_tables(sql):
+    return re.findall(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', sql, re.IGNORECASE)
+
+
+def _last_query(result):
+    """SQL de la ultima consulta exitosa del agente y su observacion"""
+    for action, observation in reversed(result.get("intermediate_steps") or []):
+        if getattr(action, "tool", None) != "sql_db_query":
+            continue
+        observation = str(observation)
+        if observation.startswith("Error") or "Resultado truncado" in observation:
+            return None, None
+        return str(action.tool_input).strip().rstrip(";").strip(), observation
+    return None, None
+
+
+class TemplateStore:
+    """Plantillas aprendidas por base de datos, en memoria y en CACHE_DIR/templates/<sha1(ruta)>.json.
+
+    Cada plantilla tiene el patron de la pregunta (stems con huecos), el SQL con
+    los mismos huecos y la respuesta con la que se aprendio. Tambien se guardan
+    alias palabra -> tabla aprendidos de las respuestas del agente ("clien" -> Customer).
+    """
+
+    def __init__(self, root=TEMPLATE_DIR, max_templates=MAX_TEMPLATES):
+        self.root = root
+        self.max_templates = max_templates
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _file(self, path):
+        return self.root / f"{hashlib.sha1(path.encode()).hexdigest()}.json"
+
+    def load(self, path):
+        with self._lock:
+            data = self._data.get(path)
+            if data is None:
+                try:
+                    with open(self._file(path), encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    data = {"templates": [], "aliases": {}}
+                self._data[path] = data
+            return data
+
+    def save(self, path):
+        with self._lock:
+            data = self._data.get(path)
+            if data is None:
+                return
+            data["templates"].sort(key=lambda t: (-(t["support"] + t["hits"]), -t["last_used"]))
+            del data["templates"][self.max_templates:]
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp = self._file(path).with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, self._file(path))
+            except OSError:
+                pass
+
+    def add(self, path, template, aliases):
+        data = self.load(path)
+        with self._lock:
+            data["aliases"].update(aliases)
+            for existing in data["templates"]:
+                if existing["pattern"] == template["pattern"] and existing["sql"] == template["sql"]:
+                    existing["support"] += 1
+                    existing["last_used"] = template["last_used"]
+                    existing["schema_version"] = template["schema_version"]
+                    break
+            else:
+                data["templates"].append(template)
+        self.save(path)
+
+    def record_hit(self, path, template):
+        """Cuenta un uso de la plantilla y lo persiste: el orden por support + hits sobrevive reinicios"""
+        with self._lock:
+            template["hits"] += 1
+            template["last_used"] = time.time()
+        self.save(path)
+
+
+template_store = TemplateStore()
+
+
+def learn_template(db, question, result):
+    """Convierte una respuesta exitosa del agente en una plantilla parametrizada.
+
+    Huecos que se detectan:
+    - valor: un literal del SQL que aparece en la pregunta (admite LIKE con %)
+    - numero: un entero del SQL que aparece en la pregunta (LIMIT, umbrales)
+    - tabla: si el SQL usa una sola tabla y ninguna de sus columnas (COUNT(*)),
+      la palabra de la pregunta que la nombra; asi "¿Cuantos clientes hay?"
+      tambien responde "¿Cuantos artistas hay?"
+    """
+    if not FAST_PATH or not result or "error" in result or not result.get("output"):
+        return None
+    sql, observation = _last_query(result)
+    if not sql or not re.match(r"(SELECT|WITH)\b", sql, re.IGNORECASE) or ";" in sql:
+        return None
+    words = question_words(question)
+    used = set()
+    slots = []
+    values = []
+    parts = _LITERAL.split(sql)
+
+    # Literales de texto que vienen de la pregunta
+    for i in range(1, len(parts), 2):
+        literal = parts[i][1:-1].replace("''", "'")
+        core = literal.strip("%")
+        if not core:
+            continue
+        for size in range(1, MAX_VALUE_WORDS + 1):
+            span = next(
+                (j for j in range(len(words) - size + 1)
+                 if not used & set(range(j, j + size))
+                 and _fold(question[words[j][2]:words[j + size - 1][3]]) == _fold(core)),
+                None,
+            )
+            if span is not None:
+                used.update(range(span, span + size))
+                slots.append({"kind": "value", "words": list(range(span, span + size)),
+                              "prefix": literal[:len(literal) - len(literal.lstrip("%"))],
+                              "suffix": literal[len(literal.rstrip("%")):]})
+                values.append(question[words[span][2]:words[span + size - 1][3]])
+                parts[i] = f"{{slot{len(slots) - 1}}}"
+                break
+
+    # Enteros del SQL que vienen de la pregunta
+    for j, (stem, original, _, _) in enumerate(words):
+        if stem != "#" or j in used:
+            continue
+        pattern = rf"(?<![\w.]){original}(?![\w.])"
+        if any(re.search(pattern, parts[i]) for i in range(0, len(parts), 2)):
+            slots.append({"kind": "number", "words": [j]})
+            values.append(original)
+            for i in range(0, len(parts), 2):
+                parts[i] = re.sub(pattern, f"{{slot{len(slots) - 1}}}", parts[i])
+            used.add(j)
+    template_sql = "".join(parts)
+
+    # La tabla como hueco, si el SQL no depende de sus columnas
+    aliases = {}
+    tables = _sql_tables(template_sql)
+    if len(set(tables)) == 1 and not re.search(r"\bJOIN\b", template_sql, re.IGNORECASE):
+        table = tables[0]
+        columns = [c["name"] for c in db._inspector.get_columns(table)] if table in db.get_usable_table_names() else []
+        if columns and not any(re.search(rf"\b{re.escape(c)}\b", template_sql, re.IGNORECASE) for c in columns):
+            candidates = [
+                j for j, (stem, original, _, _) in enumerate(words)
+                if j not in used and stem != "#"
+                and not matching_terms(_fold(original).split(), AGGREGATION_TERMS | COMPLEX_TERMS)
+            ]
+            entity = next((j for j in candidates if _resolve_table(db, words[j], {}) == table), None)
+            if entity is None and len(candidates) == 1:
+                entity = candidates[0]
+                aliases[words[entity][0]] = table
+            if entity is not None:
+                slots.append({"kind": "table", "words": [entity]})
+                values.append(words[entity][1])
+                used.add(entity)
+                template_sql = re.sub(
+                    rf'(?<![\w"]){re.escape(table)}(?![\w"])|"{re.escape(table)}"',
+                    f"{{slot{len(slots) - 1}}}", template_sql,
+                )
+
+    pattern = []
+    for j, (stem, _, _, _) in enumerate(words):
+        slot = next((k for k, s in enumerate(slots) if s["words"][0] == j), None)
+        if slot is not None:
+            pattern.append(f"{{slot{slot}}}")
+        elif j not in used:
+            pattern.append(stem)
+    for slot in slots:
+        slot["width"] = len(slot.pop("words"))
+
+    output = result["output"]
+    path = database_path(db)
+    template = {
+        "pattern": pattern,
+        "sql": template_sql,
+        "slots": slots,
+        "values": values,
+        "output": output,
+        "output_slots": _output_slots(output, _scalar(observation), values),
+        "support": 1,
+        "hits": 0,
+        "last_used": time.time(),
+        "schema_version": schema_version(path),
+    }
+    template_store.add(path, template, aliases)
+    return template
+
+
+def _scalar(observation):
+    """El valor si la observacion es un unico valor ([(59,)]), si no None"""
+    match = re.fullmatch(r"\[\((.*?),\)\]", observation.strip())
+    if not match:
+        return None
+    return match.group(1).strip("'\"")
+
+
+def _output_slots(output, scalar, values):
+    """[[inicio, fin, hueco]] del resultado ("result") y de los valores de la pregunta en la respuesta.
+
+    Solo se cuentan apariciones como palabra completa. None si el resultado no
+    aparece exactamente una vez o algun valor aparece varias veces: la respuesta
+    no se puede reescribir sin ambiguedad y se devuelve solo el valor.
+    """
+    if scalar is None:
+        return None
+    found = []
+    for key, text in [("result", scalar), *enumerate(values)]:
+        spans = [m.span() for m in re.finditer(rf"(?<!\w){re.escape(text)}(?!\w)", output)]
+        if len(spans) > 1 or (key == "result" and not spans):
+            return None
+        found.extend([start, end, key] for start, end in spans)
+    found.sort()
+    if any(prev[1] > nxt[0] for prev, nxt in zip(found, found[1:])):
+        return None
+    return found
+
+
+def _resolve_table(db, word, aliases):
+    stem, original = word[0], word[1]
+    if stem in aliases:
+        return aliases[stem]
+    scores = get_schema_index(db).score(original, expand=False)
+    ranked = sorted(scores.items(), key=lambda item: -item[1])
+    if not ranked or ranked[0][1] < MIN_MATCH_SCORE or (len(ranked) > 1 and ranked[1][1] == ranked[0][1]):
+        return None
+    return ranked[0][0]
+
+
+def _match(pattern, slots, words, i=0, j=0, spans=None):
+    """Empareja el patron con las palabras; los huecos de valor aceptan de 1 a MAX_VALUE_WORDS palabras"""
+    spans = spans or {}
+    if i == len(pattern):
+        return spans if j == len(words) else None
+    item = pattern[i]
+    slot = _SLOT.fullmatch(item)
+    if not slot:
+        if j < len(words) and words[j][0] == item:
+            return _match(pattern, slots, words, i + 1, j + 1, spans)
+        return None
+    index = int(slot.group(1))
+    kind = slots[index]["kind"]
+    widths = range(1, MAX_VALUE_WORDS + 1) if kind == "value" else [1]
+    for width in widths:
+        if j + width > len(words):
+            break
+        if kind == "number" and words[j][0] != "#":
+            return None
+        found = _match(pattern, slots, words, i + 1, j + width, {**spans, index: (j, j + width)})
+        if found is not None:
+            return found
+    return None
+
+
+def _fill(db, question, template, words, spans, aliases):
+    """SQL listo para ejecutar y sus parametros, o None si algun hueco no valida contra el esquema"""
+    params = {}
+    texts = {}
+    for index, (start, end) in spans.items():
+        slot = template["slots"][index]
+        text = question[words[start][2]:words[end - 1][3]]
+        texts[index] = text
+        if slot["kind"] == "number":
+            try:
+                value = int(text)
+            except ValueError:
+                return None
+            if not 0 < value <= MAX_LIMIT:
+                return None
+            params[index] = ("inline", str(value))
+        elif slot["kind"] == "table":
+            table = _resolve_table(db, words[start], aliases)
+            if table is None or table not in db.get_usable_table_names():
+                return None
+            params[index] = ("inline", _quote(table))
+        else:
+            params[index] = ("bind", f"{slot['prefix']}{text}{slot['suffix']}")
+
+    bound = []
+
+    def substitute(match):
+        kind, value = params[int(match.group(1))]
+        if kind == "bind":
+            bound.append(value)
+            return "?"
+        return value
+
+    return _SLOT.sub(substitute, template["sql"]), bound, texts
+
+
+def _render(template, columns, rows, texts):
+    if len(rows) == 1 and len(columns) == 1:
+        value = str(rows[0][0])
+        if template.get("output_slots") is None:
+            return value
+        # Solo se reemplazan las posiciones registradas al aprender, de atras hacia adelante
+        output = template["output"]
+        for start, end, key in reversed(template["output_slots"]):
+            output = output[:start] + (value if key == "result" else texts[key]) + output[end:]
+        return output
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in rows[:MAX_ANSWER_ROWS]:
+        lines.append("| " + " | ".join(str(v) for v in row) + " |")
+    if len(rows) > MAX_ANSWER_ROWS:
+        lines.append(f"\n({len(rows)} filas, se muestran {MAX_ANSWER_ROWS})")
+    return "\n".join(lines)
+
+
+def answer_from_template(db, question):
+    """Responde con una plantilla aprendida sin pasar por el agente, o devuelve None.
+
+    Solo responde si la pregunta coincide con un patron de la version actual del
+    esquema, todos los huecos validan y el SQL se ejecuta sin error ni
+    truncamiento (con huecos de valor, un resultado vacio tambien cae al agente).
+    """
+    if not FAST_PATH:
+        return None
+    path = database_path(db)
+    version = schema_version(path)
+    data = template_store.load(path)
+    words = question_words(question)
+    # Copia: otro hilo puede reordenar la lista al guardar
+    for template in list(data["templates"]):
+        if template["schema_version"] != version or template["support"] < MIN_SUPPORT:
+            continue
+        spans = _match(template["pattern"], template["slots"], words)
+        if spans is None:
+            continue
+        filled = _fill(db, question, template, words, spans, data["aliases"])
+        if filled is None:
+            continue
+        sql, params, texts = filled
+        start = time.perf_counter()
+        try:
+            columns, rows, truncated = fetch_limited(
+                db._engine, sql, params,
+                max_rows=db.max_rows, max_bytes=db.max_bytes, time_budget=db.time_budget,
+            )
+        except sqlite3.Error:
+            continue
+        record_sql(sql, time.perf_counter() - start, len(rows), truncated)
+        if truncated or (not rows and any(s["kind"] == "value" for s in template["slots"])):
+            continue
+        template_store.record_hit(path, template)
+        record_cache("template", True)
+        return {"output": _render(template, columns, rows, texts), "sql": sql, "params": params}
+    record_cache("template", False)
+    return None
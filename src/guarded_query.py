@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import time
+
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy.exc import OperationalError
+
+from answer_cache import answer_cache
+from instrumentation import record_sql
+from schema_cache import CachedSQLDatabase
+
+MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", str(64 * 1024)))
+TIME_BUDGET = float(os.getenv("SQL_TIME_BUDGET", "15"))
+FETCH_CHUNK = 100
+# Cada cuantas instrucciones de la VM de SQLite se revisa el presupuesto de tiempo
+PROGRESS_STEPS = 10000
+PLAN_CHECKS = os.getenv("PLAN_CHECKS", "1") != "0"
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    pass
+
+
+def fetch_limited(engine, command, parameters=None, max_rows=MAX_ROWS, max_bytes=MAX_BYTES, time_budget=TIME_BUDGET):
+    """Ejecuta una consulta leyendo por bloques con tope de filas, bytes y tiempo.
+
+    Devuelve (columnas, filas, truncado). Si la sentencia supera time_budget el
+    progress handler de SQLite la interrumpe y se lanza QueryTimeout.
+    """
+    conn = engine.raw_connection()
+    dbapi_connection = conn.dbapi_connection
+    deadline = time.monotonic() + time_budget
+    dbapi_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), PROGRESS_STEPS)
+    cursor = dbapi_connection.cursor()
+    try:
+        # La interrupcion puede llegar al ejecutar o al leer cualquier bloque de filas
+        try:
+            cursor.execute(command, parameters or ())
+            columns = [d[0] for d in cursor.description or ()]
+            rows = []
+            size = 0
+            truncated = False
+            while not truncated:
+                chunk = cursor.fetchmany(FETCH_CHUNK)
+                if not chunk:
+                    break
+                for row in chunk:
+                    size += sum(len(str(value)) for value in row)
+                    # La primera fila se conserva aunque sola supere max_bytes
+                    if len(rows) >= max_rows or (rows and size > max_bytes):
+                        truncated = True
+                        break
+                    rows.append(row)
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline and "interrupt" in str(e):
+                raise QueryTimeout(
+                    f"La consulta supero el limite de {time_budget:g}s y fue abortada. "
+                    "Agrega filtros, LIMIT o evita productos cartesianos."
+                ) from e
+            raise
+        return columns, rows, truncated
+    finally:
+        cursor.close()
+        dbapi_connection.set_progress_handler(None, 0)
+        conn.close()
+
+
+class GuardedSQLDatabase(CachedSQLDatabase):
+    """SQLDatabase cuyo run (el de la herramienta sql_db_query) tiene memoria y tiempo acotados.
+
+    Antes de ejecutar revisa el plan (query_plan.check_query) y agrega al
+    resultado un aviso si hay recorridos completos, indices temporales o
+    subconsultas correlacionadas.
+    """
+
+    def __init__(self, engine, max_rows=MAX_ROWS, max_bytes=MAX_BYTES, time_budget=TIME_BUDGET, **kwargs):
+        super().__init__(engine, **kwargs)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.time_budget = time_budget
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        if fetch == "cursor" or not isinstance(command, str):
+            return super().run(
+                command, fetch, include_columns, parameters=parameters, execution_options=execution_options
+            )
+        # Con parametros la clave no identificaria el resultado; no se cachea
+        variant = f"{fetch}:{include_columns}" if not parameters else None
+        cached = answer_cache.lookup_rows(self, command, variant) if variant else None
+        if cached is not None:
+            record_sql(command, 0.0, None, cached=True)
+            return cached
+        # El plan se revisa antes de ejecutar; el aviso vuelve al modelo junto al resultado
+        warning = ""
+        if PLAN_CHECKS:
+            # Importacion diferida: el asesor de planes solo se carga si esta activo
+            from query_plan import check_query
+
+            warning = check_query(self, command, parameters)[1]
+        start = time.perf_counter()
+        try:
+            columns, rows, truncated = fetch_limited(
+                self._engine,
+                command,
+                parameters,
+                max_rows=1 if fetch == "one" else self.max_rows,
+                max_bytes=self.max_bytes,
+                time_budget=self.time_budget,
+            )
+        except sqlite3.Error as e:
+            # run_no_throw solo captura errores de SQLAlchemy
+            raise OperationalError(command, parameters, e) from e
+        record_sql(command, time.perf_counter() - start, len(rows), truncated)
+        res = [
+            {column: truncate_word(value, length=self._max_string_length) for column, value in zip(columns, row)}
+            for row in rows
+        ]
+        if not include_columns:
+            res = [tuple(row.values()) for row in res]
+        text = str(res) if res else ""
+        if truncated and fetch != "one":
+            text += (
+                f"\n(Resultado truncado: se muestran las primeras {len(rows)} filas. "
+                "Usa LIMIT, filtros o agregaciones para obtener un resultado completo.)"
+            )
+        if warning:
+            text = f"{text}\n\n{warning}" if text else warning
+        if variant:
+            answer_cache.store_rows(self, command, text, variant)
+        return text
@@ -0,0 +1,244 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger("sql_assistant.metrics")
+if os.getenv("METRICS_LOG_FILE"):
+    _file_handler = logging.FileHandler(os.environ["METRICS_LOG_FILE"], encoding="utf-8")
+    _file_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_file_handler)
+    logger.setLevel(logging.INFO)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15)
+
+
+class MetricsRegistry:
+    """Contadores, gauges e histogramas en memoria con salida en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            index = bisect_left(hist["buckets"], value)
+            if index < len(hist["counts"]):
+                hist["counts"][index] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def render(self):
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({k[0] for k in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+            for name in sorted({k[0] for k in self._gauges}):
+                lines.append(f"# TYPE {name} gauge")
+                for (n, labels), value in sorted(self._gauges.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+            for name in sorted({k[0] for k in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist["buckets"], hist["counts"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist['count']}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist['sum']}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+_current_trace = contextvars.ContextVar("sql_assistant_trace", default=None)
+
+
+class QuestionTrace:
+    """Mediciones de una pregunta: llamadas al LLM, iteraciones ReAct, SQL y caches"""
+
+    def __init__(self, question):
+        self.question = question
+        self.start = time.perf_counter()
+        self.total = None
+        self.llm_calls = []
+        self.iterations = 0
+        self.sql = []
+        self.cache = {}
+        self.status = "ok"
+        # Decision de model_router (modelo elegido, motivo y si escalo)
+        self.route = None
+        self.handler = MetricsCallbackHandler(self)
+
+    def record_llm(self, latency, ttft, prompt_tokens, completion_tokens):
+        self.llm_calls.append({
+            "latency": round(latency, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+        metrics.inc("sql_assistant_llm_calls_total")
+        metrics.observe("sql_assistant_llm_seconds", latency)
+        if ttft is not None:
+            metrics.observe("sql_assistant_llm_ttft_seconds", ttft)
+        metrics.inc("sql_assistant_tokens_total", prompt_tokens or 0, kind="prompt")
+        metrics.inc("sql_assistant_tokens_total", completion_tokens or 0, kind="completion")
+
+    def record_sql(self, sql, seconds, rows, truncated=False, cached=False):
+        self.sql.append({
+            "sql": sql,
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "truncated": truncated,
+            "cached": cached,
+        })
+        if not cached:
+            metrics.observe("sql_assistant_sql_seconds", seconds)
+        metrics.inc("sql_assistant_sql_statements_total", cached=str(cached).lower())
+
+    def record_cache(self, level, hit):
+        counts = self.cache.setdefault(level, {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+
+    def finish(self, status="ok"):
+        self.total = time.perf_counter() - self.start
+        self.status = status
+        metrics.inc("sql_assistant_questions_total", status=status)
+        metrics.observe("sql_assistant_question_seconds", self.total)
+        metrics.observe("sql_assistant_iterations", self.iterations, buckets=ITERATION_BUCKETS)
+        logger.info(json.dumps(self.to_dict(), ensure_ascii=False))
+
+    def breakdown(self):
+        """Reparto del tiempo total entre LLM, SQL y el resto (parseo, herramientas, caches)"""
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        llm = sum(c["latency"] for c in self.llm_calls)
+        sql = sum(s["seconds"] for s in self.sql if not s["cached"])
+        return {"total": total, "llm": llm, "sql": sql, "other": max(total - llm - sql, 0.0)}
+
+    def to_dict(self):
+        return {
+            "question": self.question,
+            "status": self.status,
+            "total_seconds": round(self.total, 4) if self.total is not None else None,
+            "breakdown": {k: round(v, 4) for k, v in self.breakdown().items()},
+            "iterations": self.iterations,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": sum(c["prompt_tokens"] or 0 for c in self.llm_calls),
+            "completion_tokens": sum(c["completion_tokens"] or 0 for c in self.llm_calls),
+            "sql": self.sql,
+            "cache": self.cache,
+            "route": self.route,
+        }
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Callbacks de LangChain que alimentan la traza de la pregunta"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._starts = {}
+        self._first_token = {}
+
+    def _start(self, run_id):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._first_token.setdefault(run_id, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is None:
+            return
+        end = time.perf_counter()
+        first = self._first_token.pop(run_id, None)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            # En streaming el uso viene en usage_metadata del mensaje
+            for generations in response.generations:
+                for generation in generations:
+                    meta = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens = (prompt_tokens or 0) + meta.get("input_tokens", 0)
+                    completion_tokens = (completion_tokens or 0) + meta.get("output_tokens", 0)
+        self.trace.record_llm(end - start, first - start if first else None, prompt_tokens, completion_tokens)
+
+    def on_agent_action(self, action, **kwargs):
+        self.trace.iterations += 1
+
+
+@contextmanager
+def trace_question(question):
+    """Abre una traza para la pregunta; las capas de SQL y cache la encuentran por contexto"""
+    trace = QuestionTrace(question)
+    token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.finish(status)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_sql(sql, seconds, rows, truncated=False, cached=False):
+    trace = current_trace()
+    if trace is not None:
+        trace.record_sql(sql, seconds, rows, truncated, cached)
+    else:
+        metrics.inc("sql_assistant_sql_statements_total", cached=str(cached).lower())
+
+
+def record_cache(level, hit):
+    metrics.inc("sql_assistant_cache_lookups_total", level=level, result="hit" if hit else "miss")
+    trace = current_trace()
+    if trace is not None:
+        trace.record_cache(level, hit)
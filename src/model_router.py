@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import re
+import unicodedata
+
+from instrumentation import current_trace, metrics
+from retry import CHECKPOINT_KEY, is_rate_limit
+from schema_index import get_schema_index, tokenize
+from streaming import AgentCancelled
+
+logger = logging.getLogger("sql_assistant.router")
+
+# auto: clasifica cada pregunta; fast / strong: fuerza un modelo
+ROUTER_MODE = os.getenv("ROUTER_MODE", "auto")
+FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "llama-3.1-8b-instant")
+STRONG_MODEL = os.getenv("ROUTER_STRONG_MODEL", "deepseek-r1-distill-llama-70b")
+MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.5"))
+# Una tabla cuenta como referenciada si su puntaje BM25 llega a esta fraccion del mejor
+RELATIVE_MATCH = 0.6
+# Por debajo de este puntaje la pregunta no se parece a ninguna tabla
+MIN_MATCH_SCORE = 1.0
+LONG_QUESTION_TOKENS = 25
+# Sin tablas reconocidas (por ejemplo preguntas en castellano sobre un esquema en ingles)
+# una pregunta corta suele ser una consulta directa; la red de seguridad es escalar si falla
+SHORT_QUESTION_TOKENS = 8
+UNMATCHED_CONFIDENCE = 0.5
+
+# Palabras completas; con "*" al final, cualquier palabra que empiece asi ("promedio*" -> promedios).
+# Se comparan palabras enteras: "count" no coincide con "country" ni "media" con "MediaType"
+AGGREGATION_TERMS = {
+    "promedio*", "suma", "sumar", "total*", "maxim*", "minim*", "cuant*", "contar", "conteo",
+    "media", "average", "avg", "sum", "count", "max", "min", "mean",
+}
+COMPLEX_TERMS = {
+    "cada", "agrup*", "compar*", "diferenc*", "porcentaj*", "acumul*", "ranking", "tendenc*",
+    "respecto", "nunca", "ningun*", "sin", "ambos", "ambas", "tanto", "versus", "vs", "mensual*",
+    "anual*", "trimestr*", "segun", "proporci*", "ratio", "crec*", "evoluci*", "each", "per",
+    "group", "grouped", "without",
+}
+STOPPED = "Agent stopped due to"
+
+
+def _words(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def matching_terms(words, terms):
+    """Palabras de la pregunta que coinciden con la lista de terminos"""
+    exact = {t for t in terms if not t.endswith("*")}
+    prefixes = tuple(t[:-1] for t in terms if t.endswith("*"))
+    return sorted({w for w in words if w in exact or (prefixes and w.startswith(prefixes))})
+
+
+def classify_question(db, question):
+    """Señales locales de complejidad: tablas que coinciden, agregaciones y palabras de varios pasos.
+
+    No llama al LLM: usa el indice BM25 del esquema (sin expandir por FK) y
+    listas de terminos, asi que cuesta microsegundos.
+    """
+    tokens = tokenize(question)
+    words = _words(question)
+    scores = get_schema_index(db).score(question, expand=False)
+    ranked = sorted(scores.items(), key=lambda item: -item[1])
+    best = ranked[0][1] if ranked else 0.0
+    tables = [t for t, s in ranked if best and s >= best * RELATIVE_MATCH]
+    aggregations = matching_terms(words, AGGREGATION_TERMS)
+    complex_terms = matching_terms(words, COMPLEX_TERMS)
+
+    score = max(len(tables) - 1, 0) + 0.5 * len(aggregations) + len(complex_terms)
+    if len(tokens) > LONG_QUESTION_TOKENS:
+        score += 1
+    if best < MIN_MATCH_SCORE:
+        confidence = UNMATCHED_CONFIDENCE if len(tokens) <= SHORT_QUESTION_TOKENS else 0.0
+    else:
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        confidence = round(1 - second / best, 3)
+    return {
+        "score": score,
+        "confidence": confidence,
+        "tables": tables,
+        "aggregations": aggregations,
+        "complex_terms": complex_terms,
+    }
+
+
+def route_question(db, question, mode=ROUTER_MODE, min_confidence=MIN_CONFIDENCE):
+    """Decision de ruteo: {"tier": "fast"|"strong", "reason", ...señales}"""
+    if mode in ("fast", "strong"):
+        return {"tier": mode, "reason": f"ROUTER_MODE={mode}"}
+    signals = classify_question(db, question)
+    if signals["score"] >= 1:
+        tier, reason = "strong", "pregunta compleja"
+    elif signals["confidence"] < min_confidence:
+        tier, reason = "strong", "baja confianza en las tablas"
+    else:
+        tier, reason = "fast", "pregunta simple"
+    return {"tier": tier, "reason": reason, **signals}
+
+
+def result_failure(result):
+    """Motivo por el que una respuesta del modelo rapido no es confiable, o None"""
+    output = (result or {}).get("output") or ""
+    if not output.strip():
+        return "sin respuesta"
+    if output.startswith(STOPPED):
+        return "limite de iteraciones o tiempo"
+    steps = result.get("intermediate_steps")
+    if steps is not None:
+        observations = [str(obs) for action, obs in steps if getattr(action, "tool", None) == "sql_db_query"]
+        if not observations:
+            return "respondio sin consultar la base"
+        if all(obs.startswith("Error") for obs in observations):
+            return "todas las consultas fallaron"
+    return None
+
+
+class ModelRouter:
+    """Agente de dos niveles: el rapido para preguntas simples y el grande para el resto.
+
+    Se usa igual que un AgentExecutor (invoke/ainvoke). Si el rapido falla o su
+    respuesta no es confiable (result_failure) la pregunta se repite con el
+    grande. Cada decision se registra en el log "sql_assistant.router", en la
+    traza de la pregunta y en sql_assistant_route_total.
+    """
+
+    def __init__(self, fast, strong, db, mode=ROUTER_MODE, min_confidence=MIN_CONFIDENCE):
+        self.fast = fast
+        self.strong = strong
+        self.db = db
+        self.mode = mode
+        self.min_confidence = min_confidence
+
+    @property
+    def verbose(self):
+        return self.strong.verbose
+
+    @verbose.setter
+    def verbose(self, value):
+        self.fast.verbose = value
+        self.strong.verbose = value
+
+    def decide(self, inputs):
+        if inputs.get(CHECKPOINT_KEY):
+            # Reintento de invoke_with_retry: solo el grande guarda pasos, se retoma con el
+            return {"tier": "strong", "reason": "reanudacion"}
+        return route_question(self.db, inputs["input"], self.mode, self.min_confidence)
+
+    def _fast_inputs(self, inputs):
+        # El rapido no comparte el checkpoint: si escala, el grande empieza de cero
+        return {k: v for k, v in inputs.items() if k != CHECKPOINT_KEY}
+
+    def _fallback(self, decision, failure):
+        return {**decision, "tier": "strong", "escalated_from": "fast", "failure": failure}
+
+    def invoke(self, inputs, config=None, **kwargs):
+        decision = self.decide(inputs)
+        if decision["tier"] == "fast":
+            try:
+                result = self.fast.invoke(self._fast_inputs(inputs), config=config, **kwargs)
+                failure = result_failure(result)
+            except AgentCancelled:
+                raise
+            except Exception as e:
+                if is_rate_limit(e):
+                    raise
+                failure = f"error: {e}"
+            if failure is None:
+                self._record(decision)
+                return result
+            decision = self._fallback(decision, failure)
+        result = self.strong.invoke(inputs, config=config, **kwargs)
+        self._record(decision)
+        return result
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        decision = self.decide(inputs)
+        if decision["tier"] == "fast":
+            try:
+                result = await self.fast.ainvoke(self._fast_inputs(inputs), config=config, **kwargs)
+                failure = result_failure(result)
+            except AgentCancelled:
+                raise
+            except Exception as e:
+                if is_rate_limit(e):
+                    raise
+                failure = f"error: {e}"
+            if failure is None:
+                self._record(decision)
+                return result
+            decision = self._fallback(decision, failure)
+        result = await self.strong.ainvoke(inputs, config=config, **kwargs)
+        self._record(decision)
+        return result
+
+    def _record(self, decision):
+        escalated = "escalated_from" in decision
+        metrics.inc("sql_assistant_route_total", tier=decision["tier"], escalated=str(escalated).lower())
+        trace = current_trace()
+        if trace is not None:
+            trace.route = decision
+        logger.info(json.dumps(decision, ensure_ascii=False))
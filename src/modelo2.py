@@ -1,37 +1,74 @@
 
 import os
-import sqlite3
-import urllib.request
+import argparse
+import asyncio
 from sqlalchemy.exc import OperationalError
-from sqlalchemy import create_engine, text
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain_groq import ChatGroq
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain import hub
-import tempfile
-from peft import LoraConfig, get_peft_model
-import torch
+from langchain.agents import create_react_agent
+from langchain_core.runnables import RunnablePassthrough
+from guarded_query import GuardedSQLDatabase
+from engine import get_engine
+from prompt_store import get_agent_prompt, get_template_text
+from schema_index import schema_context
+from table_stats import get_table_stats
+from batch import build_rate_limiter, load_questions, run_batch
+from retry import ainvoke_with_retry, invoke_with_retry
+from answer_cache import answer_cache
+from fast_path import answer_from_template, learn_template
+from instrumentation import metrics, trace_question
+from acquisition import AcquisitionError, database_store, validate_sqlite
+from remote_db import open_remote
+from column_profiles import column_profiler
+from tool_cache import ToolMemo, tool_session
+from agent_stack import ColumnValuesTool, MemoizedSQLDatabaseToolkit, QueryPlanTool, ResumableAgentExecutor
+from model_router import FAST_MODEL, ROUTER_MODE, STRONG_MODEL, ModelRouter
+
+# Memoria de herramientas compartida por las preguntas de esta ejecucion del CLI
+session_memo = ToolMemo()
 
 #Pruebas 
+# sha256 fija la descarga a un contenido conocido; con None se fija el hash de la
+# primera descarga verificada (pins.json del almacen) y las siguientes deben coincidir
 DATABASE_OPTIONS = {
     "chinook": {
         "url": "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite",
         "filename": "Chinook_Sqlite.sqlite",
+        "sha256": None,
         "description": "Base de datos de música con artistas, álbumes, canciones, clientes y ventas"
     },
     "northwind": {
         "url": "https://github.com/jpwhite3/northwind-SQLite3/raw/master/Northwind_large.sqlite",
-        "filename": "Northwind.sqlite", 
+        "filename": "Northwind.sqlite",
+        "sha256": None,
         "description": "Base de datos de comercio con productos, órdenes, clientes y empleados"
     },
     "sakila": {
         "url": "https://github.com/bradleygrant/sakila-sqlite3/raw/master/sakila.sqlite",
         "filename": "Sakila.sqlite",
+        "sha256": None,
         "description": "Base de datos de alquiler de películas con actores, películas y rentas"
     }
 }
 
+def load_database(db_path):
+    engine = get_engine(db_path)
+    db = GuardedSQLDatabase(engine)
+    
+    tables = db.get_usable_table_names()
+    print("\n" + "=" * 50)
+    print(f">> BASE DE DATOS CONECTADA EXITOSAMENTE")
+    print(f">> Ruta: {db_path}")
+    print(f">> Tablas disponibles ({len(tables)}): {', '.join(tables)}")
+    
+    # Estimaciones para todas las tablas; los conteos exactos siguen en segundo plano
+    print("\n Conteo de registros:")
+    stats = get_table_stats(db_path, tables)
+    for table in tables:
+        print(f"  - {table}: {stats.describe(table)}")
+    # Perfiles de columnas en segundo plano para el prompt y sql_db_column_values
+    column_profiler.profiles(db)
+    
+    return db
+
 def process_database():
     print("=" * 50)
     print("📂 CARGADOR DE BASES DE DATOS SQLite")
@@ -52,6 +89,7 @@ def process_database():
                 if not os.path.exists(file_path):
                     print(f" Error: El archivo '{file_path}' no existe")
                     continue
+                validate_sqlite(file_path)
                 db_path = file_path
                 
             elif source == "2":
@@ -60,48 +98,30 @@ def process_database():
                     print(" Error: URL debe comenzar con http:// o https://")
                     continue
                     
-                # archivo temporal
-                with tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False) as tmpfile:
+                remote = input("¿Acceso remoto sin descarga completa? (s/N): ").strip().lower() == "s"
+                if remote:
+                    # solo se piden por HTTP Range las paginas que tocan las consultas
+                    db_path = open_remote(url)
+                    print(f" Base remota abierta: {url}")
+                else:
+                    # almacen local por contenido: una URL ya descargada no vuelve a bajarse
                     print(f"\n Descargando base de datos desde {url}...")
-                    urllib.request.urlretrieve(url, tmpfile.name)
-                    db_path = tmpfile.name
-                    print(f" Base de datos descargada temporalmente en: {db_path}")
+                    _, db_path = database_store.fetch(url)
+                    print(f" Base de datos disponible en: {db_path}")
             
             elif source == "3":
                 print("\nUsando base de datos de ejemplo 'chinook'...")
-                url = "https://github.com/lerocha/chinook-database/raw/master/ChinookDatabase/DataSources/Chinook_Sqlite.sqlite"
-                with tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False) as tmpfile:
-                    urllib.request.urlretrieve(url, tmpfile.name)
-                    db_path = tmpfile.name
+                sample = DATABASE_OPTIONS["chinook"]
+                _, db_path = database_store.fetch(sample["url"], sample["sha256"], pin=True)
             else:
                 print(" por favor intente nuevamente")
                 continue
                 
 
-            engine = create_engine(f'sqlite:///{db_path}')
-            db = SQLDatabase(engine)
-            
-            tables = db.get_usable_table_names()
-            print("\n" + "=" * 50)
-            print(f">> BASE DE DATOS CONECTADA EXITOSAMENTE")
-            print(f">> Ruta: {db_path}")
-            print(f">> Tablas disponibles ({len(tables)}): {', '.join(tables)}")
-            
-            # Mostrar conteo de registros para las primeras 3 tablas
-            print("\n Conteo de registros:")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            for table in tables[:3]:
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = cursor.fetchone()[0]
-                    print(f"  - {table}: {count} registros")
-                except sqlite3.Error as e:
-                    print(f"  - {table}: No se pudo leer ({str(e)})")
-            conn.close()
-            
-            return db
+            return load_database(db_path)
         
+        except AcquisitionError as e:
+            print(f"\n {str(e)}")
         except OperationalError as e:
             print(f"\n Error de conexión: La base de datos no es válida o está corrupta")
             print(f"Detalle: {str(e)}")
@@ -111,6 +131,9 @@ def process_database():
         print("\n Por favor intente nuevamente\n")
 #activar LoRA si es necesario 
 def setup_lora_config():
+    # Importacion diferida: peft arrastra torch (segundos y cientos de MB) y solo se usa con LoRA
+    from peft import LoraConfig
+
     lora_config = LoraConfig(
         r=16, 
         lora_alpha=32,  
@@ -123,7 +146,12 @@ def setup_lora_config():
 
 def apply_lora_to_model(model, use_lora=False):
     """Aplicar LoRA al modelo si este esta habilitado"""
-    if use_lora and torch.cuda.is_available():
+    if not use_lora:
+        return model
+    import torch
+    from peft import get_peft_model
+
+    if torch.cuda.is_available():
         try:
             lora_config = setup_lora_config()
             model = get_peft_model(model, lora_config)
@@ -138,69 +166,60 @@ def create_system_message(db, custom_instructions=""):
     """Crea mensaje del sistema adaptado a la base de datos del usuario"""
 
     tables = db.get_usable_table_names()
-    table_info = []
+    # Los esquemas se eligen por pregunta (schema_index) y entran en {schema_context}
     
-    for table in tables[:4]:  # tablas para el prompt
-        try:
-            table_schema = db.get_table_info([table])
-            table_info.append(f"Tabla {table}:\n{table_schema}")
-        except:
-            table_info.append(f"Tabla {table}: (esquema no disponible)")
-    
-    schema_info = "\n\n".join(table_info)
-    
-    base_prompt = hub.pull('langchain-ai/sql-agent-system-prompt')
+    base_prompt = get_template_text('langchain-ai/sql-agent-system-prompt')
     
     enhanced_prompt = f"""
-{base_prompt.messages[0].prompt.template}
+{base_prompt}
 
 INFORMACION DE LA BASE DE DATOS:
 Dialecto: SQLite
 Tablas disponibles: {', '.join(tables)}
 
-ESQUEMAS DE TABLAS:
-{schema_info}
-
 INSTRUCCIONES ADICIONALES:
 - Siempre usa LIMIT para consultas exploratorias
 - Verifica la existencia de columnas antes de usarlas
 - Usa nombres de tablas exactos (case-sensitive)
 - Para consultas complejas, dividelas en pasos
+- Si el resultado trae un aviso del plan de ejecucion, reescribe la consulta segun el aviso
+- Para saber que valores tiene una columna usa sql_db_column_values en lugar de SELECT DISTINCT
 {custom_instructions}
 """
     
     return enhanced_prompt
 
-def create_sql_agent(db, use_lora=False, custom_instructions=""):
+def build_llm(model, rate_limiter=None):
+    # Importacion diferida: el benchmark y los tests pasan su propio llm
+    from langchain_groq import ChatGroq
+
     os.environ["GROQ_API_KEY"] = ""
-    llm = ChatGroq(
-        model="deepseek-r1-distill-llama-70b",
+    # reasoning_format solo lo aceptan los modelos de razonamiento
+    options = {"reasoning_format": "parsed"} if "deepseek-r1" in model else {}
+    return ChatGroq(
+        model=model,
         temperature=0,
         max_tokens=4000,  
-        reasoning_format="parsed",
         timeout=30,  
         max_retries=3,  
-        request_timeout=60
-    )   
-    
-    if use_lora:
-        try:
-            
-            print("  LoRA con Groq requiere configuración especial")
-        except:
-            pass
-    
-    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-    tools = toolkit.get_tools()
-    system_message = create_system_message(db, custom_instructions)
-    prompt_template = hub.pull('langchain-ai/react-agent-template')
-    prompt = prompt_template.partial(instructions=system_message)
-    agent = create_react_agent(
+        request_timeout=60,
+        rate_limiter=rate_limiter,
+        **options
+    )
+
+def build_agent_executor(db, llm, system_message):
+    toolkit = MemoizedSQLDatabaseToolkit(db=db, llm=llm)
+    tools = toolkit.get_tools() + [QueryPlanTool(db=db), ColumnValuesTool(db=db)]
+    prompt = get_agent_prompt(system_message)
+    # Cada pregunta recibe solo los esquemas de sus tablas relevantes
+    agent = RunnablePassthrough.assign(
+        schema_context=lambda inputs: schema_context(db, inputs["input"])
+    ) | create_react_agent(
         llm=llm,
         tools=tools,
         prompt=prompt
     ) 
-    agent_executor = AgentExecutor(
+    return ResumableAgentExecutor(
         agent=agent,
         tools=tools,
         verbose=True,
@@ -209,28 +228,132 @@ def create_sql_agent(db, use_lora=False, custom_instructions=""):
         max_execution_time=60,  
         return_intermediate_steps=True
     ) 
-    return agent_executor, system_message
 
-def execute_query(agent_executor, query, max_retries=3):   
-    for attempt in range(max_retries):
+def create_sql_agent(db, use_lora=False, custom_instructions="", rate_limiter=None, llm=None, fast_llm=None):
+    # llm permite inyectar otro modelo (por ejemplo el modelo guionado del benchmark);
+    # con fast_llm las preguntas simples van a ese modelo (ver model_router)
+    if llm is None:
+        llm = build_llm(STRONG_MODEL, rate_limiter)
+        if fast_llm is None and ROUTER_MODE != "strong":
+            fast_llm = build_llm(FAST_MODEL, rate_limiter)
+    
+    if use_lora:
         try:
-            print(f"\n Ejecutando consulta (intento {attempt + 1}): {query}")
             
-            result = agent_executor.invoke({
-                "input": query,
-                "chat_history": []
-            })
-            
-            print(" Consulta ejecutada exitosamente")
-            return result
-            
-        except Exception as e:
-            print(f" Error en intento {attempt + 1}: {e}")
-            if attempt == max_retries - 1:
-                print(" Todos los intentos fallaron")
-                return {"error": str(e)}
+            print("  LoRA con Groq requiere configuración especial")
+        except:
+            pass
     
-    return None
+    system_message = create_system_message(db, custom_instructions)
+    agent_executor = build_agent_executor(db, llm, system_message)
+    if fast_llm is not None:
+        agent_executor = ModelRouter(build_agent_executor(db, fast_llm, system_message), agent_executor, db)
+    return agent_executor, system_message
+
+def execute_query(agent_executor, query, max_retries=3, db=None):   
+    with trace_question(query) as trace, tool_session(session_memo):
+        result = _execute_query(agent_executor, query, max_retries, db, trace)
+    breakdown = trace.breakdown()
+    if trace.route:
+        escalated = f", escalado: {trace.route['failure']}" if "escalated_from" in trace.route else ""
+        print(f" Modelo: {trace.route['tier']} ({trace.route['reason']}{escalated})")
+    print(f" Tiempo: {breakdown['total']:.2f}s (LLM {breakdown['llm']:.2f}s, SQL {breakdown['sql']:.3f}s, "
+          f"{trace.iterations} iteraciones)")
+    result["metrics"] = trace.to_dict()
+    return result
+
+def _execute_query(agent_executor, query, max_retries, db, trace):
+    if db is not None:
+        cached = answer_cache.lookup_answer(db, query)
+        if cached:
+            print(f"\n Respuesta desde cache: {query}")
+            return {"input": query, "output": cached["output"], "sql": cached["sql"], "cached": True}
+        fast = answer_from_template(db, query)
+        if fast:
+            print(f"\n Respuesta desde plantilla (sin LLM): {query}")
+            return {"input": query, "output": fast["output"], "sql": fast["sql"], "fast_path": True}
+    try:
+        print(f"\n Ejecutando consulta: {query}")
+        
+        # Backoff con jitter que respeta los 429 y retoma desde el ultimo paso exitoso
+        result = invoke_with_retry(agent_executor, {
+            "input": query,
+            "chat_history": []
+        }, max_retries=max_retries, config={"callbacks": [trace.handler]})
+        
+        print(" Consulta ejecutada exitosamente")
+        if db is not None:
+            answer_cache.store_answer(db, query, result)
+            learn_template(db, query, result)
+        return result
+        
+    except Exception as e:
+        print(" Todos los intentos fallaron")
+        return {"error": str(e)}
+
+async def aexecute_query(agent_executor, query, db=None):
+    """Version asincrona de execute_query para el modo batch"""
+    with trace_question(query) as trace, tool_session(session_memo):
+        result = await _aexecute_query(agent_executor, query, db, trace)
+    result["metrics"] = trace.to_dict()
+    return result
+
+async def _aexecute_query(agent_executor, query, db, trace):
+    if db is not None:
+        cached = answer_cache.lookup_answer(db, query)
+        if cached:
+            return {"input": query, "output": cached["output"], "sql": cached["sql"], "cached": True}
+        fast = answer_from_template(db, query)
+        if fast:
+            return {"input": query, "output": fast["output"], "sql": fast["sql"], "fast_path": True}
+    try:
+        result = await ainvoke_with_retry(agent_executor, {
+            "input": query,
+            "chat_history": []
+        }, config={"callbacks": [trace.handler]})
+    except Exception as e:
+        return {"error": str(e)}
+    if db is not None:
+        answer_cache.store_answer(db, query, result)
+        learn_template(db, query, result)
+    return result
+
+def batch_mode(args):
+    """Corre un archivo de preguntas (JSONL/CSV) contra la base indicada"""
+    db_path = args.db
+    if db_path.lower().startswith(("http://", "https://")):
+        db_path = open_remote(db_path)
+    db = load_database(db_path)
+    agent_executor, _ = create_sql_agent(
+        db=db,
+        rate_limiter=build_rate_limiter(args.rps, args.burst)
+    )
+    agent_executor.verbose = False
+    questions = load_questions(args.batch)
+    print(f"\n Ejecutando {len(questions)} preguntas (concurrencia {args.concurrency})...")
+    summary = asyncio.run(run_batch(
+        lambda query: aexecute_query(agent_executor, query, db=db),
+        questions,
+        args.output,
+        concurrency=args.concurrency,
+        timeout=args.timeout
+    ))
+    print(f"\n Resultados en {args.output}: {summary}")
+    metrics_path = os.path.splitext(args.output)[0] + ".prom"
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    print(f" Metricas en {metrics_path}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agente SQL sobre bases SQLite")
+    parser.add_argument("--db", help="Ruta o URL (lectura remota por rangos) del archivo SQLite (requerido en modo batch)")
+    parser.add_argument("--batch", help="Archivo de preguntas JSONL o CSV")
+    parser.add_argument("--output", default="resultados.jsonl", help="Archivo JSONL de resultados")
+    parser.add_argument("--concurrency", type=int, default=4, help="Preguntas en paralelo")
+    parser.add_argument("--rps", type=float, default=0.5, help="Llamadas por segundo al LLM (0 = sin limite)")
+    parser.add_argument("--burst", type=int, default=2, help="Rafaga maxima del limitador")
+    parser.add_argument("--timeout", type=float, default=120, help="Segundos maximos por pregunta")
+    return parser.parse_args()
 
 def main():
     print("=== AGENTE SQL OPTIMIZADO ===")
@@ -269,7 +392,7 @@ def main():
     
     print("\n Ejecutando consultas de ejemplo:")
     for query in example_queries[:2]: 
-        result = execute_query(agent_executor, query)
+        result = execute_query(agent_executor, query, db=db)
         if result and "error" not in result:
             print(f"📝 Respuesta: {result.get('output', 'Sin respuesta')}")
         print("-" * 50)
@@ -278,7 +401,7 @@ def main():
 
 
 
-def interactive_mode(agent_executor):
+def interactive_mode(agent_executor, db=None):
 
     print("\n Modo interactivo(escribe 'quit' para salir)")
     
@@ -289,7 +412,7 @@ def interactive_mode(agent_executor):
                 break
             
             if query:
-                result = execute_query(agent_executor, query)
+                result = execute_query(agent_executor, query, db=db)
                 if result and "error" not in result:
                     print(f"\n Respuesta:\n{result.get('output', 'Sin respuesta')}")
                 
@@ -298,6 +421,12 @@ def interactive_mode(agent_executor):
             break
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        if not args.db:
+            raise SystemExit("--db es obligatorio en modo batch")
+        batch_mode(args)
+        raise SystemExit(0)
     database = process_database()
     agent_executor, db = main()
     if agent_executor is None or db is None:
@@ -0,0 +1,73 @@
+"""Lectura de columnas para los perfiles; corre en los workers de column_profiles.
+
+Solo usa la biblioteca estandar: con forkserver/spawn cada worker importa este
+modulo y nada mas del proyecto.
+"""
+import sqlite3
+from collections import Counter
+
+MAX_VALUE_LENGTH = 60
+
+_STORAGE = {int: "INTEGER", float: "REAL", str: "TEXT", bytes: "BLOB"}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_columns(conn, table):
+    return conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+
+
+def empty_part():
+    return {"rows": 0, "nulls": 0, "values": Counter(), "types": Counter(), "min": None, "max": None}
+
+
+def _observe(part, value):
+    part["rows"] += 1
+    if value is None:
+        part["nulls"] += 1
+        return
+    kind = _STORAGE.get(type(value), "TEXT")
+    part["types"][kind] += 1
+    if kind == "BLOB":
+        return
+    if kind == "TEXT":
+        value = value[:MAX_VALUE_LENGTH]
+    part["values"][value] += 1
+    # Orden de SQLite: numeros antes que texto
+    key = (kind == "TEXT", value)
+    if part["min"] is None or key < part["min"]:
+        part["min"] = key
+    if part["max"] is None or key > part["max"]:
+        part["max"] = key
+
+
+def scan(uri, table, windows=None, limit=None):
+    """Perfil parcial de una tabla; windows es [(rowid_inicial, filas)] o None para leerla en orden"""
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        columns = [row[1] for row in table_columns(conn, table)]
+        select = f"SELECT {', '.join(_quote(c) for c in columns)} FROM {_quote(table)}"
+        if windows is None:
+            cursors = [conn.execute(f"{select} LIMIT ?", (limit if limit is not None else -1,))]
+        else:
+            cursors = (conn.execute(f"{select} WHERE rowid >= ? ORDER BY rowid LIMIT ?", w) for w in windows)
+        parts = {c: empty_part() for c in columns}
+        for cursor in cursors:
+            for row in cursor:
+                for column, value in zip(columns, row):
+                    _observe(parts[column], value)
+        return parts
+    finally:
+        conn.close()
+
+
+def merge_part(target, part):
+    target["rows"] += part["rows"]
+    target["nulls"] += part["nulls"]
+    target["values"].update(part["values"])
+    target["types"].update(part["types"])
+    for bound, pick in (("min", min), ("max", max)):
+        values = [v for v in (target[bound], part[bound]) if v is not None]
+        target[bound] = pick(values) if values else None
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from langchain.prompts import PromptTemplate
+
+BUNDLED_PATH = Path(__file__).parent / "prompts" / "templates.json"
+CACHE_PATH = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant")) / "prompts.json"
+
+# offline: nunca contacta el hub (por defecto)
+# refresh: intenta actualizar las plantillas desde el hub al arrancar y sigue offline si falla
+PROMPT_STORE_MODE = os.getenv("PROMPT_STORE_MODE", "offline")
+
+
+def _template_text(prompt):
+    """Extrae el texto de un prompt del hub (ChatPromptTemplate o PromptTemplate)"""
+    if hasattr(prompt, "messages"):
+        return prompt.messages[0].prompt.template, "chat"
+    return prompt.template, "prompt"
+
+
+class PromptStore:
+    """Plantillas de prompt versionadas y cargadas una sola vez por proceso.
+
+    Las plantillas vienen empaquetadas en prompts/templates.json. En modo refresh
+    las versiones traidas del hub se guardan en CACHE_PATH y tienen prioridad.
+    """
+
+    def __init__(self, bundled_path=BUNDLED_PATH, cache_path=CACHE_PATH, mode=PROMPT_STORE_MODE, hub_client=None):
+        self.bundled_path = Path(bundled_path)
+        self.cache_path = Path(cache_path)
+        self.mode = mode
+        self._hub = hub_client
+        self._lock = threading.Lock()
+        self._templates = self._load()
+        if self.mode == "refresh":
+            self.refresh()
+
+    def _load(self):
+        with open(self.bundled_path, encoding="utf-8") as f:
+            templates = json.load(f)
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        for name, entry in cached.items():
+            if entry.get("version", 0) >= templates.get(name, {}).get("version", 0):
+                templates[name] = entry
+        return templates
+
+    def _hub_client(self):
+        if self._hub is None:
+            from langchain import hub
+            self._hub = hub
+        return self._hub
+
+    def refresh(self, names=None):
+        """Trae las plantillas del hub; devuelve los nombres que cambiaron"""
+        changed = []
+        for name in names or list(self._templates):
+            try:
+                text, kind = _template_text(self._hub_client().pull(name))
+            except Exception as e:
+                print(f" No se pudo actualizar la plantilla {name}: {e}")
+                continue
+            with self._lock:
+                current = self._templates.get(name, {})
+                if current.get("template") != text:
+                    self._templates[name] = {
+                        "version": current.get("version", 0) + 1,
+                        "kind": kind,
+                        "template": text,
+                    }
+                    changed.append(name)
+        if changed:
+            self._save()
+        return changed
+
+    def _save(self):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(self._templates, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            print(f" No se pudieron guardar las plantillas: {e}")
+
+    def text(self, name):
+        try:
+            return self._templates[name]["template"]
+        except KeyError:
+            raise KeyError(f"Plantilla '{name}' no disponible en el almacen local") from None
+
+    def version(self, name):
+        return self._templates[name]["version"]
+
+    def prompt(self, name):
+        return PromptTemplate.from_template(self.text(name))
+
+
+prompt_store = PromptStore()
+
+
+def get_template_text(name):
+    return prompt_store.text(name)
+
+
+def get_agent_prompt(instructions):
+    """Plantilla ReAct con instrucciones fijas y un hueco {schema_context} que se rellena por pregunta"""
+    text = prompt_store.text('langchain-ai/react-agent-template').replace(
+        "{instructions}",
+        "{instructions}\n\nESQUEMAS RELEVANTES PARA LA PREGUNTA:\n{schema_context}",
+        1,
+    )
+    return PromptTemplate.from_template(text).partial(instructions=instructions, schema_context="")
@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from db_version import database_fingerprint, database_path
+from instrumentation import metrics
+from remote_db import is_remote
+from schema_cache import CACHE_DIR
+from table_stats import estimate_row_counts
+
+# Un recorrido completo de una tabla mas chica que esto no merece un aviso
+SCAN_WARN_ROWS = int(os.getenv("PLAN_SCAN_WARN_ROWS", "10000"))
+SHADOW_DIR = CACHE_DIR / "shadow"
+MAX_INDEX_COLUMNS = 5
+PLAN_CACHE_SIZE = 512
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+_STEP = re.compile(r"^(SCAN|SEARCH)(?: TABLE)? (\S+)(?: AS (\S+))?(?: USING (.*))?$")
+_AUTOMATIC = re.compile(r"AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.*)\)")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (.*)")
+_CORRELATED = re.compile(r"CORRELATED (?:SCALAR|LIST) SUBQUERY")
+_SQL_KEYWORDS = {"where", "on", "using", "join", "inner", "left", "right", "cross", "natural", "group", "order",
+                 "limit", "union", "except", "intersect", "having", "window", "full", "outer"}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def explain(connection, sql, parameters=None):
+    """Filas (id, padre, detalle) de EXPLAIN QUERY PLAN sobre una conexion sqlite3"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())
+        return [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def table_indexes(connection, table):
+    """{indice: [columnas]} de una tabla"""
+    indexes = {}
+    cursor = connection.cursor()
+    try:
+        for row in cursor.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+            name = row[1]
+            indexes[name] = [c[2] for c in cursor.execute(f"PRAGMA index_info({_quote(name)})").fetchall()]
+    finally:
+        cursor.close()
+    return indexes
+
+
+def table_aliases(sql):
+    """{alias: tabla} de FROM/JOIN; desde SQLite 3.36 el plan nombra la tabla por su alias"""
+    aliases = {}
+    pattern = r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?'
+    for table, alias in re.findall(pattern, sql, re.IGNORECASE):
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def analyze_plan(plan, row_counts, sql):
+    """Hallazgos del plan que cuestan caro: [{"kind", "table", "detail", "rows"}].
+
+    - scan: recorrido completo de una tabla grande en una consulta con filtros
+      (sin WHERE/ON el recorrido es inevitable y no se avisa)
+    - automatic_index: SQLite construye un indice temporal en cada ejecucion
+    - temp_btree: ordenamiento o agrupacion en un B-tree temporal sobre una tabla grande
+    - correlated: subconsulta que se reevalua por cada fila exterior
+    """
+    filtered = re.search(r"\b(WHERE|ON|USING)\b", sql, re.IGNORECASE) is not None
+    aliases = table_aliases(sql)
+    findings = []
+    large_scan = False
+    for _, _, detail in plan:
+        step = _STEP.match(detail)
+        if step:
+            table, using = aliases.get(step.group(2), step.group(2)), step.group(4) or ""
+            rows = row_counts.get(table)
+            if not isinstance(rows, int):
+                # Conteo desconocido o fallido (TableStats guarda "Error")
+                rows = None
+            automatic = _AUTOMATIC.search(using)
+            if automatic:
+                findings.append({"kind": "automatic_index", "table": table, "detail": detail, "rows": rows,
+                                 "columns": re.findall(r"(\w+)\s*[=<>]", automatic.group(1))})
+            elif step.group(1) == "SCAN" and table in row_counts:
+                big = rows is None or rows >= SCAN_WARN_ROWS
+                large_scan = large_scan or big
+                if big and filtered:
+                    findings.append({"kind": "scan", "table": table, "detail": detail, "rows": rows})
+        elif _TEMP_BTREE.search(detail) and large_scan:
+            findings.append({"kind": "temp_btree", "table": None, "detail": detail, "rows": None})
+        elif _CORRELATED.search(detail):
+            findings.append({"kind": "correlated", "table": None, "detail": detail, "rows": None})
+    return findings
+
+
+def format_warning(findings, indexes):
+    """Aviso en lenguaje natural para el modelo; indexes es {tabla: {indice: columnas}}"""
+    if not findings:
+        return ""
+    lines = ["Aviso del plan de ejecucion (EXPLAIN QUERY PLAN):"]
+    for finding in findings:
+        table = finding["table"]
+        rows = f" (~{finding['rows']} filas)" if finding["rows"] is not None else ""
+        if finding["kind"] == "scan":
+            available = ", ".join(f"{name}({', '.join(cols)})" for name, cols in indexes.get(table, {}).items())
+            lines.append(
+                f"- Recorrido completo de {table}{rows}: ningun filtro usa un indice. "
+                + (f"Indices disponibles: {available}." if available else "La tabla no tiene indices.")
+            )
+        elif finding["kind"] == "automatic_index":
+            lines.append(
+                f"- SQLite crea un indice temporal sobre {table}({', '.join(finding['columns'])}){rows} "
+                "en cada ejecucion: une o filtra por columnas indexadas si es posible."
+            )
+        elif finding["kind"] == "temp_btree":
+            lines.append(f"- {finding['detail']}: ordena o agrupa por columnas indexadas, o filtra antes.")
+        elif finding["kind"] == "correlated":
+            lines.append("- Subconsulta correlacionada: se evalua una vez por fila; reescribela con JOIN o EXISTS.")
+    lines.append("Si la respuesta no es la esperada o tarda, reescribe la consulta con estas indicaciones.")
+    return "\n".join(lines)
+
+
+def _check(db, path, sql, parameters=None):
+    conn = db._engine.raw_connection()
+    try:
+        try:
+            plan = explain(conn.dbapi_connection, sql, parameters)
+        except sqlite3.Error:
+            # Sentencias invalidas o multiples: el error lo reporta la ejecucion
+            return (), "", ()
+        # Estimaciones baratas de las tablas del plan: un COUNT(*) exacto por tabla no vale la pena aqui
+        usable = set(db.get_usable_table_names())
+        tables = [t for t in dict.fromkeys(_plan_tables(plan, sql)) if t in usable]
+        estimates = estimate_row_counts(path, tables)
+        findings = analyze_plan(plan, {t: estimates.get(t, (None,))[0] for t in tables}, sql)
+        indexes = {
+            f["table"]: table_indexes(conn.dbapi_connection, f["table"]) for f in findings if f["kind"] == "scan"
+        }
+    finally:
+        conn.close()
+    return tuple(plan), format_warning(findings, indexes), tuple(f["kind"] for f in findings)
+
+
+def _plan_tables(plan, sql):
+    aliases = table_aliases(sql)
+    tables = []
+    for _, _, detail in plan:
+        step = _STEP.match(detail)
+        if step:
+            tables.append(aliases.get(step.group(2), step.group(2)))
+    return tables
+
+
+def check_query(db, sql, parameters=None):
+    """(plan, aviso) de una consulta antes de ejecutarla; cacheado por version de la base"""
+    path = database_path(db)
+    if parameters:
+        plan, warning, kinds = _check(db, path, sql, parameters)
+    else:
+        key = (path, database_fingerprint(path), " ".join(sql.split()))
+        with _plans_lock:
+            cached = _plans.get(key)
+        if cached is None:
+            cached = _check(db, path, sql)
+            with _plans_lock:
+                _plans[key] = cached
+                while len(_plans) > PLAN_CACHE_SIZE:
+                    _plans.popitem(last=False)
+        plan, warning, kinds = cached
+    for kind in kinds:
+        metrics.inc("sql_assistant_plan_warnings_total", kind=kind)
+    return plan, warning
+
+
+# --- Asesor de indices --------------------------------------------------------
+
+def _columns(connection, table):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({_quote(table)})").fetchall()]
+
+
+def candidate_indexes(connection, sql, findings):
+    """Indices propuestos [(tabla, columnas)]: primero columnas de igualdad, luego rango y orden.
+
+    Si las columnas que la consulta usa de la tabla son pocas se incluyen todas
+    para que el indice sea covering y la consulta no tenga que leer la tabla.
+    """
+    candidates = []
+    for finding in findings:
+        table = finding["table"]
+        if finding["kind"] == "automatic_index":
+            columns = list(finding["columns"])
+        elif finding["kind"] == "scan":
+            columns = []
+        else:
+            continue
+        table_columns = _columns(connection, table)
+        names = "|".join(re.escape(c) for c in sorted(table_columns, key=len, reverse=True))
+        if not names:
+            continue
+        for op in (r"=|\bIN\b|\bIS\b", r"<=?|>=?|\bBETWEEN\b|\bLIKE\b"):
+            pattern = rf"(?:[\w\"]+\.)?\"?({names})\"?\s*(?:{op})"
+            for column in re.findall(pattern, sql, re.IGNORECASE):
+                column = next(c for c in table_columns if c.lower() == column.lower())
+                if column not in columns:
+                    columns.append(column)
+        order = re.search(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|$)", sql, re.IGNORECASE | re.DOTALL)
+        if order:
+            for column in re.findall(rf"\b({names})\b", order.group(1), re.IGNORECASE):
+                column = next(c for c in table_columns if c.lower() == column.lower())
+                if column not in columns:
+                    columns.append(column)
+        if not columns:
+            continue
+        used = [c for c in table_columns if re.search(rf"\b{re.escape(c)}\b", sql, re.IGNORECASE)]
+        covering = columns + [c for c in used if c not in columns]
+        if len(covering) <= MAX_INDEX_COLUMNS:
+            columns = covering
+        candidate = (table, tuple(columns[:MAX_INDEX_COLUMNS]))
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def _time_query(connection, sql, repeat, time_budget):
+    deadline = [0.0]
+    connection.set_progress_handler(lambda: int(time.monotonic() > deadline[0]), 10000)
+    timings = []
+    try:
+        for _ in range(repeat):
+            deadline[0] = time.monotonic() + time_budget
+            start = time.perf_counter()
+            try:
+                connection.execute(sql).fetchall()
+            except sqlite3.OperationalError as e:
+                if "interrupt" not in str(e):
+                    raise
+                return None
+            timings.append(time.perf_counter() - start)
+    finally:
+        connection.set_progress_handler(None, 0)
+    return sorted(timings)[len(timings) // 2]
+
+
+def advise_indexes(db_path, statements, repeat=3, time_budget=30.0):
+    """Propone indices para las consultas con avisos y mide su efecto en una copia.
+
+    La base original no se toca: se copia con la API de backup de SQLite a
+    SHADOW_DIR, se crea cada indice propuesto, se compara la mediana de tiempo y
+    el plan antes y despues, y se borra el indice. Devuelve una lista de dicts.
+    """
+    if is_remote(db_path):
+        raise ValueError("El asesor de indices necesita una copia local de la base")
+    SHADOW_DIR.mkdir(parents=True, exist_ok=True)
+    shadow_path = SHADOW_DIR / f"shadow-{os.getpid()}.sqlite"
+    source = sqlite3.connect(f"file:{os.path.realpath(db_path)}?mode=ro", uri=True)
+    shadow = sqlite3.connect(shadow_path)
+    report = []
+    try:
+        source.backup(shadow)
+        source.close()
+        seen = set()
+        for sql in statements:
+            sql = " ".join(str(sql).split()).rstrip(";")
+            if not sql or sql in seen:
+                continue
+            seen.add(sql)
+            try:
+                plan = explain(shadow, sql)
+            except sqlite3.Error:
+                continue
+            tables = [t for t in set(_plan_tables(plan, sql)) if t in _all_tables(shadow)]
+            counts = {t: value for t, (value, _) in estimate_row_counts(db_path, tables).items()}
+            counts.update({t: None for t in tables if t not in counts})
+            findings = analyze_plan(plan, counts, sql)
+            for table, columns in candidate_indexes(shadow, sql, findings):
+                name = f"advisor_{table}_{'_'.join(columns)}"
+                ddl = f"CREATE INDEX {_quote(name)} ON {_quote(table)}({', '.join(_quote(c) for c in columns)})"
+                before = _time_query(shadow, sql, repeat, time_budget)
+                start = time.perf_counter()
+                shadow.execute(ddl)
+                build = time.perf_counter() - start
+                after_plan = explain(shadow, sql)
+                after = _time_query(shadow, sql, repeat, time_budget)
+                shadow.execute(f"DROP INDEX {_quote(name)}")
+                report.append({
+                    "sql": sql,
+                    "index": ddl.replace(_quote(name), name, 1),
+                    "used": any(name in detail for _, _, detail in after_plan),
+                    "before_seconds": round(before, 6) if before is not None else None,
+                    "after_seconds": round(after, 6) if after is not None else None,
+                    "speedup": round(before / after, 2) if before and after else None,
+                    "build_seconds": round(build, 4),
+                    "plan_before": [d for _, _, d in plan],
+                    "plan_after": [d for _, _, d in after_plan],
+                })
+    finally:
+        shadow.close()
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            try:
+                os.remove(f"{shadow_path}{suffix}")
+            except FileNotFoundError:
+                pass
+    return report
+
+
+def _all_tables(connection):
+    return {r[0] for r in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def load_statements(path):
+    """SQL de un JSONL de resultados de batch (campo sql) o de un .sql separado por ';'"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            statements = []
+            for line in f:
+                if line.strip():
+                    sql = json.loads(line).get("sql") or []
+                    statements.extend(sql if isinstance(sql, list) else [sql])
+            return statements
+        return [s for s in f.read().split(";") if s.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asesor de indices sobre una copia de la base")
+    parser.add_argument("--db", required=True, help="Archivo SQLite")
+    parser.add_argument("--queries", required=True, help="Resultados de batch (.jsonl) o archivo .sql")
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones por medicion (se usa la mediana)")
+    parser.add_argument("--output", help="Archivo JSON para el reporte")
+    args = parser.parse_args()
+
+    report = advise_indexes(args.db, load_statements(args.queries), repeat=args.repeat)
+    if not report:
+        print("Ninguna consulta necesita indices nuevos")
+    for item in report:
+        speedup = f"x{item['speedup']}" if item["speedup"] else "sin medicion"
+        print(f"\n{item['sql']}\n  {item['index']}\n  "
+              f"{item['before_seconds']}s -> {item['after_seconds']}s ({speedup}), usado: {item['used']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
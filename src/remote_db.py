@@ -0,0 +1,544 @@
+import ctypes
+import ctypes.util
+import hashlib
+import http.client
+import os
+import posixpath
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler
+
+from acquisition import DOWNLOAD_ATTEMPTS, DOWNLOAD_TIMEOUT, SQLITE_HEADER, AcquisitionError
+from instrumentation import metrics
+
+VFS_NAME = "httprange"
+# Prefijo de las rutas virtuales: no existe en disco, solo lo resuelve el VFS
+REMOTE_ROOT = "/.http-range"
+BLOCK_SIZE = int(os.getenv("REMOTE_BLOCK_KB", "64")) * 1024
+CACHE_BYTES = int(os.getenv("REMOTE_CACHE_MB", "64")) * 1024 * 1024
+MAX_READAHEAD = int(os.getenv("REMOTE_MAX_READAHEAD", "16"))
+
+SQLITE_OK = 0
+SQLITE_IOERR = 10
+SQLITE_READONLY = 8
+SQLITE_NOTFOUND = 12
+SQLITE_CANTOPEN = 14
+SQLITE_IOERR_SHORT_READ = 522
+SQLITE_OPEN_READONLY = 0x00000001
+SQLITE_OPEN_MAIN_DB = 0x00000100
+SQLITE_IOCAP_IMMUTABLE = 0x00002000
+
+
+class RangeReader:
+    """Lee un archivo remoto por bloques con peticiones HTTP Range.
+
+    Los bloques se guardan en una LRU acotada en bytes. Cuando las lecturas son
+    secuenciales (un recorrido de tabla o de indice) la ventana de lectura
+    anticipada se duplica hasta MAX_READAHEAD bloques por peticion; un acceso
+    aleatorio la devuelve a un bloque. El ETag de la primera respuesta fija la
+    version: si el objeto cambia a mitad de sesion se aborta en lugar de mezclar
+    paginas de dos versiones.
+    """
+
+    def __init__(self, url, block_size=BLOCK_SIZE, cache_bytes=CACHE_BYTES, max_readahead=MAX_READAHEAD):
+        self.url = url
+        self.block_size = block_size
+        self.cache_bytes = cache_bytes
+        self.max_readahead = max_readahead
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_block = None
+        self._readahead = 1
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.hits = 0
+        self.misses = 0
+        self._probe()
+
+    def _probe(self):
+        """Primera peticion: tamaño total, ETag, URL final tras redirecciones y el bloque 0"""
+        request = urllib.request.Request(self.url, headers={"Range": f"bytes=0-{self.block_size - 1}"})
+        try:
+            with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status != 206:
+                    raise AcquisitionError("El servidor no admite peticiones Range; use la descarga completa")
+                content_range = response.headers.get("Content-Range", "")
+                self.size = int(content_range.rsplit("/", 1)[1])
+                self.etag = response.headers.get("ETag")
+                self.version = self.etag or response.headers.get("Last-Modified") or str(self.size)
+                self.final_url = response.geturl()
+                data = response.read()
+        except (urllib.error.URLError, OSError, ValueError, IndexError) as e:
+            raise AcquisitionError(f"No se pudo abrir la base remota: {e}") from e
+        self._account(len(data))
+        if not data.startswith(SQLITE_HEADER):
+            raise AcquisitionError(f"El recurso '{self.url}' no es una base de datos SQLite")
+        self._store(0, data)
+
+    def _connection(self):
+        """Conexion keep-alive por hilo: cada lectura no paga un handshake TCP/TLS"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parts = urllib.parse.urlsplit(self.final_url)
+            cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = self._local.conn = cls(parts.netloc, timeout=DOWNLOAD_TIMEOUT)
+        return conn
+
+    def _get_range(self, start, end):
+        parts = urllib.parse.urlsplit(self.final_url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self.etag:
+            headers["If-Match"] = self.etag
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            conn = self._connection()
+            try:
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt == DOWNLOAD_ATTEMPTS - 1:
+                    raise AcquisitionError(f"Error leyendo {self.url}: {e}") from e
+                time.sleep(2 ** attempt)
+                continue
+            if response.status == 412 or (self.etag and response.getheader("ETag", self.etag) != self.etag):
+                raise AcquisitionError(f"La base remota {self.url} cambio durante la sesion")
+            if response.status != 206:
+                raise AcquisitionError(f"Respuesta inesperada {response.status} leyendo {self.url}")
+            self._account(len(data))
+            return data
+
+    def _account(self, size):
+        self.requests += 1
+        self.bytes_fetched += size
+        metrics.inc("sql_assistant_remote_requests_total")
+        metrics.inc("sql_assistant_remote_bytes_total", size)
+
+    def _store(self, index, data):
+        with self._lock:
+            self._blocks[index] = data
+            self._blocks.move_to_end(index)
+            while len(self._blocks) * self.block_size > self.cache_bytes and len(self._blocks) > 1:
+                self._blocks.popitem(last=False)
+
+    def _block(self, index):
+        with self._lock:
+            data = self._blocks.get(index)
+            if data is not None:
+                self._blocks.move_to_end(index)
+                self.hits += 1
+            else:
+                self.misses += 1
+            sequential = self._last_block is not None and index == self._last_block + 1
+            self._last_block = index
+            if data is not None:
+                return data
+            self._readahead = min(self._readahead * 2, self.max_readahead) if sequential else 1
+            count = self._readahead
+            # No volver a pedir bloques que ya estan en cache
+            last = index
+            while last + 1 < index + count and (last + 1) not in self._blocks:
+                last += 1
+        start = index * self.block_size
+        end = min((last + 1) * self.block_size, self.size) - 1
+        data = self._get_range(start, end)
+        for offset in range(0, len(data), self.block_size):
+            self._store(index + offset // self.block_size, data[offset:offset + self.block_size])
+        return data[:self.block_size]
+
+    def read(self, offset, amount):
+        """Bytes [offset, offset + amount) del archivo remoto (menos si se pasa del final)"""
+        end = min(offset + amount, self.size)
+        chunks = []
+        position = offset
+        while position < end:
+            index, inner = divmod(position, self.block_size)
+            block = self._block(index)
+            piece = block[inner:inner + end - position]
+            if not piece:
+                break
+            chunks.append(piece)
+            position += len(piece)
+        return b"".join(chunks)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "requests": self.requests,
+            "bytes_fetched": self.bytes_fetched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_bytes": sum(len(b) for b in self._blocks.values()),
+        }
+
+    def close(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def remote_path(url):
+    """Ruta virtual estable para una URL; es la identidad de la base en engines y caches"""
+    name = posixpath.basename(urllib.parse.urlsplit(url).path) or "remote.sqlite"
+    return f"{REMOTE_ROOT}/{hashlib.sha1(url.encode()).hexdigest()[:16]}/{name}"
+
+
+def is_remote(path):
+    return str(path).startswith(REMOTE_ROOT + "/")
+
+
+def canonical_path(path):
+    """realpath para archivos locales; las rutas remotas son virtuales y se dejan igual"""
+    return path if is_remote(path) else os.path.realpath(path)
+
+
+def open_remote(url):
+    """Registra la URL para lectura por rangos y devuelve su ruta virtual"""
+    _ensure_vfs()
+    path = remote_path(url)
+    with _readers_lock:
+        if path not in _readers:
+            _readers[path] = RangeReader(url)
+    return path
+
+
+def get_reader(path):
+    return _readers.get(path)
+
+
+def sqlite_uri(path):
+    """URI de solo lectura para sqlite3; las rutas remotas usan el VFS por rangos"""
+    if is_remote(path):
+        return f"file:{path}?mode=ro&vfs={VFS_NAME}&immutable=1"
+    return f"file:{path}?mode=ro"
+
+
+def remote_version(path):
+    reader = _readers.get(path)
+    return reader.version if reader else "-"
+
+
+def close_remote(path):
+    with _readers_lock:
+        reader = _readers.pop(path, None)
+    if reader is not None:
+        reader.close()
+
+
+# --- VFS de SQLite via ctypes -------------------------------------------------
+#
+# El modulo sqlite3 no permite registrar un VFS, pero en las compilaciones donde
+# _sqlite3 enlaza libsqlite3 dinamicamente podemos registrarlo en esa misma
+# biblioteca y abrir la base con "?vfs=httprange" desde sqlite3/SQLAlchemy.
+
+class _File(ctypes.Structure):
+    _fields_ = [("pMethods", ctypes.c_void_p), ("handle", ctypes.c_int64)]
+
+
+_FilePtr = ctypes.POINTER(_File)
+_x_close = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr)
+_x_read = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.c_void_p, ctypes.c_int, ctypes.c_int64)
+_x_write = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.c_void_p, ctypes.c_int, ctypes.c_int64)
+_x_truncate = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.c_int64)
+_x_int_arg = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.c_int)
+_x_file_size = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.POINTER(ctypes.c_int64))
+_x_int_out = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.POINTER(ctypes.c_int))
+_x_file_control = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr, ctypes.c_int, ctypes.c_void_p)
+_x_no_arg = ctypes.CFUNCTYPE(ctypes.c_int, _FilePtr)
+
+
+class _IOMethods(ctypes.Structure):
+    _fields_ = [
+        ("iVersion", ctypes.c_int),
+        ("xClose", _x_close),
+        ("xRead", _x_read),
+        ("xWrite", _x_write),
+        ("xTruncate", _x_truncate),
+        ("xSync", _x_int_arg),
+        ("xFileSize", _x_file_size),
+        ("xLock", _x_int_arg),
+        ("xUnlock", _x_int_arg),
+        ("xCheckReservedLock", _x_int_out),
+        ("xFileControl", _x_file_control),
+        ("xSectorSize", _x_no_arg),
+        ("xDeviceCharacteristics", _x_no_arg),
+    ]
+
+
+_v_open = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int,
+                           ctypes.POINTER(ctypes.c_int))
+_v_delete = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int)
+_v_access = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int,
+                             ctypes.POINTER(ctypes.c_int))
+_v_full_pathname = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_void_p)
+_v_randomness = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p)
+_v_sleep = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+_v_current_time = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_double))
+_v_last_error = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p)
+
+
+class _VFS(ctypes.Structure):
+    _fields_ = [
+        ("iVersion", ctypes.c_int),
+        ("szOsFile", ctypes.c_int),
+        ("mxPathname", ctypes.c_int),
+        ("pNext", ctypes.c_void_p),
+        ("zName", ctypes.c_char_p),
+        ("pAppData", ctypes.c_void_p),
+        ("xOpen", _v_open),
+        ("xDelete", _v_delete),
+        ("xAccess", _v_access),
+        ("xFullPathname", _v_full_pathname),
+        ("xDlOpen", ctypes.c_void_p),
+        ("xDlError", ctypes.c_void_p),
+        ("xDlSym", ctypes.c_void_p),
+        ("xDlClose", ctypes.c_void_p),
+        ("xRandomness", _v_randomness),
+        ("xSleep", _v_sleep),
+        ("xCurrentTime", _v_current_time),
+        ("xGetLastError", _v_last_error),
+    ]
+
+
+_open_files = {}
+_next_handle = [0]
+_vfs_state = {}
+_vfs_lock = threading.Lock()
+
+
+def _file_reader(file, files=_open_files):
+    return files.get(file.contents.handle)
+
+
+def _io_close(file, files=_open_files):
+    files.pop(file.contents.handle, None)
+    return SQLITE_OK
+
+
+def _io_read(file, buffer, amount, offset):
+    try:
+        data = _file_reader(file).read(offset, amount)
+    except Exception as e:
+        print(f" Error de lectura remota: {e}")
+        return SQLITE_IOERR
+    ctypes.memmove(buffer, data, len(data))
+    if len(data) < amount:
+        ctypes.memset(buffer + len(data), 0, amount - len(data))
+        return SQLITE_IOERR_SHORT_READ
+    return SQLITE_OK
+
+
+def _io_file_size(file, size):
+    size[0] = _file_reader(file).size
+    return SQLITE_OK
+
+
+def _io_reserved_lock(file, out):
+    out[0] = 0
+    return SQLITE_OK
+
+
+_io_methods = _IOMethods(
+    1,
+    _x_close(_io_close),
+    _x_read(_io_read),
+    _x_write(lambda file, buffer, amount, offset: SQLITE_READONLY),
+    _x_truncate(lambda file, size: SQLITE_READONLY),
+    _x_int_arg(lambda file, flags: SQLITE_OK),
+    _x_file_size(_io_file_size),
+    _x_int_arg(lambda file, level: SQLITE_OK),
+    _x_int_arg(lambda file, level: SQLITE_OK),
+    _x_int_out(_io_reserved_lock),
+    _x_file_control(lambda file, op, arg: SQLITE_NOTFOUND),
+    _x_no_arg(lambda file: 4096),
+    _x_no_arg(lambda file: SQLITE_IOCAP_IMMUTABLE),
+)
+
+
+def _vfs_open(vfs, name, file, flags, out_flags):
+    if not flags & SQLITE_OPEN_MAIN_DB:
+        # Ficheros temporales y journals: los gestiona el VFS por defecto
+        default = _vfs_state["default"]
+        return default.xOpen(_vfs_state["default_ptr"], name, file, flags, out_flags)
+    path = ctypes.string_at(name).decode() if name else ""
+    reader = _readers.get(path)
+    if reader is None:
+        return SQLITE_CANTOPEN
+    with _vfs_lock:
+        _next_handle[0] += 1
+        handle = _next_handle[0]
+        _open_files[handle] = reader
+    target = ctypes.cast(file, _FilePtr).contents
+    target.handle = handle
+    target.pMethods = ctypes.addressof(_io_methods)
+    if out_flags:
+        out_flags[0] = SQLITE_OPEN_READONLY
+    return SQLITE_OK
+
+
+def _vfs_access(vfs, name, flags, out):
+    out[0] = 1 if name and name.decode() in _readers else 0
+    return SQLITE_OK
+
+
+def _vfs_full_pathname(vfs, name, size, out):
+    ctypes.memmove(out, name + b"\x00", min(len(name) + 1, size))
+    return SQLITE_OK
+
+
+def _vfs_randomness(vfs, size, out):
+    ctypes.memmove(out, os.urandom(size), size)
+    return size
+
+
+def _vfs_sleep(vfs, microseconds):
+    time.sleep(microseconds / 1e6)
+    return microseconds
+
+
+def _vfs_current_time(vfs, out):
+    out[0] = time.time() / 86400.0 + 2440587.5
+    return SQLITE_OK
+
+
+def _load_sqlite_library():
+    """La libsqlite3 que usa el modulo sqlite3 (no una copia distinta)"""
+    import _sqlite3
+    for candidate in (_sqlite3.__file__, ctypes.util.find_library("sqlite3")):
+        if not candidate:
+            continue
+        try:
+            lib = ctypes.CDLL(candidate)
+            lib.sqlite3_vfs_register
+            return lib
+        except (OSError, AttributeError):
+            continue
+    return None
+
+
+def _ensure_vfs():
+    with _vfs_lock:
+        if "vfs" in _vfs_state:
+            return
+        lib = _load_sqlite_library()
+        if lib is None:
+            raise AcquisitionError("Esta instalacion de Python no permite el modo remoto; use la descarga completa")
+        lib.sqlite3_vfs_find.restype = ctypes.POINTER(_VFS)
+        lib.sqlite3_vfs_find.argtypes = [ctypes.c_char_p]
+        lib.sqlite3_vfs_register.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        default_ptr = lib.sqlite3_vfs_find(None)
+        vfs = _VFS(
+            1,
+            max(ctypes.sizeof(_File), default_ptr.contents.szOsFile),
+            1024,
+            None,
+            VFS_NAME.encode(),
+            None,
+            _v_open(_vfs_open),
+            _v_delete(lambda vfs, name, sync_dir: SQLITE_OK),
+            _v_access(_vfs_access),
+            _v_full_pathname(_vfs_full_pathname),
+            None, None, None, None,
+            _v_randomness(_vfs_randomness),
+            _v_sleep(_vfs_sleep),
+            _v_current_time(_vfs_current_time),
+            _v_last_error(lambda vfs, size, out: SQLITE_OK),
+        )
+        _vfs_state.update(lib=lib, vfs=vfs, default=default_ptr.contents, default_ptr=default_ptr)
+        # SQLite guarda punteros a estas estructuras hasta que el proceso termina; si el
+        # interprete las liberase antes de cerrar la ultima conexion, xClose saltaria a
+        # memoria liberada. Se retienen a proposito.
+        for obj in (vfs, _io_methods, _open_files, _readers):
+            ctypes.pythonapi.Py_IncRef(ctypes.py_object(obj))
+        lib.sqlite3_vfs_register(ctypes.addressof(vfs), 0)
+    # Si _sqlite3 lleva su propia copia estatica de SQLite el registro no le llega
+    try:
+        sqlite3.connect(f"file:{REMOTE_ROOT}/probe?mode=ro&vfs={VFS_NAME}", uri=True).close()
+    except sqlite3.OperationalError as e:
+        if "no such vfs" in str(e):
+            with _vfs_lock:
+                _vfs_state.clear()
+            raise AcquisitionError("Esta instalacion de Python no permite el modo remoto; use la descarga completa")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Servidor estatico con soporte de Range (http.server no lo trae), para pruebas locales.
+
+    python src/remote_db.py <directorio> [puerto]
+    """
+
+    def _etag(self, path):
+        st = os.stat(path)
+        return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+    def send_head(self):
+        header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        etag = self._etag(path)
+        size = os.path.getsize(path)
+        if_range = self.headers.get("If-Range")
+        if not header or not header.startswith("bytes=") or (if_range and if_range != etag):
+            # Archivo completo, con ETag para que el cliente pueda retomar con If-Range
+            self.send_response(200)
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(size))
+            self.send_header("ETag", etag)
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            return open(path, "rb")
+        first, _, last = header[len("bytes="):].partition("-")
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start >= size:
+            self.send_error(416)
+            return None
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        f = open(path, "rb")
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self._remaining = None
+
+
+if __name__ == "__main__":
+    import functools
+    import sys
+    from http.server import ThreadingHTTPServer
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else "."
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    handler = functools.partial(RangeRequestHandler, directory=directory)
+    print(f"Sirviendo {directory} con soporte de Range en http://127.0.0.1:{port}/")
+    ThreadingHTTPServer(("127.0.0.1", port), handler).serve_forever()
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db_version
+from column_profiles import column_profiler
+from engine import dispose_engine
+from remote_db import close_remote
+
+
+class DatabaseResources:
+    """Recursos asociados a una base de datos: archivo, SQLDatabase, engine, estadisticas y agentes"""
+
+    def __init__(self, path, db, tables, stats, owns_file=True):
+        self.path = os.path.abspath(path)
+        self.db = db
+        self.engine = getattr(db, "_engine", None)
+        self.tables = tables
+        self.stats = stats
+        self.owns_file = owns_file
+        self.agents = {}
+        self.last_used = time.monotonic()
+
+    def release(self):
+        """Libera el engine y borra el archivo temporal si nos pertenece"""
+        self.agents.clear()
+        if self.stats is not None:
+            self.stats.cancel()
+        dispose_engine(self.path)
+        db_version.forget(self.path)
+        close_remote(self.path)
+        column_profiler.forget(self.path)
+        if self.owns_file:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class ResourceCache:
+    """Cache LRU con expiracion por inactividad, compartida entre reruns y sesiones.
+
+    Las entradas se indexan por el hash del contenido de la base de datos, asi
+    que subir o descargar dos veces el mismo archivo reutiliza los recursos.
+    """
+
+    def __init__(self, max_entries=4, max_idle=30 * 60):
+        self.max_entries = max_entries
+        self.max_idle = max_idle
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_or_load(self, key, loader):
+        """Devuelve la entrada de key o la crea con loader() (que puede devolver None)"""
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        # Un lock por clave: dos sesiones cargando el mismo archivo no lo procesan dos veces
+        with self._key_lock(key):
+            entry = self.get(key)
+            if entry is None:
+                entry = loader()
+                if entry is not None:
+                    self.put(key, entry)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None and old is not entry:
+                self._release(old, keep_path=entry.path)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._release(evicted)
+        return entry
+
+    def get_agent(self, key, config, factory):
+        """Devuelve el agente de la entrada key para config, creandolo una sola vez"""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        with self._key_lock(key):
+            agent = entry.agents.get(config)
+            if agent is None:
+                agent = factory(entry)
+                if agent is not None:
+                    entry.agents[config] = agent
+            return agent
+
+    def evict(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._key_locks.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self.evict(key)
+
+    def _evict_idle(self):
+        if not self.max_idle:
+            return
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if now - e.last_used > self.max_idle]:
+            self._release(self._entries.pop(key))
+            self._key_locks.pop(key, None)
+
+    def _release(self, entry, keep_path=None):
+        if keep_path is not None and entry.path == keep_path:
+            entry.owns_file = False
+        entry.release()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Instancia compartida por todo el proceso (los modulos importados sobreviven a los reruns)
+resource_cache = ResourceCache(
+    max_entries=int(os.getenv("DB_CACHE_MAX_ENTRIES", "4")),
+    max_idle=int(os.getenv("DB_CACHE_MAX_IDLE", str(30 * 60))),
+)
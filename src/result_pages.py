@@ -0,0 +1,182 @@
+import csv
+import importlib.util
+import io
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from db_version import database_fingerprint, database_path
+from guarded_query import fetch_limited
+
+PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "50"))
+EXPORT_MAX_ROWS = int(os.getenv("RESULT_EXPORT_MAX_ROWS", "100000"))
+EXPORT_MAX_BYTES = int(os.getenv("RESULT_EXPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+MAX_PAGE_SIZE = 1000
+# Paginas recientes en memoria: un rerun de Streamlit no vuelve a consultar la base
+PAGE_CACHE_SIZE = 64
+
+_pages = OrderedDict()
+_pages_lock = threading.Lock()
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+
+
+class ResultUnavailable(Exception):
+    pass
+
+
+def final_query(result):
+    """SQL de la ultima consulta del agente que no fallo (truncada tambien sirve), o None"""
+    for action, observation in reversed((result or {}).get("intermediate_steps") or []):
+        if getattr(action, "tool", None) == "sql_db_query" and not str(observation).startswith("Error"):
+            return str(action.tool_input)
+    return None
+
+
+def result_reference(db, sql, params=None):
+    """Referencia liviana al resultado de una respuesta: se guarda en el mensaje en lugar de las filas.
+
+    Solo se aceptan consultas de lectura; las paginas se piden a la base cuando
+    se muestran (fetch_page), asi que el historial no crece con los resultados.
+    """
+    if not sql:
+        return None
+    sql = sql.strip().rstrip(";").strip()
+    if not _READ_ONLY.match(_COMMENT.sub(" ", sql)):
+        return None
+    path = database_path(db)
+    return {"path": path, "sql": sql, "params": list(params or ()), "data": database_fingerprint(path)}
+
+
+def is_stale(reference):
+    """True si los datos cambiaron desde la respuesta: las paginas ya no son las que vio el agente"""
+    return database_fingerprint(reference["path"]) != reference["data"]
+
+
+def _wrapped(reference, prefix, suffix=""):
+    # El salto de linea evita que un comentario al final de la consulta se coma el parentesis
+    return f"{prefix} FROM ({reference['sql']}\n){suffix}"
+
+
+def _cache_key(reference, *extra):
+    return (reference["path"], database_fingerprint(reference["path"]), reference["sql"],
+            tuple(reference["params"]), *extra)
+
+
+def _cached(key, compute):
+    with _pages_lock:
+        if key in _pages:
+            _pages.move_to_end(key)
+            return _pages[key]
+    value = compute()
+    with _pages_lock:
+        _pages[key] = value
+        while len(_pages) > PAGE_CACHE_SIZE:
+            _pages.popitem(last=False)
+    return value
+
+
+def _run(db, sql, params, max_rows, max_bytes=None):
+    try:
+        return fetch_limited(db._engine, sql, params, max_rows=max_rows,
+                             max_bytes=max_bytes or db.max_bytes, time_budget=db.time_budget)
+    except sqlite3.Error as e:
+        raise ResultUnavailable(str(e)) from e
+
+
+def fetch_page(db, reference, page=0, page_size=PAGE_SIZE):
+    """Una pagina del resultado: {"columns", "rows", "offset", "more"}.
+
+    Se lee una fila de mas para saber si hay pagina siguiente sin contar el
+    total. La consulta corre con el tope de tiempo de la base.
+    """
+    if database_path(db) != reference["path"]:
+        raise ResultUnavailable("El resultado pertenece a otra base de datos")
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    offset = max(page, 0) * page_size
+
+    def compute():
+        columns, rows, _ = _run(
+            db, _wrapped(reference, "SELECT *", " LIMIT ? OFFSET ?"),
+            [*reference["params"], page_size + 1, offset], page_size + 1,
+        )
+        return {"columns": columns, "rows": rows[:page_size], "offset": offset, "more": len(rows) > page_size}
+
+    return _cached(_cache_key(reference, offset, page_size), compute)
+
+
+def count_rows(db, reference):
+    """Total de filas del resultado, o None si el COUNT supera el tope de tiempo"""
+    if database_path(db) != reference["path"]:
+        return None
+
+    def compute():
+        try:
+            return _run(db, _wrapped(reference, "SELECT COUNT(*)"), reference["params"], 1)[1][0][0]
+        except ResultUnavailable:
+            return None
+
+    return _cached(_cache_key(reference, "count"), compute)
+
+
+def page_frame(page):
+    """DataFrame de pandas con las filas de una pagina"""
+    # Importacion diferida: pandas solo hace falta al mostrar resultados
+    import pandas as pd
+
+    columns = _unique_columns(page["columns"])
+    return pd.DataFrame.from_records(page["rows"], columns=columns)
+
+
+def _unique_columns(columns):
+    # Un JOIN puede repetir nombres de columna; pandas y Arrow necesitan nombres unicos
+    seen = {}
+    names = []
+    for column in columns:
+        seen[column] = seen.get(column, 0) + 1
+        names.append(column if seen[column] == 1 else f"{column}_{seen[column]}")
+    return names
+
+
+def _export_rows(db, reference, max_rows):
+    columns, rows, truncated = _run(
+        db, _wrapped(reference, "SELECT *"), reference["params"], max_rows, EXPORT_MAX_BYTES
+    )
+    return _unique_columns(columns), rows, truncated
+
+
+def export_csv(db, reference, max_rows=EXPORT_MAX_ROWS):
+    """(bytes CSV en UTF-8, truncado) del resultado completo, hasta max_rows filas"""
+    columns, rows, truncated = _export_rows(db, reference, max_rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8"), truncated
+
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_parquet(db, reference, max_rows=EXPORT_MAX_ROWS):
+    """(bytes Parquet, truncado) del resultado completo; requiere pyarrow"""
+    # Importacion diferida: pyarrow es opcional y pesado
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns, rows, truncated = _export_rows(db, reference, max_rows)
+    arrays = []
+    for values in (zip(*rows) if rows else [()] * len(columns)):
+        values = list(values)
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # SQLite admite tipos mezclados en una columna; Arrow no
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_arrays(arrays, names=columns), buffer)
+    return buffer.getvalue(), truncated
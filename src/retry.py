@@ -0,0 +1,89 @@
+import asyncio
+import random
+import re
+import time
+
+from streaming import AgentCancelled
+
+# Clave de entrada con la lista de pasos ya ejecutados (se comparte entre intentos)
+CHECKPOINT_KEY = "resume_steps"
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+
+def is_rate_limit(exc):
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError" or "rate limit" in str(exc).lower()
+
+
+def _parse_duration(value):
+    """Segundos de '12', '1.5' o del formato de Groq '2m59.56s' / '120ms'"""
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total or None
+
+
+def retry_after(exc):
+    """Espera pedida por el endpoint (Retry-After o x-ratelimit-reset-*), si la hay"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if header in headers:
+            seconds = _parse_duration(headers[header])
+            if seconds:
+                return seconds
+    return None
+
+
+def retry_delay(exc, attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Backoff exponencial con jitter completo; respeta la espera pedida en un 429"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if is_rate_limit(exc):
+        requested = retry_after(exc)
+        if requested is not None:
+            delay = min(cap, requested) + random.uniform(0, base)
+        else:
+            delay = max(delay, base * 2 ** attempt)
+    return delay
+
+
+def invoke_with_retry(agent_executor, inputs, max_retries=3, config=None):
+    """Invoca el agente reintentando con backoff y retomando los pasos completados"""
+    checkpoint = []
+    inputs = {**inputs, CHECKPOINT_KEY: checkpoint}
+    for attempt in range(max_retries):
+        try:
+            result = agent_executor.invoke(inputs, config=config)
+            result.pop(CHECKPOINT_KEY, None)
+            return result
+        except AgentCancelled:
+            # Una cancelacion del usuario no es un fallo transitorio
+            raise
+        except Exception as e:
+            print(f" Error en intento {attempt + 1}: {e}")
+            if attempt == max_retries - 1:
+                raise
+            delay = retry_delay(e, attempt)
+            print(f" Reintentando en {delay:.1f}s desde el paso {len(checkpoint)}")
+            time.sleep(delay)
+
+
+async def ainvoke_with_retry(agent_executor, inputs, max_retries=3, config=None):
+    checkpoint = []
+    inputs = {**inputs, CHECKPOINT_KEY: checkpoint}
+    for attempt in range(max_retries):
+        try:
+            result = await agent_executor.ainvoke(inputs, config=config)
+            result.pop(CHECKPOINT_KEY, None)
+            return result
+        except AgentCancelled:
+            raise
+        except Exception as e:
+            if attempt == max_retries - 1:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from langchain_community.utilities import SQLDatabase
+
+from db_version import database_fingerprint, database_path
+
+CACHE_DIR = Path(os.getenv("SQL_ASSISTANT_CACHE_DIR", Path.home() / ".cache" / "sqlite_assistant"))
+
+
+class SchemaCache:
+    """Cache en memoria y en disco del esquema renderizado (DDL + filas de ejemplo).
+
+    Cada archivo SQLite tiene un sidecar JSON en CACHE_DIR/schema que guarda la
+    huella de la base (ver db_version) y el texto de get_table_info por tabla.
+    Si la huella cambia el sidecar se descarta.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR / "schema"):
+        self.cache_dir = Path(cache_dir)
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _sidecar(self, path):
+        name = hashlib.sha1(path.encode()).hexdigest()
+        return self.cache_dir / f"{name}.json"
+
+    def _entry(self, path):
+        fingerprint = database_fingerprint(path)
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                entry = self._read(path, fingerprint)
+                self._memory[path] = entry
+            return entry
+
+    def _read(self, path, fingerprint):
+        try:
+            with open(self._sidecar(path), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") == fingerprint:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"fingerprint": fingerprint, "tables": {}}
+
+    def _write(self, path, entry):
+        sidecar = self._sidecar(path)
+        try:
+            sidecar.parent.mkdir(parents=True, exist_ok=True)
+            tmp = sidecar.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, sidecar)
+        except OSError:
+            # Sin disco escribible seguimos con la cache en memoria
+            pass
+
+    def table_infos(self, db, tables, render):
+        """Devuelve {tabla: info} usando render(tabla) solo para las que faltan"""
+        path = database_path(db)
+        entry = self._entry(path)
+        missing = [t for t in tables if t not in entry["tables"]]
+        if missing:
+            for table in missing:
+                entry["tables"][table] = render(table)
+            self._write(path, entry)
+        return {t: entry["tables"][t] for t in tables}
+
+    def invalidate(self, db):
+        path = database_path(db)
+        with self._lock:
+            self._memory.pop(path, None)
+        try:
+            os.remove(self._sidecar(path))
+        except OSError:
+            pass
+
+
+schema_cache = SchemaCache()
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase que resuelve get_table_info desde la cache de esquemas.
+
+    La reflexion de SQLAlchemy es perezosa: solo se reflejan las tablas que no
+    estan en la cache. Lo usan tanto el prompt como la herramienta sql_db_schema.
+    """
+
+    def __init__(self, engine, cache=None, **kwargs):
+        kwargs.setdefault("lazy_table_reflection", True)
+        super().__init__(engine, **kwargs)
+        self.schema_cache = cache or schema_cache
+
+    def get_table_info(self, table_names=None):
+        all_tables = self.get_usable_table_names()
+        if table_names is None:
+            table_names = all_tables
+        missing_tables = set(table_names).difference(all_tables)
+        if missing_tables:
+            raise ValueError(f"table_names {missing_tables} not found in database")
+        infos = self.schema_cache.table_infos(
+            self, list(table_names), lambda table: super(CachedSQLDatabase, self).get_table_info([table])
+        )
+        return "\n\n".join(infos[t] for t in table_names)
@@ -0,0 +1,161 @@
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+
+from column_profiles import column_profiler, profile_section
+from db_version import database_path, schema_version
+from engine import get_engine
+
+SAMPLE_ROWS = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Peso del nombre de la tabla frente a columnas y valores de ejemplo
+TABLE_NAME_WEIGHT = 3
+FK_DECAY = 0.5
+CONTEXT_CACHE_SIZE = 256
+
+
+def tokenize(text):
+    """Tokens normalizados: sin acentos, camelCase/snake_case separados y truncados.
+
+    Truncar a 5 caracteres es un stemming barato que acerca preguntas en
+    castellano a nombres en ingles ("artistas" / "Artist", "clientes" / "Client").
+    """
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return [t[:5] for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1]
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class SchemaIndex:
+    """Indice BM25 local sobre tablas, columnas, claves foraneas y valores de ejemplo"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.documents = {}
+        self.foreign_keys = defaultdict(set)
+        self._build()
+
+    def _build(self):
+        conn = get_engine(self.db_path).raw_connection()
+        try:
+            tables = [r[0] for r in conn.cursor().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            for table in tables:
+                tokens = tokenize(table) * TABLE_NAME_WEIGHT
+                quoted = table.replace('"', '""')
+                try:
+                    for col in conn.cursor().execute(f'PRAGMA table_info("{quoted}")'):
+                        tokens += tokenize(col[1])
+                    for fk in conn.cursor().execute(f'PRAGMA foreign_key_list("{quoted}")'):
+                        tokens += tokenize(fk[2])
+                        self.foreign_keys[table].add(fk[2])
+                        self.foreign_keys[fk[2]].add(table)
+                    for row in conn.cursor().execute(f'SELECT * FROM "{quoted}" LIMIT {SAMPLE_ROWS}'):
+                        for value in row:
+                            if isinstance(value, str):
+                                tokens += tokenize(value[:50])
+                except sqlite3.Error:
+                    pass
+                self.documents[table] = Counter(tokens)
+        finally:
+            conn.close()
+        self.avg_length = sum(sum(d.values()) for d in self.documents.values()) / max(len(self.documents), 1)
+        self.doc_freq = Counter(t for d in self.documents.values() for t in d)
+
+    def score(self, question, expand=True):
+        terms = set(tokenize(question))
+        n = len(self.documents)
+        scores = {}
+        for table, doc in self.documents.items():
+            length = sum(doc.values())
+            total = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if not tf:
+                    continue
+                df = self.doc_freq[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                total += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length))
+            if total > 0:
+                scores[table] = total
+        if not expand:
+            return scores
+        # Las tablas vecinas por FK suelen hacer falta para los JOIN
+        for table, value in list(scores.items()):
+            for neighbour in self.foreign_keys.get(table, ()):
+                if neighbour in self.documents:
+                    scores[neighbour] = max(scores.get(neighbour, 0.0), value * FK_DECAY)
+        return scores
+
+    def select_tables(self, question, k=5):
+        scores = self.score(question)
+        if not scores:
+            # Sin coincidencias: las tablas mas conectadas del esquema
+            scores = {t: len(self.foreign_keys.get(t, ())) for t in self.documents}
+        return sorted(scores, key=lambda t: (-scores[t], t))[:k]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_schema_index(db):
+    """Indice de la base, reconstruido solo si cambia PRAGMA schema_version"""
+    path = database_path(db)
+    key = (path, schema_version(path))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            for old in [k for k in _indexes if k[0] == path]:
+                del _indexes[old]
+            index = _indexes[key] = SchemaIndex(path)
+        return index
+
+
+_contexts = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def schema_context(db, question, k=5, token_budget=1500):
+    """Esquemas de las tablas relevantes para la pregunta dentro de un presupuesto de tokens"""
+    path = database_path(db)
+    # La clave usa la ruta y no el objeto: la cache no retiene bases que resource_cache ya libero.
+    # Los perfiles de columnas se recalculan en segundo plano; su version invalida el texto cacheado
+    key = (path, schema_version(path), column_profiler.version(path), question, k, token_budget)
+    with _contexts_lock:
+        if key in _contexts:
+            _contexts.move_to_end(key)
+            return _contexts[key]
+    text = _schema_context(db, question, k, token_budget)
+    with _contexts_lock:
+        _contexts[key] = text
+        while len(_contexts) > CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return text
+
+
+def _schema_context(db, question, k, token_budget):
+    sections = []
+    used = 0
+    for table in get_schema_index(db).select_tables(question, k):
+        try:
+            section = f"Tabla {table}:\n{db.get_table_info([table])}"
+            values = profile_section(db, table)
+            if values:
+                section = f"{section}\n{values}"
+        except Exception:
+            section = f"Tabla {table}: (esquema no disponible)"
+        cost = estimate_tokens(section)
+        if sections and used + cost > token_budget:
+            break
+        sections.append(section)
+        used += cost
+    return "\n\n".join(sections)
@@ -0,0 +1,643 @@
+"""Servicio HTTP sin interfaz: muchas sesiones concurrentes sobre bases registradas.
+
+Uso:
+    python src/service.py --db chinook=Chinook_Sqlite.sqlite --port 8000
+    python src/service.py --db chinook=Chinook_Sqlite.sqlite --stub-llm      # sin Groq, para pruebas
+    uvicorn service:app                                                       # con SERVICE_DATABASES=nombre=ruta,...
+
+Endpoints (JSON):
+    GET    /health                 estado, bases y cola
+    GET    /metrics                metricas en formato Prometheus
+    GET    /databases              bases registradas
+    POST   /databases              {"name", "path"} (solo con --allow-register)
+    POST   /sessions               {"database"} -> {"session"}
+    DELETE /sessions/{id}
+    POST   /questions              {"database", "question", "session"?, "wait"?, "timeout"?}
+    GET    /questions/{id}         estado y resultado
+    GET    /questions/{id}/rows    filas del resultado por paginas (?page=&size=) o ?format=csv|parquet
+    DELETE /questions/{id}         cancela una pregunta en cola o en curso
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote
+
+from answer_cache import answer_cache
+from batch import _sql_statements
+from column_profiles import column_profiler
+from engine import get_engine
+from fast_path import answer_from_template, learn_template
+from guarded_query import GuardedSQLDatabase
+from instrumentation import metrics, trace_question
+from remote_db import open_remote
+from result_pages import (
+    PAGE_SIZE, ResultUnavailable, count_rows, export_csv, export_parquet, fetch_page, final_query,
+    result_reference,
+)
+from retry import invoke_with_retry
+from schema_index import get_schema_index
+from streaming import AgentCancelled, CancelHandler
+from table_stats import get_table_stats
+from tool_cache import ToolMemo, tool_session
+
+WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))
+# Preguntas en espera por encima de las que estan corriendo; mas alla se responde 429
+MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", "64"))
+MAX_PER_SESSION = int(os.getenv("SERVICE_MAX_PER_SESSION", "2"))
+TIMEOUT = float(os.getenv("SERVICE_TIMEOUT", "120"))
+SESSION_TTL = float(os.getenv("SERVICE_SESSION_TTL", "3600"))
+# Preguntas terminadas que se conservan para GET /questions/{id}
+JOB_RETENTION = 1000
+
+
+class ServiceError(Exception):
+    """Error con codigo HTTP para la respuesta"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+
+class DatabaseEntry:
+    """Estado compartido de una base: engine, SQLDatabase, caches del esquema y el agente.
+
+    Todas las sesiones usan el mismo agente; lo que es propio de cada una (memoria
+    de herramientas, traza) viaja por contextvars, como en la app.
+    """
+
+    def __init__(self, name, path, agent_factory):
+        self.name = name
+        self.path = open_remote(path) if path.lower().startswith(("http://", "https://")) else path
+        self.source = path
+        self.db = GuardedSQLDatabase(get_engine(self.path))
+        self._agent_factory = agent_factory
+        self._agent = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Estadisticas, perfiles de columnas, indice del esquema y agente listos antes de la primera pregunta"""
+        tables = self.db.get_usable_table_names()
+        get_table_stats(self.path, tables)
+        column_profiler.profiles(self.db)
+        get_schema_index(self.db)
+        return self.agent
+
+    @property
+    def agent(self):
+        with self._lock:
+            if self._agent is None:
+                self._agent = self._agent_factory(self.db)
+            return self._agent
+
+    def to_dict(self):
+        return {"name": self.name, "source": self.source, "tables": self.db.get_usable_table_names(),
+                "agent_ready": self._agent is not None}
+
+
+class Session:
+    def __init__(self, database):
+        self.id = uuid.uuid4().hex
+        self.database = database
+        self.memo = ToolMemo()
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+class Job:
+    def __init__(self, entry, session, question):
+        self.id = uuid.uuid4().hex
+        self.entry = entry
+        self.session = session
+        self.question = question
+        self.status = "queued"
+        self.result = None
+        self.reference = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_handler = CancelHandler()
+        self.task = None
+        self.reserved = False
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "database": self.entry.name,
+            "session": self.session.id if self.session else None,
+            "question": self.question,
+            "status": self.status,
+            "queued_seconds": round((self.started or time.time()) - self.created, 4),
+        }
+        if self.finished and self.started:
+            data["seconds"] = round(self.finished - self.started, 4)
+        if self.error:
+            data["error"] = self.error
+        if self.result is not None:
+            data.update(self.result)
+        if self.reference:
+            data["rows_url"] = f"/questions/{self.id}/rows"
+        return data
+
+
+def answer_question(entry, question, memo, callbacks):
+    """Cache de respuestas, plantillas y, si no alcanzan, el agente compartido de la base"""
+    with trace_question(question) as trace, tool_session(memo):
+        cached = answer_cache.lookup_answer(entry.db, question)
+        fast = None if cached else answer_from_template(entry.db, question)
+        if cached:
+            result = {"output": cached["output"], "sql": [cached["sql"]], "cached": True}
+            reference = result_reference(entry.db, cached["sql"])
+        elif fast:
+            result = {"output": fast["output"], "sql": [fast["sql"]], "fast_path": True}
+            reference = result_reference(entry.db, fast["sql"], fast["params"])
+        else:
+            response = invoke_with_retry(
+                entry.agent, {"input": question, "chat_history": []},
+                config={"callbacks": [trace.handler, *callbacks]},
+            )
+            answer_cache.store_answer(entry.db, question, response)
+            learn_template(entry.db, question, response)
+            result = {"output": response.get("output"), "sql": _sql_statements(response)}
+            reference = result_reference(entry.db, final_query(response))
+    result["metrics"] = trace.to_dict()
+    # Las filas no viajan en la respuesta: se piden por paginas a /questions/{id}/rows
+    return result, reference
+
+
+class WorkerPool:
+    """Hilos acotados para el agente con control de admision.
+
+    Como mucho `workers` preguntas corren a la vez y `max_queue` esperan; por
+    encima se rechaza (429) en lugar de acumular latencia. Expone la profundidad
+    de la cola y las preguntas en curso como gauges.
+    """
+
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service-worker")
+        self.waiting = 0
+        self.running = 0
+        self._slots = None
+
+    def _gauges(self):
+        metrics.set("sql_assistant_service_queue_depth", self.waiting)
+        metrics.set("sql_assistant_service_running", self.running)
+
+    def admit(self, job):
+        """Reserva un lugar en la cola al aceptar la pregunta, antes de que su tarea arranque"""
+        if self.waiting >= self.max_queue + max(self.workers - self.running, 0):
+            metrics.inc("sql_assistant_service_rejected_total", reason="queue_full")
+            raise ServiceError(429, f"Cola llena ({self.waiting} preguntas en espera)", [(b"retry-after", b"5")])
+        self.waiting += 1
+        job.reserved = True
+        self._gauges()
+
+    def release(self, job):
+        if job.reserved:
+            job.reserved = False
+            self.waiting -= 1
+            self._gauges()
+
+    async def run(self, job, function, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.release(job)
+        self.running += 1
+        self._gauges()
+        job.status = "running"
+        job.started = time.time()
+        metrics.observe("sql_assistant_service_wait_seconds", job.started - job.created)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self._gauges()
+
+    def stats(self):
+        return {"workers": self.workers, "running": self.running, "waiting": self.waiting, "max_queue": self.max_queue}
+
+
+class QueryService:
+    """Bases registradas, sesiones y preguntas en curso sobre un WorkerPool"""
+
+    def __init__(self, agent_factory, workers=WORKERS, max_queue=MAX_QUEUE, max_per_session=MAX_PER_SESSION,
+                 allow_register=False):
+        self.agent_factory = agent_factory
+        self.pool = WorkerPool(workers, max_queue)
+        self.max_per_session = max_per_session
+        self.allow_register = allow_register
+        self.databases = {}
+        self.sessions = {}
+        self.jobs = OrderedDict()
+
+    def register(self, name, path):
+        if name in self.databases:
+            raise ServiceError(409, f"La base {name} ya esta registrada")
+        entry = self.databases[name] = DatabaseEntry(name, path, self.agent_factory)
+        return entry
+
+    def _database(self, name):
+        entry = self.databases.get(name)
+        if entry is None:
+            raise ServiceError(404, f"Base no registrada: {name}")
+        return entry
+
+    def _expire_sessions(self):
+        now = time.monotonic()
+        for session_id in [s.id for s in self.sessions.values() if not s.active and now - s.last_used > SESSION_TTL]:
+            del self.sessions[session_id]
+
+    def open_session(self, database):
+        self._expire_sessions()
+        session = Session(self._database(database))
+        self.sessions[session.id] = session
+        return session
+
+    def close_session(self, session_id):
+        if self.sessions.pop(session_id, None) is None:
+            raise ServiceError(404, "Sesion inexistente")
+
+    def job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, "Pregunta inexistente")
+        return job
+
+    def submit(self, database, question, session_id=None):
+        """Encola una pregunta; el resultado queda en job.task"""
+        entry = self._database(database)
+        session = None
+        if session_id:
+            session = self.sessions.get(session_id)
+            if session is None or session.database is not entry:
+                raise ServiceError(404, "Sesion inexistente para esa base")
+            if session.active >= self.max_per_session:
+                metrics.inc("sql_assistant_service_rejected_total", reason="session_limit")
+                raise ServiceError(429, f"La sesion ya tiene {session.active} preguntas en curso", [(b"retry-after", b"1")])
+        job = Job(entry, session, question)
+        self.pool.admit(job)
+        if session:
+            session.active += 1
+            session.last_used = time.monotonic()
+        self.jobs[job.id] = job
+        while len(self.jobs) > JOB_RETENTION:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.finished is None:
+                break
+            self.jobs.popitem(last=False)
+        job.task = asyncio.ensure_future(self._execute(job))
+        # El cierre va en un callback: corre aunque la tarea se cancele antes de arrancar
+        job.task.add_done_callback(lambda task: self._finish(job, task))
+        return job
+
+    async def _execute(self, job):
+        memo = job.session.memo if job.session else ToolMemo()
+        try:
+            job.result, job.reference = await self.pool.run(
+                job, answer_question, job.entry, job.question, memo, [job.cancel_handler]
+            )
+            job.status = "done"
+        except AgentCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+
+    def _finish(self, job, task):
+        if task.cancelled():
+            job.status = "cancelled"
+        self.pool.release(job)
+        job.finished = time.time()
+        if job.session:
+            job.session.active -= 1
+            job.session.last_used = time.monotonic()
+        metrics.inc("sql_assistant_service_questions_total", status=job.status)
+        if job.started:
+            metrics.observe("sql_assistant_service_question_seconds", job.finished - job.started)
+
+    def cancel(self, job):
+        """En cola se descarta enseguida; en curso se corta en el siguiente callback del agente"""
+        if job.finished is not None:
+            return job
+        job.cancel_handler.cancel()
+        if job.status == "queued" and job.task is not None:
+            job.task.cancel()
+        return job
+
+    def stats(self):
+        return {"pool": self.pool.stats(), "sessions": len(self.sessions),
+                "databases": sorted(self.databases), "jobs": len(self.jobs)}
+
+
+# --- ASGI ------------------------------------------------------------------------
+
+def _json_response(status, data, headers=()):
+    body = json.dumps(data, ensure_ascii=False, default=str).encode()
+    return status, [(b"content-type", b"application/json; charset=utf-8"), *headers], body
+
+
+class ServiceApp:
+    """Aplicacion ASGI del servicio; sirve con uvicorn o con serve() de este modulo"""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise ValueError
+        except ValueError:
+            status, headers, content = _json_response(400, {"error": "El cuerpo debe ser un objeto JSON"})
+        else:
+            try:
+                status, headers, content = await self.route(scope, payload, receive)
+            except ServiceError as e:
+                status, headers, content = _json_response(e.status, {"error": str(e)}, e.headers)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def route(self, scope, payload, receive):
+        method = scope["method"]
+        parts = [p for p in scope["path"].split("/") if p]
+        query = parse_qs(scope.get("query_string", b"").decode())
+        service = self.service
+
+        if parts == ["health"] and method == "GET":
+            return _json_response(200, {"status": "ok", **service.stats()})
+        if parts == ["metrics"] and method == "GET":
+            return 200, [(b"content-type", b"text/plain; version=0.0.4")], metrics.render().encode()
+        if parts == ["databases"]:
+            if method == "GET":
+                return _json_response(200, [e.to_dict() for e in service.databases.values()])
+            if method == "POST":
+                if not service.allow_register:
+                    raise ServiceError(403, "Registro de bases deshabilitado (usar --allow-register)")
+                if not payload.get("name") or not payload.get("path"):
+                    raise ServiceError(400, "Faltan name y path")
+                entry = service.register(payload["name"], payload["path"])
+                await asyncio.get_running_loop().run_in_executor(service.pool.executor, entry.warm)
+                return _json_response(201, entry.to_dict())
+        if parts == ["sessions"] and method == "POST":
+            session = service.open_session(payload.get("database", ""))
+            return _json_response(201, {"session": session.id, "database": session.database.name})
+        if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            service.close_session(parts[1])
+            return _json_response(200, {"session": parts[1], "status": "closed"})
+        if parts == ["questions"] and method == "POST":
+            question = str(payload.get("question") or "").strip()
+            if not question:
+                raise ServiceError(400, "Falta question")
+            job = service.submit(payload.get("database", ""), question, payload.get("session"))
+            if not payload.get("wait", True):
+                return _json_response(202, job.to_dict())
+            return await self._wait(job, float(payload.get("timeout") or TIMEOUT), receive)
+        if len(parts) == 2 and parts[0] == "questions":
+            job = service.job(parts[1])
+            if method == "GET":
+                wait = float(query.get("wait", ["0"])[0])
+                if wait and job.finished is None:
+                    await asyncio.wait({job.task}, timeout=wait)
+                return _json_response(200, job.to_dict())
+            if method == "DELETE":
+                service.cancel(job)
+                if job.task is not None:
+                    await asyncio.wait({job.task}, timeout=5)
+                return _json_response(200, job.to_dict())
+        if len(parts) == 3 and parts[0] == "questions" and parts[2] == "rows" and method == "GET":
+            return await self._rows(service.job(parts[1]), query)
+        raise ServiceError(404 if method in ("GET", "POST", "DELETE") else 405, f"{method} {scope['path']} no existe")
+
+    async def _rows(self, job, query):
+        """Una pagina del resultado, leida de la base al pedirla, o el resultado completo exportado"""
+        if job.reference is None:
+            raise ServiceError(404, "La pregunta no tiene un resultado tabular")
+        db = job.entry.db
+        export_format = query.get("format", [""])[0]
+        loop = asyncio.get_running_loop()
+        try:
+            if export_format in ("csv", "parquet"):
+                export = export_csv if export_format == "csv" else export_parquet
+                try:
+                    data, truncated = await loop.run_in_executor(None, export, db, job.reference)
+                except ImportError:
+                    raise ServiceError(501, "La exportacion a Parquet requiere pyarrow")
+                content_type = b"text/csv; charset=utf-8" if export_format == "csv" else b"application/vnd.apache.parquet"
+                headers = [(b"content-type", content_type), (b"x-truncated", str(truncated).lower().encode())]
+                return 200, headers, data
+            if export_format:
+                raise ServiceError(400, "format debe ser csv o parquet")
+            try:
+                page = int(query.get("page", ["0"])[0])
+                size = int(query.get("size", [str(PAGE_SIZE)])[0])
+            except ValueError:
+                raise ServiceError(400, "page y size deben ser enteros")
+            data = await loop.run_in_executor(None, fetch_page, db, job.reference, page, size)
+            total = await loop.run_in_executor(None, count_rows, db, job.reference)
+        except ResultUnavailable as e:
+            raise ServiceError(409, str(e))
+        return _json_response(200, {**data, "page": page, "total": total})
+
+    async def _wait(self, job, timeout, receive):
+        """Espera el resultado; si el cliente se desconecta o vence el plazo, la pregunta se cancela"""
+        disconnect = asyncio.ensure_future(receive())
+        try:
+            done, _ = await asyncio.wait({job.task, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        if job.task in done:
+            status = {"done": 200, "cancelled": 409, "error": 500}[job.status]
+            return _json_response(status, job.to_dict())
+        self.service.cancel(job)
+        if disconnect in done:
+            # Nadie espera la respuesta: no hace falta esperar a que el agente se detenga
+            metrics.inc("sql_assistant_service_disconnects_total")
+            return _json_response(499, job.to_dict())
+        await asyncio.wait({job.task}, timeout=5)
+        return _json_response(504, {**job.to_dict(), "error": f"Sin respuesta tras {timeout:g}s"})
+
+
+# --- Servidor HTTP minimo ------------------------------------------------------------
+
+async def _handle_connection(app, reader, writer):
+    """Una peticion HTTP/1.1 por conexion (Connection: close), suficiente para pruebas locales"""
+    try:
+        request_line = await reader.readline()
+        if not request_line:
+            return
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers.append((name.strip().lower().encode(), value.strip().encode("latin-1")))
+        length = int(dict(headers).get(b"content-length", b"0") or 0)
+        body = await reader.readexactly(length) if length else b""
+        path, _, query_string = target.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+            "method": method.upper(), "path": unquote(path), "raw_path": path.encode(),
+            "query_string": query_string.encode(), "headers": headers, "root_path": "",
+            "client": writer.get_extra_info("peername"), "server": writer.get_extra_info("sockname"),
+        }
+        delivered = False
+
+        async def receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Sin mas cuerpo: la siguiente lectura solo termina cuando el cliente cierra
+            await reader.read()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                reason = {200: "OK", 201: "Created", 202: "Accepted"}.get(message["status"], "")
+                writer.write(f"HTTP/1.1 {message['status']} {reason}\r\n".encode())
+                for name, value in message.get("headers", []):
+                    writer.write(name + b": " + value + b"\r\n")
+                writer.write(b"connection: close\r\n\r\n")
+            elif message["type"] == "http.response.body":
+                writer.write(message.get("body", b""))
+                await writer.drain()
+
+        await app(scope, receive, send)
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(app, host="127.0.0.1", port=8000):
+    server = await asyncio.start_server(lambda r, w: _handle_connection(app, r, w), host, port)
+    print(f" Servicio en http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+# --- Arranque ------------------------------------------------------------------------
+
+def groq_agent_factory(db):
+    # Importacion diferida: modelo2 solo hace falta para construir agentes
+    import modelo2
+
+    agent_executor, _ = modelo2.create_sql_agent(db=db)
+    agent_executor.verbose = False
+    return agent_executor
+
+
+def stub_agent_factory(latency=0.0):
+    """Agente con el LLM guionado del benchmark: sin red ni clave de Groq"""
+    import modelo2
+    from benchmark import SCRIPTS, ScriptedChatModel
+
+    scripts = {question: steps for shape in SCRIPTS.values() for question, steps in shape.items()}
+
+    def factory(db):
+        # Preguntas fuera del guion: lista las tablas y responde con la observacion
+        llm = ScriptedChatModel(scripts=scripts, default=[("sql_db_list_tables", "")], latency=latency)
+        agent_executor, _ = modelo2.create_sql_agent(db=db, llm=llm)
+        agent_executor.verbose = False
+        return agent_executor
+
+    return factory
+
+
+def build_service(databases, stub_llm=False, stub_latency=0.0, **kwargs):
+    """databases: [(nombre, ruta o URL)]; cada base se registra y se calienta antes de servir"""
+    factory = stub_agent_factory(stub_latency) if stub_llm else groq_agent_factory
+    service = QueryService(factory, **kwargs)
+    for name, path in databases:
+        service.register(name, path).warm()
+    return service
+
+
+def _parse_databases(values):
+    databases = []
+    for value in values:
+        name, sep, path = value.partition("=")
+        if not sep or not name or not path:
+            raise SystemExit(f"--db espera nombre=ruta, no {value!r}")
+        databases.append((name.strip(), path.strip()))
+    return databases
+
+
+def _env_app():
+    """App para `uvicorn service:app`, configurada con SERVICE_DATABASES y SERVICE_STUB_LLM"""
+    databases = _parse_databases(v for v in os.getenv("SERVICE_DATABASES", "").split(",") if v.strip())
+    service = build_service(databases, stub_llm=os.getenv("SERVICE_STUB_LLM") == "1",
+                            allow_register=os.getenv("SERVICE_ALLOW_REGISTER") == "1")
+    return ServiceApp(service)
+
+
+def __getattr__(name):
+    # `app` se construye al pedirlo, asi importar el modulo no carga bases ni agentes
+    if name == "app":
+        globals()["app"] = _env_app()
+        return globals()["app"]
+    raise AttributeError(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP multi-sesion del agente SQL")
+    parser.add_argument("--db", action="append", default=[], help="Base a servir como nombre=ruta (o URL); repetible")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Preguntas en paralelo")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="Preguntas en espera antes de responder 429")
+    parser.add_argument("--max-per-session", type=int, default=MAX_PER_SESSION, help="Preguntas en curso por sesion")
+    parser.add_argument("--allow-register", action="store_true", help="Permitir POST /databases")
+    parser.add_argument("--stub-llm", action="store_true", help="LLM guionado local en lugar de Groq")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Segundos por llamada del LLM guionado")
+    args = parser.parse_args()
+
+    service = build_service(
+        _parse_databases(args.db), stub_llm=args.stub_llm, stub_latency=args.stub_latency,
+        workers=args.workers, max_queue=args.max_queue, max_per_session=args.max_per_session,
+        allow_register=args.allow_register,
+    )
+    app = ServiceApp(service)
+    try:
+        import uvicorn
+    except ImportError:
+        asyncio.run(serve(app, args.host, args.port))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
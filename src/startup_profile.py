@@ -0,0 +1,204 @@
+import argparse
+import importlib.abc
+import json
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_TARGET = str(ROOT / "app.py")
+# Dependencias que deben cargarse solo si se usan (LoRA, cliente de Groq, agente)
+OPTIONAL_MODULES = ["torch", "peft", "langchain_groq", "langchain.agents", "langchain_community.agent_toolkits"]
+
+
+def _rss():
+    """RSS actual en bytes (/proc en Linux; en otros sistemas el pico de ru_maxrss)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Envuelve el loader de un modulo para medir su ejecucion"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.exit(module.__name__)
+            # Algunas librerias inspeccionan el loader: se deja el original
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Tiempo y memoria de cada import, acumulado (con submodulos) y propio.
+
+    Se instala al principio de sys.meta_path y delega la busqueda en los demas
+    finders; solo cambia el loader por uno que mide exec_module.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._stack = []
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), _rss(), 0.0, 0])
+
+    def exit(self, name):
+        _, start, rss, child_seconds, child_bytes = self._stack.pop()
+        seconds = time.perf_counter() - start
+        rss_bytes = _rss() - rss
+        self.records[name] = {
+            "module": name,
+            "seconds": seconds,
+            "self_seconds": seconds - child_seconds,
+            "rss_bytes": rss_bytes,
+            "self_rss_bytes": rss_bytes - child_bytes,
+            "parent": self._stack[-1][0] if self._stack else None,
+        }
+        if self._stack:
+            self._stack[-1][3] += seconds
+            self._stack[-1][4] += rss_bytes
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+
+def profile_target(target):
+    """Importa target (modulo o archivo .py) en este proceso y devuelve el reporte"""
+    sys.path.insert(0, str(ROOT / "src"))
+    profiler = ImportProfiler()
+    rss_start = _rss()
+    start = time.perf_counter()
+    profiler.install()
+    error = None
+    try:
+        if target.endswith(".py"):
+            sys.path.insert(0, str(Path(target).resolve().parent))
+            # run_name distinto de __main__: no se ejecuta el CLI del script
+            runpy.run_path(target, run_name="__startup_profile__")
+        else:
+            __import__(target)
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        profiler.uninstall()
+    return {
+        "target": target,
+        "python": sys.version.split()[0],
+        "seconds": time.perf_counter() - start,
+        "rss_start_bytes": rss_start,
+        "rss_end_bytes": _rss(),
+        "error": error,
+        "optional_loaded": [m for m in OPTIONAL_MODULES if m in sys.modules],
+        "modules": sorted(profiler.records.values(), key=lambda r: -r["seconds"]),
+    }
+
+
+def by_package(modules):
+    """Costo propio sumado por paquete de primer nivel"""
+    packages = {}
+    for record in modules:
+        package = packages.setdefault(record["module"].split(".")[0], {"seconds": 0.0, "rss_bytes": 0, "modules": 0})
+        package["seconds"] += record["self_seconds"]
+        package["rss_bytes"] += record["self_rss_bytes"]
+        package["modules"] += 1
+    return sorted(packages.items(), key=lambda item: -item[1]["seconds"])
+
+
+def run_child(target, env=None):
+    """Perfil en un interprete nuevo: sin modulos ya importados ni caches del proceso actual"""
+    completed = subprocess.run(
+        [sys.executable, __file__, "--child", target],
+        capture_output=True,
+        text=True,
+        env={**os.environ, **(env or {})},
+        cwd=ROOT,
+    )
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        raise RuntimeError(f"El perfil de {target} fallo:\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def _mb(value):
+    return value / 1024 / 1024
+
+
+def print_report(report, top=25):
+    print(f"\n>> {report['target']} (Python {report['python']})")
+    print(f"   Arranque: {report['seconds']:.2f}s, RSS {_mb(report['rss_start_bytes']):.0f} -> "
+          f"{_mb(report['rss_end_bytes']):.0f} MB")
+    if report["error"]:
+        print(f"   Error al importar: {report['error']}")
+    loaded = ", ".join(report["optional_loaded"]) or "ninguno"
+    print(f"   Modulos opcionales cargados: {loaded}")
+
+    print(f"\n   {'paquete':<32} {'propio s':>9} {'MB':>8} {'modulos':>8}")
+    for name, package in by_package(report["modules"])[:top]:
+        print(f"   {name:<32} {package['seconds']:>9.3f} {_mb(package['rss_bytes']):>8.1f} {package['modules']:>8}")
+
+    print(f"\n   {'modulo':<48} {'total s':>8} {'propio s':>9} {'MB':>8}")
+    for record in report["modules"][:top]:
+        print(f"   {record['module'][:48]:<48} {record['seconds']:>8.3f} {record['self_seconds']:>9.3f} "
+              f"{_mb(record['rss_bytes']):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importacion y memoria por modulo en un arranque en frio")
+    parser.add_argument("targets", nargs="*", default=[DEFAULT_TARGET],
+                        help="Modulos o archivos .py a importar (por defecto app.py)")
+    parser.add_argument("--top", type=int, default=25, help="Filas por tabla")
+    parser.add_argument("--output", help="Guardar los reportes en JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(profile_target(args.targets[0])))
+        return
+
+    reports = [run_child(target) for target in args.targets]
+    for report in reports:
+        print_report(report, args.top)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n Reportes en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
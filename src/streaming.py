@@ -0,0 +1,131 @@
+import contextvars
+import queue
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+MAX_OBSERVATION_CHARS = 500
+
+
+class AgentCancelled(Exception):
+    """La consulta fue cancelada por el usuario"""
+
+
+class CancelHandler(BaseCallbackHandler):
+    """Corta el agente en el siguiente callback (LLM, accion o herramienta) despues de cancel()"""
+
+    raise_error = True
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def _check(self):
+        if self.cancelled.is_set():
+            raise AgentCancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._check()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._check()
+
+    def on_agent_action(self, action, **kwargs):
+        self._check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._check()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    """Publica tokens, acciones y observaciones del agente en una cola.
+
+    Cancelar activa un evento que se revisa en cada callback: la siguiente
+    llamada lanza AgentCancelled y corta el bucle ReAct.
+    """
+
+    raise_error = True
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def _emit(self, kind, value):
+        if self.cancelled.is_set():
+            raise AgentCancelled()
+        self.events.put((kind, value))
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._emit("token", token)
+
+    def on_agent_action(self, action, **kwargs):
+        self._emit("action", action)
+
+    def on_tool_end(self, output, **kwargs):
+        self._emit("observation", str(output))
+
+    def on_agent_finish(self, finish, **kwargs):
+        self.events.put(("final", finish.return_values.get("output", "")))
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class AgentStream:
+    """Ejecuta el agente en un hilo y expone sus eventos como un generador"""
+
+    def __init__(self, agent, inputs, callbacks=None):
+        self.handler = StreamingCallbackHandler()
+        self.callbacks = [self.handler] + list(callbacks or [])
+        self.result = None
+        self.error = None
+        # El hilo hereda el contexto (por ejemplo la traza de instrumentation)
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run, agent, inputs), daemon=True)
+        self._thread.start()
+
+    def _run(self, agent, inputs):
+        try:
+            self.result = agent.invoke(inputs, config={"callbacks": self.callbacks})
+        except Exception as e:
+            self.error = e
+        finally:
+            self.handler.events.put(("end", None))
+
+    def events(self):
+        """Genera (tipo, valor); si el consumidor se detiene, cancela el agente"""
+        try:
+            while True:
+                kind, value = self.handler.events.get()
+                if kind == "end":
+                    return
+                yield kind, value
+        finally:
+            if self._thread.is_alive():
+                self.handler.cancel()
+
+    def text(self):
+        """Eventos renderizados como markdown, listo para st.write_stream"""
+        for kind, value in self.events():
+            if kind == "token":
+                yield value
+            elif kind == "action":
+                yield f"\n\n**{value.tool}**\n```sql\n{str(value.tool_input).strip()}\n```\n"
+            elif kind == "observation":
+                shown = value if len(value) <= MAX_OBSERVATION_CHARS else value[:MAX_OBSERVATION_CHARS] + "..."
+                yield f"\n```\n{shown}\n```\n\n"
+
+    def cancel(self):
+        self.handler.cancel()
+
+    @property
+    def output(self):
+        if self.error is not None:
+            raise self.error
+        return self.result["output"] if self.result else None
+
+
+def stream_agent(agent, inputs, callbacks=None):
+    return AgentStream(agent, inputs, callbacks)
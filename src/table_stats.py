@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db_version import database_fingerprint
+from engine import get_engine
+from remote_db import canonical_path, is_remote
+
+# Por encima de este tamaño dbstat lee demasiadas paginas para ser una estimacion "instantanea"
+DBSTAT_MAX_BYTES = 256 * 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TABLE_STATS_WORKERS", "4")), thread_name_prefix="table-stats")
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _connect(db_path):
+    """Conexion del pool compartido (solo lectura); close() la devuelve al pool"""
+    return get_engine(db_path).raw_connection()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def estimate_row_counts(db_path, tables):
+    """Estimaciones baratas del numero de filas: {tabla: (valor, origen)}.
+
+    Orden de preferencia: sqlite_stat1 (si se corrio ANALYZE), MAX(rowid) que se
+    resuelve con una busqueda en el indice, y dbstat para archivos pequeños.
+    """
+    estimates = {}
+    conn = _connect(db_path)
+    try:
+        try:
+            for table, stat in conn.cursor().execute("SELECT tbl, stat FROM sqlite_stat1"):
+                if table in tables and stat:
+                    estimates[table] = (int(stat.split()[0]), "sqlite_stat1")
+        except sqlite3.Error:
+            pass
+        for table in tables:
+            if table in estimates:
+                continue
+            try:
+                value = conn.cursor().execute(f"SELECT MAX(rowid) FROM {_quote(table)}").fetchone()[0]
+                estimates[table] = (value or 0, "rowid")
+            except sqlite3.Error:
+                pass
+        missing = [t for t in tables if t not in estimates]
+        if missing and not is_remote(db_path) and os.path.getsize(db_path) <= DBSTAT_MAX_BYTES:
+            try:
+                rows = conn.cursor().execute(
+                    "SELECT name, SUM(ncell) FROM dbstat WHERE pagetype = 'leaf' GROUP BY name"
+                ).fetchall()
+                for table, cells in rows:
+                    if table in missing:
+                        estimates[table] = (cells, "dbstat")
+            except sqlite3.Error:
+                # SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB
+                pass
+    finally:
+        conn.close()
+    return estimates
+
+
+def exact_row_count(db_path, table):
+    conn = _connect(db_path)
+    try:
+        return conn.cursor().execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TableStats:
+    """Conteos de filas de todas las tablas: estimados al instante y exactos en segundo plano"""
+
+    def __init__(self, db_path, tables):
+        self.db_path = db_path
+        self.tables = list(tables)
+        self.estimates = estimate_row_counts(db_path, self.tables)
+        self.exact = {}
+        # En una base remota un COUNT(*) exacto descargaria la tabla entera
+        self.counting = not is_remote(db_path)
+        self._futures = {table: _executor.submit(self._count, table) for table in self.tables} if self.counting else {}
+
+    def _count(self, table):
+        try:
+            self.exact[table] = exact_row_count(self.db_path, table)
+        except sqlite3.Error:
+            self.exact[table] = "Error"
+        return self.exact[table]
+
+    @property
+    def done(self):
+        return not self.counting or len(self.exact) == len(self.tables)
+
+    def describe(self, table):
+        """Texto para mostrar: exacto si ya se conoce, si no la estimacion"""
+        if table in self.exact:
+            value = self.exact[table]
+            return f"{value} registros" if value != "Error" else "Error"
+        if table in self.estimates:
+            return f"~{self.estimates[table][0]} registros (estimado)"
+        return "calculando..."
+
+    def counts(self):
+        """{tabla: filas}; exactas si ya se conocen, si no la estimacion (None si no hay ninguna)"""
+        counts = {}
+        for table in self.tables:
+            exact = self.exact.get(table)
+            counts[table] = exact if isinstance(exact, int) else self.estimates.get(table, (None,))[0]
+        return counts
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+
+
+def get_table_stats(db_path, tables):
+    """Estadisticas de la base, reutilizadas mientras no cambie su huella (data_version)"""
+    db_path = canonical_path(db_path)
+    key = database_fingerprint(db_path)
+    with _stats_lock:
+        stats = _stats.get(key)
+        if stats is None:
+            for old_key in [k for k, s in _stats.items() if s.db_path == db_path]:
+                _stats.pop(old_key).cancel()
+            stats = _stats[key] = TableStats(db_path, tables)
+        return stats
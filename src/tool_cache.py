@@ -0,0 +1,123 @@
+import contextvars
+import json
+import os
+from contextlib import contextmanager
+
+from langchain_core.tools import BaseTool
+from pydantic import Field
+
+from answer_cache import TTLCache, normalize_sql
+from db_version import database_fingerprint, database_path
+from instrumentation import record_cache
+
+MAX_ENTRIES = int(os.getenv("TOOL_MEMO_MAX_ENTRIES", "256"))
+TTL = float(os.getenv("TOOL_MEMO_TTL", "3600"))
+
+# Herramientas cuyo resultado depende de la entrada y de la base (sql_db_schema incluye filas de ejemplo).
+# sql_db_query no entra: su resultado ya lo cachea answer_cache por huella de datos.
+MEMOIZED_TOOLS = {"sql_db_list_tables", "sql_db_schema", "sql_db_query_checker"}
+
+_current_memo = contextvars.ContextVar("sql_assistant_tool_memo", default=None)
+
+
+def _normalize_input(tool_name, tool_input):
+    if tool_name == "sql_db_schema":
+        return ",".join(sorted(t.strip() for t in str(tool_input).split(",") if t.strip()))
+    if tool_name == "sql_db_query_checker":
+        return normalize_sql(tool_input)
+    if tool_name == "sql_db_list_tables":
+        return ""
+    return tool_input
+
+
+class ToolMemo:
+    """Resultados de herramientas de una sesion (un chat de Streamlit o una corrida del CLI).
+
+    Vive solo en memoria: LRU con expiracion para que una sesion larga no crezca
+    sin limite. La clave incluye la huella de la base (esquema y datos, ver
+    db_version), asi una escritura invalida las entradas sin borrarlas explicitamente.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.cache = TTLCache("tools", ttl=ttl, max_entries=max_entries, store_path=None)
+
+    def key(self, db, tool_name, tool_input):
+        path = database_path(db)
+        return json.dumps(
+            [tool_name, path, database_fingerprint(path), _normalize_input(tool_name, tool_input)],
+            default=str,
+        )
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, value):
+        self.cache.put(key, value)
+
+
+@contextmanager
+def tool_session(memo):
+    """Activa la memoria de herramientas de la sesion para las llamadas del agente en este contexto"""
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+
+
+def current_memo():
+    return _current_memo.get()
+
+
+class MemoizedTool(BaseTool):
+    """Envuelve una herramienta del toolkit y reutiliza su resultado dentro de la sesion.
+
+    Los agentes se comparten entre sesiones (resource_cache), asi que la memoria no
+    es un atributo de la herramienta: se toma del contexto (tool_session). Sin
+    sesion activa la herramienta se comporta igual que la original.
+    """
+
+    tool: BaseTool = Field(exclude=True)
+    db: object = Field(exclude=True)
+
+    def __init__(self, tool, db):
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            tool=tool,
+            db=db,
+        )
+
+    def _lookup(self, args, kwargs):
+        memo = current_memo()
+        if memo is None:
+            return None, None, None
+        tool_input = args[0] if len(args) == 1 and not kwargs else (kwargs or list(args))
+        key = memo.key(self.db, self.name, tool_input)
+        value = memo.get(key)
+        record_cache("tools", value is not None)
+        return memo, key, value
+
+    def _run(self, *args, run_manager=None, **kwargs):
+        memo, key, value = self._lookup(args, kwargs)
+        if value is not None:
+            return value
+        # Se llama al _run interno para no disparar dos veces los callbacks de la herramienta
+        value = self.tool._run(*args, run_manager=run_manager, **kwargs)
+        if memo is not None:
+            memo.put(key, value)
+        return value
+
+    async def _arun(self, *args, run_manager=None, **kwargs):
+        memo, key, value = self._lookup(args, kwargs)
+        if value is not None:
+            return value
+        value = await self.tool._arun(*args, run_manager=run_manager, **kwargs)
+        if memo is not None:
+            memo.put(key, value)
+        return value
+
+
+def memoize_tools(tools, db):
+    return [MemoizedTool(tool, db) if tool.name in MEMOIZED_TOOLS else tool for tool in tools]
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Las caches de los modulos se crean al importarlos: se apartan del directorio del usuario
+os.environ.setdefault("SQL_ASSISTANT_CACHE_DIR", tempfile.mkdtemp(prefix="sql_assistant_tests_"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,208 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import acquisition
+from acquisition import AcquisitionError, DatabaseStore, check_integrity
+from engine import dispose_engine, get_engine
+from remote_db import RangeRequestHandler
+
+
+def make_db(path, rows, text="x"):
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        conn.executemany("INSERT INTO t (v) VALUES (?)", [(text * 200,)] * rows)
+    return path
+
+
+def sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class Handler(RangeRequestHandler):
+    requests = []
+    ignore_if_range = False
+
+    def send_head(self):
+        type(self).requests.append({"range": self.headers.get("Range"), "if_range": self.headers.get("If-Range")})
+        if self.ignore_if_range and "If-Range" in self.headers:
+            del self.headers["If-Range"]
+        return super().send_head()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "www"
+    root.mkdir()
+    Handler.requests = []
+    Handler.ignore_if_range = False
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield root, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatabaseStore(root=tmp_path / "store")
+
+
+def partial_for(store, url):
+    store.partial.mkdir(parents=True, exist_ok=True)
+    return store.partial / (hashlib.sha1(url.encode()).hexdigest() + ".part")
+
+
+def test_fetch_stores_by_content_and_reuses_index(server, store):
+    root, base = server
+    make_db(root / "a.sqlite", 50)
+    digest, path = store.fetch(f"{base}/a.sqlite")
+    assert digest == sha256(root / "a.sqlite") and path == store.path_for(digest)
+    assert store.fetch(f"{base}/a.sqlite") == (digest, path)
+    assert len(Handler.requests) == 1
+
+
+def test_resume_sends_if_range(server, store):
+    root, base = server
+    make_db(root / "a.sqlite", 50)
+    url = f"{base}/a.sqlite"
+    # Primera mitad ya descargada, con el ETag que dio el servidor
+    with urllib.request.urlopen(url) as response:
+        etag = response.headers["ETag"]
+    Handler.requests.clear()
+    part = partial_for(store, url)
+    part.write_bytes((root / "a.sqlite").read_bytes()[:4096])
+    part.with_suffix(".validator").write_text(etag)
+
+    digest, _ = store.fetch(url)
+    assert digest == sha256(root / "a.sqlite")
+    assert Handler.requests == [{"range": "bytes=4096-", "if_range": etag}]
+    assert not part.exists() and not part.with_suffix(".validator").exists()
+
+
+def test_changed_file_discards_stale_partial(server, store):
+    root, base = server
+    make_db(root / "old.sqlite", 50, "a")
+    url = f"{base}/a.sqlite"
+    with urllib.request.urlopen(f"{base}/old.sqlite") as response:
+        old_etag = response.headers["ETag"]
+    part = partial_for(store, url)
+    part.write_bytes((root / "old.sqlite").read_bytes()[:4096])
+    part.with_suffix(".validator").write_text(old_etag)
+    make_db(root / "a.sqlite", 80, "b")
+
+    digest, path = store.fetch(url)
+    assert digest == sha256(root / "a.sqlite")
+    check_integrity(path)
+
+
+def test_server_ignoring_if_range_restarts_download(server, store, monkeypatch):
+    root, base = server
+    monkeypatch.setattr(acquisition.time, "sleep", lambda seconds: None)
+    make_db(root / "old.sqlite", 50, "a")
+    url = f"{base}/a.sqlite"
+    part = partial_for(store, url)
+    part.write_bytes((root / "old.sqlite").read_bytes()[:4096])
+    part.with_suffix(".validator").write_text('"otra-version"')
+    make_db(root / "a.sqlite", 80, "b")
+    Handler.ignore_if_range = True
+
+    digest, _ = store.fetch(url)
+    assert digest == sha256(root / "a.sqlite")
+    assert Handler.requests[-1]["range"] is None
+
+
+def test_partial_without_validator_is_not_resumed(server, store):
+    root, base = server
+    make_db(root / "a.sqlite", 50)
+    url = f"{base}/a.sqlite"
+    partial_for(store, url).write_bytes(b"basura" * 1000)
+    digest, _ = store.fetch(url)
+    assert digest == sha256(root / "a.sqlite")
+    assert Handler.requests == [{"range": None, "if_range": None}]
+
+
+def test_spliced_file_is_rejected(tmp_path, store):
+    old = make_db(tmp_path / "old.sqlite", 50, "a")
+    new = make_db(tmp_path / "new.sqlite", 80, "b")
+    spliced = tmp_path / "spliced.sqlite"
+    spliced.write_bytes(old.read_bytes()[:4096] + new.read_bytes()[4096:])
+    with pytest.raises(AcquisitionError):
+        check_integrity(spliced)
+    with open(spliced, "rb") as f:
+        with pytest.raises(AcquisitionError):
+            store.add_stream(f)
+    assert not any(store.root.glob("*.sqlite"))
+
+
+def test_checksum_and_pin(server, store):
+    root, base = server
+    make_db(root / "a.sqlite", 50, "a")
+    url = f"{base}/a.sqlite"
+    with pytest.raises(AcquisitionError):
+        store.fetch(url, expected_sha256="0" * 64)
+
+    digest, _ = store.fetch(url, pin=True)
+    assert store.pinned(url) == digest
+    # Con el contenido fijado en el almacen no hace falta la red
+    assert store.fetch(url, refresh=True, pin=True)[0] == digest
+
+    # Si el original cambia y la copia local ya no esta, la descarga nueva no coincide con el pin
+    os.remove(root / "a.sqlite")
+    make_db(root / "a.sqlite", 80, "b")
+    os.remove(store.path_for(digest))
+    with pytest.raises(AcquisitionError, match="Checksum"):
+        store.fetch(url, refresh=True, pin=True)
+
+
+def test_evict_keeps_open_databases(tmp_path):
+    store = DatabaseStore(root=tmp_path / "store", max_bytes=1)
+    sources = [make_db(tmp_path / f"{i}.sqlite", 20, str(i)) for i in range(3)]
+    with open(sources[0], "rb") as f:
+        first, first_path = store.add_stream(f)
+    engine = get_engine(str(first_path))
+    try:
+        with engine.connect():
+            pass
+        for source in sources[1:]:
+            with open(source, "rb") as f:
+                last, last_path = store.add_stream(f)
+        # El tope obliga a borrar todo salvo la base recien guardada y la que tiene engine
+        assert sorted(p.stem for p in store.root.glob("*.sqlite")) == sorted({first, last})
+    finally:
+        dispose_engine(str(first_path))
+    store.evict()
+    assert not first_path.exists()
+
+
+
+def test_concurrent_fetches_download_once(server, store):
+    root, base = server
+    make_db(root / "a.sqlite", 200)
+    url = f"{base}/a.sqlite"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: store.fetch(url), range(8)))
+    assert len(set(results)) == 1 and results[0][0] == sha256(root / "a.sqlite")
+    assert len(Handler.requests) == 1
+    assert not any(store.partial.iterdir())
+
+
+def test_store_directories_are_created_on_first_write(tmp_path):
+    store = DatabaseStore(root=tmp_path / "store")
+    assert not store.root.exists()
+    assert store.evict() == set() and store.pinned("http://x") is None
+    with open(make_db(tmp_path / "a.sqlite", 5), "rb") as f:
+        digest, path = store.add_stream(f)
+    assert path == store.path_for(digest) and path.exists()
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+from langchain_core.agents import AgentAction
+
+from answer_cache import AnswerCache
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+
+QUESTION = "¿Cuántos clientes hay?"
+SQL = "SELECT COUNT(*) FROM Customer"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "answers.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, Country TEXT)")
+        conn.executemany("INSERT INTO Customer (Country) VALUES (?)", [("Chile",), ("Brazil",)])
+    yield GuardedSQLDatabase(get_engine(str(path)))
+    dispose_engine(str(path))
+
+
+def run(output, *queries):
+    return {"output": output, "intermediate_steps": [(AgentAction("sql_db_query", sql, ""), obs) for sql, obs in queries]}
+
+
+def test_answer_is_stored_with_final_sql(db):
+    cache = AnswerCache(store_path=None)
+    cache.store_answer(db, QUESTION, run("Hay 2 clientes.", ("SELECT * FROM Clientes", "Error: no such table"),
+                                         (SQL, "[(2,)]")))
+    entry = cache.lookup_answer(db, "cuantos clientes hay")
+    assert entry["output"] == "Hay 2 clientes." and entry["sql"] == SQL
+
+
+@pytest.mark.parametrize("result", [
+    run("Agent stopped due to iteration limit or time limit.", (SQL, "[(2,)]")),
+    run("No encontre la tabla.", ("SELECT * FROM Clientes", "Error: no such table")),
+    run("Hay 2 clientes.", (SQL, "[(2,)]"), ("SELECT COUNT(*) FROM Clientes", "Error: no such table")),
+    run("Hay 2 clientes."),
+    {"output": "Hay 2 clientes.", "error": "timeout"},
+])
+def test_failed_runs_are_not_cached(db, result):
+    cache = AnswerCache(store_path=None)
+    cache.store_answer(db, QUESTION, result)
+    assert cache.lookup_answer(db, QUESTION) is None
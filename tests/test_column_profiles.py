@@ -0,0 +1,65 @@
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+import column_profiles
+from column_profiles import ColumnProfiler, profile_table
+from db_version import database_path
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+
+
+def test_sampled_profile_runs_in_worker_processes(tmp_path):
+    path = tmp_path / "profiles.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Genre TEXT, Milliseconds INTEGER)")
+        conn.executemany("INSERT INTO Track (Genre, Milliseconds) VALUES (?, ?)",
+                         [(("Rock", "Jazz", None)[i % 3], i) for i in range(5000)])
+
+    full = profile_table(str(path), "Track", 5000)
+    assert not full["Genre"]["sampled"]
+    assert full["Genre"]["distinct"] == 2 and full["Genre"]["null_fraction"] == 0.3332
+    assert (full["Milliseconds"]["min"], full["Milliseconds"]["max"]) == (0, 4999)
+
+    sampled = profile_table(str(path), "Track", 5000, sample_rows=640, workers=2)
+    assert sampled["Genre"]["sampled"] and sampled["Genre"]["distinct"] == 2
+    assert {value for value, _ in sampled["Genre"]["top"]} == {"Rock", "Jazz"}
+    # Los workers no se crean con fork: el proceso tiene hilos
+    assert column_profiles._process_pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_worker_module_does_not_import_langchain():
+    src = Path(column_profiles.__file__).parent
+    code = "import sys, profile_scan; print(sorted(m for m in sys.modules if m.startswith(('langchain', 'sqlalchemy'))))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=src, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+@pytest.mark.parametrize("error", [BrokenProcessPool("worker muerto"), OSError("sin descriptores")])
+def test_failed_tables_are_recorded_and_not_retried(tmp_path, monkeypatch, error):
+    path = tmp_path / "broken.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT)")
+    calls = []
+
+    def profile_table(*args, **kwargs):
+        calls.append(args)
+        raise error
+
+    monkeypatch.setattr(column_profiles, "profile_table", profile_table)
+    profiler = ColumnProfiler(profile_dir=tmp_path / "profiles")
+    db = GuardedSQLDatabase(get_engine(str(path)))
+    try:
+        assert profiler.profiles(db, wait=True) == {}
+        entry = profiler._entry(database_path(db))
+        assert entry["fingerprint"] is not None
+        assert entry["errors"]["Genre"].startswith(type(error).__name__)
+        # Con la huella registrada no se vuelve a perfilar en cada llamada
+        profiler.profiles(db, wait=True)
+        assert len(calls) == 1
+    finally:
+        dispose_engine(str(path))
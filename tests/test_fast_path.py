@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+from langchain_core.agents import AgentAction
+
+import fast_path
+from engine import dispose_engine, get_engine
+from db_version import database_path
+from fast_path import answer_from_template, learn_template
+from guarded_query import GuardedSQLDatabase
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / "fast.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, FirstName TEXT, Country TEXT)")
+        conn.executemany("INSERT INTO Customer (FirstName, Country) VALUES (?, ?)",
+                         [("Ana", "Chile"), ("Luis", "Brazil"), ("Rosa", "Brazil")])
+    monkeypatch.setattr(fast_path, "template_store", fast_path.TemplateStore(root=tmp_path / "templates"))
+    yield GuardedSQLDatabase(get_engine(str(path)))
+    dispose_engine(str(path))
+
+
+def agent_result(output):
+    action = AgentAction("sql_db_query", "SELECT COUNT(*) FROM Customer WHERE Country = 'Chile'", "")
+    return {"output": output, "intermediate_steps": [(action, "[(1,)]")]}
+
+
+def test_template_needs_support_before_use(db):
+    result = agent_result("Hay 1 clientes en Chile.")
+    learn_template(db, "¿Cuantos clientes hay en Chile?", result)
+    assert answer_from_template(db, "¿Cuantos clientes hay en Brazil?") is None
+    learn_template(db, "¿Cuantos clientes hay en Chile?", result)
+    answer = answer_from_template(db, "¿Cuantos clientes hay en Brazil?")
+    assert answer["output"] == "Hay 2 clientes en Brazil."
+    assert answer["params"] == ["Brazil"]
+
+
+def test_render_replaces_only_recorded_slots(db):
+    # Un reemplazo global tocaria "Chilean" y el "1" de "2021"
+    result = agent_result("En Chile hay 1 cliente (datos 2021, Chilean customers).")
+    for _ in range(fast_path.MIN_SUPPORT):
+        learn_template(db, "¿Cuantos clientes hay en Chile?", result)
+    answer = answer_from_template(db, "¿Cuantos clientes hay en Brazil?")
+    assert answer["output"] == "En Brazil hay 2 cliente (datos 2021, Chilean customers)."
+
+
+def test_ambiguous_output_returns_only_the_value(db):
+    result = agent_result("Chile: 1 cliente. Resultado para Chile.")
+    for _ in range(fast_path.MIN_SUPPORT):
+        learn_template(db, "¿Cuantos clientes hay en Chile?", result)
+    assert answer_from_template(db, "¿Cuantos clientes hay en Brazil?")["output"] == "2"
+
+
+def test_non_ascii_digits_fall_back_to_the_agent(db):
+    action = AgentAction("sql_db_query", "SELECT FirstName FROM Customer ORDER BY CustomerId LIMIT 2", "")
+    result = {"output": "Ana y Luis", "intermediate_steps": [(action, "[('Ana',), ('Luis',)]")]}
+    for _ in range(fast_path.MIN_SUPPORT):
+        learn_template(db, "Dame los primeros 2 clientes", result)
+    assert answer_from_template(db, "Dame los primeros 1 clientes")["output"] == "Ana"
+    assert answer_from_template(db, "Dame los primeros ² clientes") is None
+    assert answer_from_template(db, "Dame los primeros ٣ clientes") is None
+
+
+def test_hits_are_persisted(db, tmp_path):
+    result = agent_result("Hay 1 clientes en Chile.")
+    for _ in range(fast_path.MIN_SUPPORT):
+        learn_template(db, "¿Cuantos clientes hay en Chile?", result)
+    answer_from_template(db, "¿Cuantos clientes hay en Brazil?")
+    answer_from_template(db, "¿Cuantos clientes hay en Chile?")
+
+    reloaded = fast_path.TemplateStore(root=tmp_path / "templates")
+    templates = reloaded.load(database_path(db))["templates"]
+    assert [t["hits"] for t in templates] == [2]
@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+from guarded_query import QueryTimeout, fetch_limited
+
+ENDLESS = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT x FROM c"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "t.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (v TEXT)")
+        conn.executemany("INSERT INTO t VALUES (?)", [("x" * 100,)] * 5)
+    return create_engine(f"sqlite:///{path}")
+
+
+def test_row_and_byte_limits(engine):
+    assert fetch_limited(engine, "SELECT v FROM t", max_rows=3) == (["v"], [("x" * 100,)] * 3, True)
+    columns, rows, truncated = fetch_limited(engine, "SELECT v FROM t", max_bytes=250)
+    assert len(rows) == 2 and truncated
+
+
+def test_first_row_is_kept_even_if_too_large(engine):
+    columns, rows, truncated = fetch_limited(engine, "SELECT v FROM t", max_bytes=10)
+    assert len(rows) == 1 and truncated
+
+
+def test_interrupt_while_fetching_is_a_timeout(engine):
+    # execute devuelve enseguida la primera fila; el tope vence leyendo las siguientes
+    with pytest.raises(QueryTimeout):
+        fetch_limited(engine, ENDLESS, max_rows=10**9, max_bytes=10**12, time_budget=0.2)
+
+
+def test_other_errors_are_not_timeouts(engine):
+    with pytest.raises(sqlite3.OperationalError) as info:
+        fetch_limited(engine, "SELECT * FROM no_existe")
+    assert not isinstance(info.value, QueryTimeout)
@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.agents import AgentAction
+
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+from instrumentation import trace_question
+from model_router import AGGREGATION_TERMS, COMPLEX_TERMS, ModelRouter, matching_terms, route_question
+from streaming import AgentCancelled
+
+SCHEMA = """
+CREATE TABLE Artist (ArtistId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Album (AlbumId INTEGER PRIMARY KEY, Title TEXT, ArtistId INTEGER REFERENCES Artist(ArtistId));
+CREATE TABLE MediaType (MediaTypeId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name TEXT, AlbumId INTEGER REFERENCES Album(AlbumId),
+                    MediaTypeId INTEGER REFERENCES MediaType(MediaTypeId), Milliseconds INTEGER);
+CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, FirstName TEXT, Country TEXT);
+CREATE TABLE Invoice (InvoiceId INTEGER PRIMARY KEY, CustomerId INTEGER REFERENCES Customer(CustomerId),
+                      Total REAL, InvoiceDate TEXT);
+INSERT INTO Customer VALUES (1, 'Ana', 'Brazil'), (2, 'Luis', 'Chile');
+"""
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("router") / "router.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+    yield GuardedSQLDatabase(get_engine(str(path)))
+    dispose_engine(str(path))
+
+
+def test_terms_match_whole_words():
+    words = ["country", "mediatype", "cuantos", "promedios", "por", "personas", "count"]
+    assert matching_terms(words, AGGREGATION_TERMS) == ["count", "cuantos", "promedios"]
+    assert matching_terms(words, COMPLEX_TERMS) == []
+
+
+@pytest.mark.parametrize("question", [
+    "List customers by country",
+    "clientes por country",
+    "Average Milliseconds of Track",
+])
+def test_simple_questions_go_fast(db, question):
+    decision = route_question(db, question, mode="auto")
+    assert decision["tier"] == "fast"
+    assert decision["complex_terms"] == []
+
+
+def test_column_names_are_not_terms(db):
+    decision = route_question(db, "Show the MediaType names", mode="auto")
+    assert decision["aggregations"] == []
+
+
+def test_multi_step_questions_go_strong(db):
+    decision = route_question(db, "Compara el total de invoice por customer cada año respecto al anterior", mode="auto")
+    assert decision["tier"] == "strong"
+    assert decision["reason"] == "pregunta compleja"
+    assert decision["complex_terms"] == ["cada", "compara", "respecto"]
+
+
+def test_forced_mode(db):
+    assert route_question(db, "Compara todo", mode="fast")["tier"] == "fast"
+    assert route_question(db, "List customers by country", mode="strong")["tier"] == "strong"
+
+
+class FakeAgent:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.verbose = False
+
+    def invoke(self, inputs, config=None, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        return self.invoke(inputs, config, **kwargs)
+
+
+def answered(output="2 clientes", observation="[(2,)]"):
+    action = AgentAction("sql_db_query", "SELECT COUNT(*) FROM Customer", "")
+    return {"output": output, "intermediate_steps": [(action, observation)]}
+
+
+QUESTION = {"input": "List customers by country"}
+
+
+def run(router, inputs=QUESTION):
+    with trace_question(inputs["input"]) as trace:
+        result = router.invoke(inputs)
+    return result, trace.route
+
+
+def test_fast_answer_is_kept(db):
+    fast, strong = FakeAgent(answered()), FakeAgent(answered("fuerte"))
+    result, route = run(ModelRouter(fast, strong, db, mode="auto"))
+    assert result["output"] == "2 clientes"
+    assert (fast.calls, strong.calls) == (1, 0)
+    assert route["tier"] == "fast" and "escalated_from" not in route
+
+
+@pytest.mark.parametrize("fast, failure", [
+    (FakeAgent({"output": "2", "intermediate_steps": []}), "respondio sin consultar la base"),
+    (FakeAgent(answered(observation="Error: no such table")), "todas las consultas fallaron"),
+    (FakeAgent(answered(output="Agent stopped due to iteration limit")), "limite de iteraciones o tiempo"),
+    (FakeAgent(error=ValueError("parse")), "error: parse"),
+])
+def test_unreliable_fast_answers_escalate(db, fast, failure):
+    strong = FakeAgent(answered("fuerte"))
+    result, route = run(ModelRouter(fast, strong, db, mode="auto"))
+    assert result["output"] == "fuerte"
+    assert strong.calls == 1
+    assert route["tier"] == "strong" and route["escalated_from"] == "fast" and route["failure"] == failure
+
+
+@pytest.mark.parametrize("error", [RuntimeError("Rate limit reached"), AgentCancelled()])
+def test_rate_limits_and_cancels_are_not_escalated(db, error):
+    strong = FakeAgent(answered("fuerte"))
+    with pytest.raises(type(error)):
+        ModelRouter(FakeAgent(error=error), strong, db, mode="auto").invoke(QUESTION)
+    assert strong.calls == 0
+
+
+def test_async_escalation(db):
+    fast, strong = FakeAgent({"output": "", "intermediate_steps": []}), FakeAgent(answered("fuerte"))
+    result = asyncio.run(ModelRouter(fast, strong, db, mode="auto").ainvoke(QUESTION))
+    assert result["output"] == "fuerte" and fast.calls == strong.calls == 1
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+
+from prompt_store import PromptStore
+
+NAME = "langchain-ai/react-agent-template"
+
+
+class StubHub:
+    def __init__(self, prompts=None, error=None):
+        self.prompts = prompts or {}
+        self.error = error
+        self.pulls = []
+
+    def pull(self, name):
+        self.pulls.append(name)
+        if self.error is not None:
+            raise self.error
+        return self.prompts[name]
+
+
+@pytest.fixture
+def bundled(tmp_path):
+    path = tmp_path / "templates.json"
+    path.write_text(json.dumps({
+        NAME: {"version": 1, "kind": "prompt", "template": "empaquetada {input}"},
+        "chat": {"version": 1, "kind": "chat", "template": "sistema {dialect}"},
+    }))
+    return path
+
+
+def test_offline_never_calls_hub(bundled, tmp_path):
+    hub = StubHub()
+    store = PromptStore(bundled, tmp_path / "cache.json", mode="offline", hub_client=hub)
+    assert store.text(NAME) == "empaquetada {input}"
+    assert store.version(NAME) == 1
+    assert hub.pulls == []
+    with pytest.raises(KeyError):
+        store.text("no-existe")
+
+
+def test_refresh_updates_and_persists(bundled, tmp_path):
+    cache = tmp_path / "cache.json"
+    hub = StubHub({
+        NAME: PromptTemplate.from_template("del hub {input}"),
+        "chat": ChatPromptTemplate.from_messages([("system", "sistema {dialect}")]),
+    })
+    store = PromptStore(bundled, cache, mode="refresh", hub_client=hub)
+    assert sorted(hub.pulls) == ["chat", NAME]
+    assert store.text(NAME) == "del hub {input}"
+    assert store.version(NAME) == 2
+    # Sin cambios en el hub la version no sube
+    assert store.text("chat") == "sistema {dialect}" and store.version("chat") == 1
+
+    # Otro proceso offline lee la version guardada sin tocar el hub
+    offline = PromptStore(bundled, cache, mode="offline", hub_client=StubHub())
+    assert offline.text(NAME) == "del hub {input}"
+
+
+def test_hub_error_falls_back_to_bundled(bundled, tmp_path):
+    cache = tmp_path / "cache.json"
+    hub = StubHub(error=ConnectionError("sin red"))
+    store = PromptStore(bundled, cache, mode="refresh", hub_client=hub)
+    assert hub.pulls
+    assert store.text(NAME) == "empaquetada {input}"
+    assert store.version(NAME) == 1
+    assert not cache.exists()
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+import query_plan
+import table_stats
+from db_version import database_path
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+from query_plan import analyze_plan, check_query
+
+SCAN = [(2, 0, "SCAN Track")]
+FILTERED = "SELECT * FROM Track WHERE Name = 'x'"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / "plans.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name TEXT)")
+        conn.executemany("INSERT INTO Track (Name) VALUES (?)", [(str(i),) for i in range(50)])
+    monkeypatch.setattr(query_plan, "SCAN_WARN_ROWS", 10)
+    yield GuardedSQLDatabase(get_engine(str(path)))
+    dispose_engine(str(path))
+
+
+@pytest.mark.parametrize("rows, warned", [(5, False), (50, True), (None, True), ("Error", True)])
+def test_scan_warning_by_row_count(rows, warned, monkeypatch):
+    monkeypatch.setattr(query_plan, "SCAN_WARN_ROWS", 10)
+    findings = analyze_plan(SCAN, {"Track": rows}, FILTERED)
+    assert [f["kind"] for f in findings] == (["scan"] if warned else [])
+    if warned:
+        assert findings[0]["rows"] == (rows if isinstance(rows, int) else None)
+
+
+def test_failed_exact_count_falls_back_to_estimate(db):
+    stats = table_stats.TableStats(database_path(db), ["Track"])
+    stats.cancel()
+    stats.exact["Track"] = "Error"
+    assert stats.counts() == {"Track": 50}
+
+
+def test_plan_check_uses_estimates_only(db, monkeypatch):
+    def exact_row_count(db_path, table):
+        raise AssertionError("COUNT(*) exacto al revisar un plan")
+
+    monkeypatch.setattr(table_stats, "exact_row_count", exact_row_count)
+    assert "Recorrido completo de Track (~50 filas)" in check_query(db, FILTERED)[1]
+    assert "Recorrido completo de Track" in db.run(FILTERED)
@@ -0,0 +1,84 @@
+import functools
+import os
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from acquisition import AcquisitionError
+from remote_db import RangeRequestHandler, close_remote, get_reader, open_remote, sqlite_uri
+
+ROWS = 20000
+
+
+class QuietHandler(RangeRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def served_db(tmp_path):
+    path = tmp_path / "remote.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, grupo INTEGER, v TEXT)")
+        conn.executemany("INSERT INTO t (grupo, v) VALUES (?, ?)", [(i % 7, f"valor {i} " * 10) for i in range(ROWS)])
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(tmp_path)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/remote.sqlite"
+    try:
+        remote = open_remote(url)
+    except AcquisitionError as e:
+        httpd.shutdown()
+        pytest.skip(str(e))
+    yield path, remote
+    close_remote(remote)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def connect(remote):
+    return sqlite3.connect(sqlite_uri(remote), uri=True, check_same_thread=False)
+
+
+def test_queries_match_local_file(served_db):
+    path, remote = served_db
+    conn = connect(remote)
+    with sqlite3.connect(path) as local:
+        for sql in ("SELECT COUNT(*) FROM t", "SELECT grupo, COUNT(*) FROM t GROUP BY grupo",
+                    "SELECT v FROM t WHERE id = 12345"):
+            assert conn.execute(sql).fetchall() == local.execute(sql).fetchall()
+    conn.close()
+
+
+def test_point_lookup_fetches_few_blocks(served_db):
+    path, remote = served_db
+    reader = get_reader(remote)
+    conn = connect(remote)
+    conn.execute("SELECT name FROM sqlite_master").fetchall()
+    before = reader.stats()
+    assert conn.execute("SELECT v FROM t WHERE id = 777").fetchone()[0].startswith("valor 776 ")
+    after = reader.stats()
+    # Raiz, interior y hoja del arbol de la tabla: unas pocas peticiones, no el archivo
+    assert after["requests"] - before["requests"] <= 4
+    assert after["bytes_fetched"] < os.path.getsize(path) / 4
+
+    # Un recorrido completo usa lectura anticipada: muchas menos peticiones que bloques
+    conn.execute("SELECT SUM(LENGTH(v)) FROM t").fetchone()
+    blocks = -(-os.path.getsize(path) // reader.block_size)
+    assert reader.stats()["requests"] < blocks
+    conn.close()
+
+
+def test_changed_object_is_an_error(served_db):
+    path, remote = served_db
+    conn = connect(remote)
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == ROWS
+    with sqlite3.connect(path) as local:
+        local.execute("INSERT INTO t (grupo, v) VALUES (0, 'nuevo')")
+    conn.close()
+    # Sin bloques en cache (ni en el lector ni en una conexion nueva) la lectura va al
+    # servidor, que ya responde con otro ETag
+    get_reader(remote).close()
+    with pytest.raises(sqlite3.DatabaseError):
+        connect(remote).execute("SELECT MAX(id) FROM t").fetchone()
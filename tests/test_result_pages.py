@@ -0,0 +1,109 @@
+import csv
+import io
+import sqlite3
+
+import pytest
+
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+from result_pages import (
+    ResultUnavailable, count_rows, export_csv, fetch_page, is_stale, result_reference,
+)
+
+ROWS = [(i, f"nombre, \"{i}\"", None if i % 4 else 1.5) for i in range(1, 24)]
+
+
+def open_db(path):
+    return GuardedSQLDatabase(get_engine(str(path)))
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "pages.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name TEXT, Price REAL)")
+        conn.executemany("INSERT INTO Track VALUES (?, ?, ?)", ROWS)
+    yield open_db(path)
+    dispose_engine(str(path))
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM Track",
+    "-- SELECT\nUPDATE Track SET Name = 'x'",
+    "/* SELECT */ DROP TABLE Track",
+    "PRAGMA journal_mode = WAL",
+    "",
+    None,
+])
+def test_only_read_only_queries_get_a_reference(db, sql):
+    assert result_reference(db, sql) is None
+
+
+def test_pages_cover_the_result_exactly_once(db):
+    reference = result_reference(db, "SELECT * FROM Track ORDER BY TrackId -- ultimo comentario\n;")
+    assert reference["sql"].endswith("-- ultimo comentario")
+    pages = [fetch_page(db, reference, page, page_size=10) for page in range(3)]
+    assert [len(p["rows"]) for p in pages] == [10, 10, 3]
+    assert [p["more"] for p in pages] == [True, True, False]
+    assert [p["offset"] for p in pages] == [0, 10, 20]
+    assert [row for p in pages for row in p["rows"]] == ROWS
+    assert pages[0]["columns"] == ["TrackId", "Name", "Price"]
+
+    # Pagina exacta: la fila de mas no aparece y no hay pagina siguiente
+    exact = fetch_page(db, reference, 1, page_size=23)
+    assert exact == {"columns": ["TrackId", "Name", "Price"], "rows": [], "offset": 23, "more": False}
+    assert fetch_page(db, reference, -1, page_size=10)["offset"] == 0
+    assert count_rows(db, reference) == 23
+
+
+def test_bound_parameters_are_kept(db):
+    reference = result_reference(db, "SELECT TrackId FROM Track WHERE TrackId > ?", [20])
+    assert fetch_page(db, reference)["rows"] == [(21,), (22,), (23,)]
+    assert count_rows(db, reference) == 3
+
+
+def test_csv_export_round_trip(db):
+    reference = result_reference(db, "SELECT TrackId, Name, Price, TrackId FROM Track")
+    data, truncated = export_csv(db, reference)
+    assert not truncated
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+    # SQLite ya renombra las columnas repetidas de la subconsulta
+    assert rows[0] == ["TrackId", "Name", "Price", "TrackId:1"]
+    assert rows[1:] == [[str(i), name, "" if price is None else str(price), str(i)] for i, name, price in ROWS]
+
+    data, truncated = export_csv(db, reference, max_rows=5)
+    assert truncated and len(data.decode().splitlines()) == 6
+
+
+def test_reference_belongs_to_its_database(db, tmp_path):
+    reference = result_reference(db, "SELECT * FROM Track")
+    other_path = tmp_path / "otra.sqlite"
+    sqlite3.connect(other_path).close()
+    other = open_db(other_path)
+    try:
+        with pytest.raises(ResultUnavailable):
+            fetch_page(other, reference)
+        assert count_rows(other, reference) is None
+    finally:
+        dispose_engine(str(other_path))
+
+
+def test_symlinked_path_resolves_to_the_same_reference(db, tmp_path):
+    reference = result_reference(db, "SELECT * FROM Track")
+    link = tmp_path / "enlace.sqlite"
+    link.symlink_to(tmp_path / "pages.sqlite")
+    linked = open_db(link)
+    try:
+        assert result_reference(linked, "SELECT * FROM Track")["path"] == reference["path"]
+        assert len(fetch_page(linked, reference)["rows"]) == 23
+    finally:
+        dispose_engine(str(link))
+
+
+def test_changed_data_marks_reference_stale(db, tmp_path):
+    reference = result_reference(db, "SELECT * FROM Track")
+    assert not is_stale(reference)
+    with sqlite3.connect(tmp_path / "pages.sqlite") as conn:
+        conn.execute("DELETE FROM Track WHERE TrackId > 20")
+    assert is_stale(reference)
+    assert count_rows(db, reference) == 20
@@ -0,0 +1,181 @@
+import asyncio
+import csv
+import io
+import json
+import random
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+import benchmark
+import service as service_module
+from service import ServiceApp, build_service
+
+TOP_ARTISTS = "¿Cuáles son los 5 artistas con más álbumes?"
+
+
+@pytest.fixture(scope="module")
+def chinook(tmp_path_factory):
+    path = tmp_path_factory.mktemp("service") / "chinook.sqlite"
+    schema, fill = benchmark.FIXTURES["chinook"]
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    fill(conn, random.Random(1), 200)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def question():
+    # Fuera del guion (lista las tablas) y distinta en cada prueba: no la responden las caches
+    return f"pregunta {uuid.uuid4().hex}"
+
+
+async def call(app, method, path, payload=None):
+    """Una peticion ASGI en proceso; receive no devuelve el disconnect mientras se espera la respuesta"""
+    target, _, query = path.partition("?")
+    scope = {"type": "http", "method": method, "path": target, "query_string": query.encode(), "headers": []}
+    body = json.dumps(payload).encode() if payload is not None else b""
+    delivered = False
+    messages = []
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    headers = dict(messages[0]["headers"])
+    content = messages[1]["body"]
+    if headers[b"content-type"].startswith(b"application/json"):
+        content = json.loads(content)
+    return messages[0]["status"], headers, content
+
+
+async def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_full_queue_answers_429(chinook):
+    async def scenario():
+        app = ServiceApp(build_service([("chinook", chinook)], stub_llm=True, stub_latency=0.2,
+                                       workers=1, max_queue=1))
+        accepted = [await call(app, "POST", "/questions", {"database": "chinook", "question": question(), "wait": False})
+                    for _ in range(2)]
+        status, headers, content = await call(
+            app, "POST", "/questions", {"database": "chinook", "question": question(), "wait": False}
+        )
+        assert [s for s, _, _ in accepted] == [202, 202]
+        assert status == 429 and headers[b"retry-after"] == b"5" and "Cola llena" in content["error"]
+
+        jobs = [app.service.job(c["id"]) for _, _, c in accepted]
+        await asyncio.wait({job.task for job in jobs}, timeout=10)
+        assert [job.status for job in jobs] == ["done", "done"]
+        assert app.service.pool.stats()["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_running_question_is_not_retried(chinook):
+    async def scenario():
+        app = ServiceApp(build_service([("chinook", chinook)], stub_llm=True, stub_latency=0.3))
+        _, _, job = await call(app, "POST", "/questions", {"database": "chinook", "question": question(), "wait": False})
+        await wait_for(lambda: app.service.job(job["id"]).status == "running")
+
+        start = time.perf_counter()
+        status, _, content = await call(app, "DELETE", f"/questions/{job['id']}")
+        # Un reintento con backoff tardaria al menos un segundo mas
+        assert time.perf_counter() - start < 1.0
+        assert status == 200 and content["status"] == "cancelled"
+
+    asyncio.run(scenario())
+
+
+def test_cancel_queued_question_frees_its_slot(chinook):
+    async def scenario():
+        app = ServiceApp(build_service([("chinook", chinook)], stub_llm=True, stub_latency=0.2,
+                                       workers=1, max_queue=1))
+        ids = []
+        for _ in range(2):
+            _, _, job = await call(app, "POST", "/questions", {"database": "chinook", "question": question(), "wait": False})
+            ids.append(job["id"])
+        await wait_for(lambda: app.service.job(ids[0]).status == "running")
+
+        status, _, content = await call(app, "DELETE", f"/questions/{ids[1]}")
+        assert status == 200 and content["status"] == "cancelled" and "seconds" not in content
+        assert app.service.pool.stats()["waiting"] == 0
+        status, _, content = await call(app, "GET", f"/questions/{ids[0]}?wait=5")
+        assert content["status"] == "done"
+
+    asyncio.run(scenario())
+
+
+def test_sessions_limit_and_expire(chinook, monkeypatch):
+    async def scenario():
+        app = ServiceApp(build_service([("chinook", chinook)], stub_llm=True, stub_latency=0.2, max_per_session=1))
+        assert (await call(app, "POST", "/sessions", {"database": "otra"}))[0] == 404
+        status, _, content = await call(app, "POST", "/sessions", {"database": "chinook"})
+        assert status == 201
+        session = content["session"]
+
+        ask = {"database": "chinook", "question": question(), "session": session, "wait": False}
+        status, _, job = await call(app, "POST", "/questions", ask)
+        assert status == 202 and job["session"] == session
+        status, headers, content = await call(app, "POST", "/questions", {**ask, "question": question()})
+        assert status == 429 and headers[b"retry-after"] == b"1"
+
+        status, _, content = await call(app, "GET", f"/questions/{job['id']}?wait=5")
+        assert content["status"] == "done"
+        assert (await call(app, "POST", "/questions", {**ask, "question": question(), "wait": True}))[0] == 200
+
+        # Una sesion sin preguntas en curso expira al abrir otra
+        monkeypatch.setattr(service_module, "SESSION_TTL", 0)
+        other = (await call(app, "POST", "/sessions", {"database": "chinook"}))[2]["session"]
+        assert session not in app.service.sessions
+        assert (await call(app, "POST", "/questions", ask))[0] == 404
+        assert (await call(app, "DELETE", f"/sessions/{other}"))[0] == 200
+        assert (await call(app, "DELETE", f"/sessions/{other}"))[0] == 404
+
+    asyncio.run(scenario())
+
+
+def test_rows_are_paged_and_exported(chinook):
+    async def scenario():
+        app = ServiceApp(build_service([("chinook", chinook)], stub_llm=True))
+        status, _, job = await call(app, "POST", "/questions", {"database": "chinook", "question": TOP_ARTISTS})
+        assert status == 200 and job["rows_url"] == f"/questions/{job['id']}/rows"
+        assert "rows" not in job
+
+        status, _, first = await call(app, "GET", f"{job['rows_url']}?page=0&size=2")
+        assert status == 200
+        assert first["columns"] == ["Name", "n"] and len(first["rows"]) == 2 and first["more"]
+        total = first["total"]
+        _, _, last = await call(app, "GET", f"{job['rows_url']}?page={(total - 1) // 2}&size=2")
+        assert not last["more"] and last["offset"] + len(last["rows"]) == total
+
+        status, headers, content = await call(app, "GET", f"{job['rows_url']}?format=csv")
+        assert status == 200 and headers[b"content-type"].startswith(b"text/csv")
+        assert headers[b"x-truncated"] == b"false"
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        assert rows[0] == ["Name", "n"] and len(rows) == total + 1
+        assert rows[1] == [str(v) for v in first["rows"][0]]
+
+        assert (await call(app, "GET", f"{job['rows_url']}?format=xml"))[0] == 400
+        assert (await call(app, "GET", f"{job['rows_url']}?page=x"))[0] == 400
+
+        # Sin sql_db_query no hay resultado tabular
+        _, _, listed = await call(app, "POST", "/questions", {"database": "chinook", "question": question()})
+        assert listed["status"] == "done" and "rows_url" not in listed
+        assert (await call(app, "GET", f"/questions/{listed['id']}/rows"))[0] == 404
+
+    asyncio.run(scenario())
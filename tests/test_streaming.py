@@ -0,0 +1,61 @@
+from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+from langchain_core.tools import tool
+
+from streaming import AgentCancelled, stream_agent
+
+PROMPT = PromptTemplate.from_template(
+    "Tools: {tools}\nNames: {tool_names}\nQuestion: {input}\n{agent_scratchpad}"
+)
+ACTION = "Thought: consulto\nAction: sql_db_query\nAction Input: SELECT 1"
+FINAL = "Thought: listo\nFinal Answer: uno"
+
+
+def build_agent(responses, calls, sleep=None):
+    @tool
+    def sql_db_query(query: str) -> str:
+        """Ejecuta SQL"""
+        calls.append(query)
+        return "[(1,)]"
+
+    llm = FakeListChatModel(responses=responses, sleep=sleep)
+    agent = create_react_agent(llm, [sql_db_query], PROMPT)
+    return AgentExecutor(agent=agent, tools=[sql_db_query], return_intermediate_steps=True)
+
+
+def test_events_arrive_in_order():
+    calls = []
+    stream = stream_agent(build_agent([ACTION, FINAL], calls), {"input": "cuantos"})
+    events = list(stream.events())
+    kinds = [kind for kind, _ in events]
+
+    first_action = kinds.index("action")
+    assert set(kinds[:first_action]) == {"token"}
+    assert "".join(v for k, v in events[:first_action]) == ACTION
+    assert kinds[first_action + 1] == "observation"
+    assert events[first_action + 1][1] == "[(1,)]"
+    assert kinds[-1] == "final" and events[-1][1] == "uno"
+    assert "".join(v for k, v in events[first_action + 2:-1]) == FINAL
+    assert stream.output == "uno"
+    assert calls == ["SELECT 1"]
+
+
+def test_text_renders_steps():
+    stream = stream_agent(build_agent([ACTION, FINAL], []), {"input": "cuantos"})
+    text = "".join(stream.text())
+    assert "**sql_db_query**" in text and "SELECT 1" in text and "[(1,)]" in text
+
+
+def test_cancel_stops_the_loop():
+    calls = []
+    # Cada token tarda: hay tiempo de cortar el stream antes de que termine el primer paso
+    stream = stream_agent(build_agent([ACTION, ACTION, FINAL], calls, sleep=0.01), {"input": "cuantos"})
+    events = stream.events()
+    assert next(events)[0] == "token"
+    events.close()
+
+    stream._thread.join(timeout=10)
+    assert not stream._thread.is_alive()
+    assert isinstance(stream.error, AgentCancelled)
+    assert calls == []
@@ -0,0 +1,32 @@
+import sqlite3
+
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool
+
+from engine import dispose_engine, get_engine
+from guarded_query import GuardedSQLDatabase
+from tool_cache import MemoizedTool, ToolMemo, tool_session
+
+
+def test_schema_memo_follows_data_changes(tmp_path):
+    path = tmp_path / "memo.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (v TEXT)")
+        conn.execute("INSERT INTO t VALUES ('antes')")
+    db = GuardedSQLDatabase(get_engine(str(path)), sample_rows_in_table_info=3)
+    tool = MemoizedTool(InfoSQLDatabaseTool(db=db), db)
+    memo = ToolMemo()
+    try:
+        with tool_session(memo):
+            first = tool.invoke("t")
+            assert "antes" in first
+            assert tool.invoke("t") == first
+            key = memo.key(db, "sql_db_schema", "t")
+
+            with sqlite3.connect(path) as conn:
+                conn.execute("DELETE FROM t")
+                conn.execute("INSERT INTO t VALUES ('despues')")
+            # Las filas de ejemplo cambiaron: la clave y el resultado tambien
+            assert memo.key(db, "sql_db_schema", "t") != key
+            assert "despues" in tool.invoke("t")
+    finally:
+        dispose_engine(str(path))